@@ -0,0 +1,126 @@
+/**
+ * UProcTrace: User-space Process Tracing
+ * Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+ * Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+ */
+
+#include "environ.h"
+#include "cleaner.h"
+#include "stringlist.h"
+
+#include <uproctrace.pb-c.h>
+
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/stat.h>
+#include <sys/types.h>
+#include <unistd.h>
+
+/**
+ * @brief check if variable is in allow list
+ * @param[in] var variable assignment (NAME=value)
+ * @param[in] allow colon-separated list of names (or prefixes ending in '*')
+ * @return 1 if allowed, 0 if not
+ */
+static int uptev_environ_allowed(char const *var, char const *allow) {
+  size_t name_len = strcspn(var, "=");
+  while (*allow) {
+    size_t len = strcspn(allow, ":");
+    if (len > 0 && allow[len - 1] == '*') {
+      if (len - 1 <= name_len && strncmp(var, allow, len - 1) == 0) {
+        return 1;
+      }
+    } else if (len == name_len && strncmp(var, allow, len) == 0) {
+      return 1;
+    }
+    allow += len;
+    if (*allow == ':') {
+      ++allow;
+    }
+  }
+  return 0;
+}
+
+/**
+ * @brief compute hash of environment
+ *        (64 bit FNV-1a of all strings including their terminating zeros)
+ * @param[in] n number of strings
+ * @param[in] strs strings
+ * @return hash value
+ */
+static uint64_t uptev_environ_hash(size_t n, char **strs) {
+  uint64_t hash = 0xcbf29ce484222325ULL;
+  for (size_t i = 0; i < n; ++i) {
+    unsigned char const *ptr = (unsigned char const *)strs[i];
+    do {
+      hash ^= *ptr;
+      hash *= 0x100000001b3ULL;
+    } while (*ptr++);
+  }
+  return hash;
+}
+
+/**
+ * @brief check if environment has already been stored in the trace,
+ *        mark it as stored otherwise
+ * @param[in] hash hash of environment
+ * @return 1 if already stored, 0 if not (or unknown)
+ */
+static int uptev_environ_stored(uint64_t hash) {
+  char const *dirname = getenv("UPTPL_ENVIRON_DIR");
+  if (!dirname) {
+    return 0;
+  }
+  char filename[PATH_MAX];
+  int len = snprintf(filename, sizeof(filename), "%s/%016llx", dirname,
+                     (unsigned long long)hash);
+  if (len < 0 || (size_t)len >= sizeof(filename)) {
+    return 0;
+  }
+  /* creating the marker succeeds for exactly one process */
+  int fd = open(filename, O_WRONLY | O_CREAT | O_EXCL | O_CLOEXEC, 0666);
+  if (fd == -1) {
+    return errno == EEXIST;
+  }
+  close(fd);
+  return 0;
+}
+
+int uptev_environ_read(Uproctrace__ProcBegin *proc_begin,
+                       Uproctrace__Stringlist *env, uptev_cleaner_t *cleaner) {
+  char const *policy = getenv("UPTPL_ENVIRON");
+  if (!policy) {
+    policy = "full";
+  }
+  if (strcmp(policy, "none") == 0) {
+    return 0;
+  }
+  if (uptev_stringlist_read("/proc/self/environ", &env->n_s, &env->s,
+                            cleaner) != 0) {
+    return -1;
+  }
+  if (strcmp(policy, "allow") == 0) {
+    char const *allow = getenv("UPTPL_ENVIRON_ALLOW");
+    size_t cnt = 0;
+    for (size_t i = 0; i < env->n_s; ++i) {
+      if (allow && uptev_environ_allowed(env->s[i], allow)) {
+        env->s[cnt++] = env->s[i];
+      }
+    }
+    env->n_s = cnt;
+  }
+  proc_begin->environ = env;
+  if (strcmp(policy, "hash") == 0) {
+    proc_begin->has_environ_hash = 1;
+    proc_begin->environ_hash = uptev_environ_hash(env->n_s, env->s);
+    if (uptev_environ_stored(proc_begin->environ_hash)) {
+      proc_begin->environ = NULL;
+    }
+  }
+  return 0;
+}
@@ -0,0 +1,36 @@
+/**
+ * UProcTrace: User-space Process Tracing
+ * Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+ * Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+ */
+
+#ifndef UPTEV_ENVIRON_H
+#define UPTEV_ENVIRON_H
+
+#include "cleaner.h"
+
+#include <uproctrace.pb-c.h>
+
+/**
+ * @brief read environment of process according to capture policy
+ *
+ * The policy is selected by the environment variable UPTPL_ENVIRON:
+ *   - "full" (default): store all environment variables
+ *   - "none": do not store the environment
+ *   - "allow": store only the variables listed in UPTPL_ENVIRON_ALLOW
+ *     (colon-separated names, a trailing '*' matches all names with prefix)
+ *   - "hash": store the hash of the environment and store the environment
+ *     itself only once per trace: the first process with an environment
+ *     creates a marker file named after the hash in UPTPL_ENVIRON_DIR,
+ *     processes finding the marker store only the hash
+ *
+ * @param[in,out] proc_begin process begin event, environ and environ_hash are
+ *                set according to the policy
+ * @param[out] env string list for environment, referenced by proc_begin
+ * @param[in,out] cleaner object, malloc-ed object are added to it on success
+ * @return 0 on success, -1 on error
+ */
+int uptev_environ_read(Uproctrace__ProcBegin *proc_begin,
+                       Uproctrace__Stringlist *env, uptev_cleaner_t *cleaner);
+
+#endif /* #ifndef UPTEV_ENVIRON_H */
@@ -5,6 +5,7 @@
  */
 
 #include "cleaner.h"
+#include "environ.h"
 #include "event.h"
 #include "stringlist.h"
 #include "symlink.h"
@@ -43,10 +44,7 @@ int uptev_proc_begin(void **data, size_t *size) {
   }
 
   Uproctrace__Stringlist environ = UPROCTRACE__STRINGLIST__INIT;
-  if (uptev_stringlist_read("/proc/self/environ", &environ.n_s, &environ.s,
-                            cleaner) == 0) {
-    proc_begin.environ = &environ;
-  }
+  uptev_environ_read(&proc_begin, &environ, cleaner);
 
   Uproctrace__Event event = UPROCTRACE__EVENT__INIT;
   event.timestamp = &timestamp;
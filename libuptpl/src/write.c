@@ -7,16 +7,47 @@
 #include "write.h"
 
 #include <fcntl.h>
+#include <limits.h>
+#include <stdio.h>
 #include <stdint.h>
 #include <stdlib.h>
 #include <string.h>
 #include <sys/file.h>
+#include <sys/stat.h>
+#include <sys/uio.h>
 #include <unistd.h>
 
-static ssize_t write_all(int fd, const void *buf, size_t n) {
+/**
+ * maximum size of an event (header and payload) that is appended with a
+ * single write without any lock (so events of different processes do not wait
+ * for each other), larger events are written while holding an exclusive lock
+ * on the trace file
+ */
+#define UPTPL_ATOMIC_SIZE (64 * 1024)
+
+/** trace file, opened once per process image */
+struct uptpl_output_s {
+  int fd;    /**< file descriptor, -1 if not open */
+  dev_t dev; /**< device of trace file */
+  ino_t ino; /**< inode of trace file */
+  pid_t pid; /**< process that opened the trace file */
+};
+
+static struct uptpl_output_s uptpl_output = {.fd = -1};
+
+struct uptpl_event_header_s {
+  uint8_t magic[4]; /**< u p t 0 */
+  uint8_t size[4];  /**< size of payload in network byte oder */
+} __attribute__((packed));
+
+/**
+ * @brief write all buffers, continue after short writes
+ * @return number of bytes written or -1 on error
+ */
+static ssize_t writev_all(int fd, struct iovec *iov, int iovcnt) {
   ssize_t written = 0;
-  while (n > 0) {
-    ssize_t wr = write(fd, buf, n);
+  while (iovcnt > 0) {
+    ssize_t wr = writev(fd, iov, iovcnt);
     if (wr < 0) {
       return wr;
     }
@@ -24,31 +55,85 @@ static ssize_t write_all(int fd, const void *buf, size_t n) {
       return written;
     }
     written += wr;
-    buf = (const uint8_t *)buf + wr;
-    n -= wr;
+    /* skip completely written buffers, advance in partially written one */
+    while (iovcnt > 0 && (size_t)wr >= iov->iov_len) {
+      wr -= iov->iov_len;
+      ++iov;
+      --iovcnt;
+    }
+    if (iovcnt > 0) {
+      iov->iov_base = (uint8_t *)iov->iov_base + wr;
+      iov->iov_len -= wr;
+    }
   }
   return written;
 }
 
-struct uptpl_event_header_s {
-  uint8_t magic[4]; /**< u p t 0 */
-  uint8_t size[4];  /**< size of payload in network byte oder */
-} __attribute__((packed));
-
-void uptpl_write(void const *data, size_t size) {
-  if (!data || !size || size > 0xFFFFFFFF) {
-    return;
+/**
+ * @brief get file descriptor of trace file, open trace file if needed
+ * @return file descriptor or -1 on error
+ *
+ * The trace file is UPTPL_OUTPUT or, in sharded mode, the shard
+ * <UPTPL_OUTPUT_DIR>/<pid>.upt of the process (created if needed), so
+ * processes never write to the same file.
+ *
+ * The trace file is opened on first use and kept open for all further events
+ * of the process image. Forked children open it again, so they do not share
+ * the open file description (and its file lock) with their parent.
+ * It is closed on exec (the new process image opens it again) and on exit.
+ * If the application closed the file descriptor or reused it for another
+ * file, the trace file is opened again.
+ */
+static int uptpl_get_fd(void) {
+  struct stat st;
+  if (uptpl_output.fd != -1) {
+    if (fstat(uptpl_output.fd, &st) == 0 && st.st_dev == uptpl_output.dev &&
+        st.st_ino == uptpl_output.ino) {
+      if (uptpl_output.pid == getpid()) {
+        return uptpl_output.fd;
+      }
+      close(uptpl_output.fd); /* file of parent, inherited by fork */
+    }
+    /* otherwise, the application closed or reused it: do not close it */
+    uptpl_output.fd = -1;
   }
   char const *filename = getenv("UPTPL_OUTPUT");
+  char const *dirname = getenv("UPTPL_OUTPUT_DIR");
+  char shard_filename[PATH_MAX];
+  int flags = O_WRONLY | O_APPEND | O_CLOEXEC;
+  if (dirname) {
+    int len = snprintf(shard_filename, sizeof(shard_filename), "%s/%ld.upt",
+                       dirname, (long)getpid());
+    if (len < 0 || (size_t)len >= sizeof(shard_filename)) {
+      return -1;
+    }
+    filename = shard_filename;
+    flags |= O_CREAT;
+  }
   if (!filename) {
-    return;
+    return -1;
   }
-  int fd = open(filename, O_WRONLY | O_APPEND);
+  int fd = open(filename, flags, 0666);
   if (fd == -1) {
-    return;
+    return -1;
   }
-  if (flock(fd, LOCK_EX) == -1) {
+  if (fstat(fd, &st) == -1) {
     close(fd);
+    return -1;
+  }
+  uptpl_output.fd = fd;
+  uptpl_output.dev = st.st_dev;
+  uptpl_output.ino = st.st_ino;
+  uptpl_output.pid = getpid();
+  return fd;
+}
+
+void uptpl_write(void const *data, size_t size) {
+  if (!data || !size || size > 0xFFFFFFFF) {
+    return;
+  }
+  int fd = uptpl_get_fd();
+  if (fd == -1) {
     return;
   }
   struct uptpl_event_header_s uptpl_event_header = {
@@ -59,10 +144,26 @@ void uptpl_write(void const *data, size_t size) {
           (size >> 8) & 0xFF,
           size & 0xFF,
       }};
-  ssize_t written =
-      write_all(fd, &uptpl_event_header, sizeof(uptpl_event_header));
-  written += write_all(fd, data, size);
+  struct iovec iov[2] = {
+      {.iov_base = &uptpl_event_header,
+       .iov_len = sizeof(uptpl_event_header)},
+      {.iov_base = (void *)data, .iov_len = size},
+  };
+  /* small events: header and payload are appended by a single write
+     (O_APPEND) without lock; a short write is not continued, as the rest
+     might interleave with events of other processes (the reader skips the
+     truncated event by searching the magic bytes of the next one) */
+  if (sizeof(uptpl_event_header) + size <= UPTPL_ATOMIC_SIZE) {
+    ssize_t written = writev(fd, iov, 2);
+    (void)written; /* if writing failed, nobody there to receive the error */
+    return;
+  }
+  /* large events: written under an exclusive lock, so large events of
+     different processes are not interleaved after short writes */
+  if (flock(fd, LOCK_EX) == -1) {
+    return;
+  }
+  ssize_t written = writev_all(fd, iov, 2);
   (void)written; /* if writing failed, nobody there to receive the error */
   flock(fd, LOCK_UN);
-  close(fd);
 }
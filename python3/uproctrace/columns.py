@@ -0,0 +1,122 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Columnar table of process metrics.
+"""
+
+import array
+import functools
+import itertools
+import operator
+import typing
+
+# float metrics: attribute name -> array type code
+FLOAT_ATTRS = {
+    "begin_timestamp": "d",
+    "end_timestamp": "d",
+    "cpu_time": "d",
+    "user_time": "d",
+    "sys_time": "d",
+}
+
+# integer metrics: attribute name -> array type code
+INT_ATTRS = {
+    "max_rss_kb": "q",
+    "min_flt": "q",
+    "maj_flt": "q",
+    "in_block": "q",
+    "ou_block": "q",
+    "n_v_csw": "q",
+    "n_iv_csw": "q",
+}
+
+# all metrics: attribute name -> array type code
+ATTRS = {**FLOAT_ATTRS, **INT_ATTRS}
+
+
+def mask_and(*masks: bytes) -> bytes:
+    """
+    Combine masks of same length: entry is 1 if it is 1 in all masks,
+    0 otherwise.
+    """
+    # entries are 0 or 1, so bitwise and of the masks as big integers works
+    size = len(masks[0])
+    ints = (int.from_bytes(mask, "little") for mask in masks)
+    return functools.reduce(operator.and_, ints).to_bytes(size, "little")
+
+
+class Columns:
+    """
+    Columnar table of process metrics.
+
+    There is one typed array (see module array) per metric and a null mask
+    (bytearray) per metric, which is 1 for processes that have a value for
+    the metric and 0 for processes that do not (value is 0 in the array).
+    Row i belongs to the process with proc_id i.
+    The arrays (or memoryviews, if loaded from an index) support the buffer
+    protocol, so they can be passed to e.g. numpy.frombuffer without copying.
+    """
+
+    def __init__(self, columns: dict, masks: dict) -> None:
+        """
+        Initialize columns from arrays of values and null masks
+        (attribute name -> array / mask, for all attributes in ATTRS).
+        """
+        self._columns = columns
+        self._masks = masks
+        self._size = len(masks["begin_timestamp"])
+
+    @classmethod
+    def fromProcesses(cls, processes: typing.Iterable) -> "Columns":
+        """
+        Create columns from processes (ordered by proc_id).
+        """
+        processes = list(processes)
+        is_not_none = functools.partial(operator.is_not, None)
+        columns = {}
+        masks = {}
+        for attr, code in ATTRS.items():
+            values = list(map(operator.attrgetter(attr), processes))
+            masks[attr] = bytearray(map(is_not_none, values))
+            columns[attr] = array.array(
+                code, [0 if value is None else value for value in values]
+            )
+        return cls(columns, masks)
+
+    def __len__(self) -> int:
+        """
+        Number of rows (i.e. processes).
+        """
+        return self._size
+
+    @property
+    def complete(self) -> bytes:
+        """
+        Mask of processes with both a begin and an end event.
+        """
+        return mask_and(self._masks["begin_timestamp"], self._masks["end_timestamp"])
+
+    def column(self, attr: str) -> typing.Sequence:
+        """
+        Return array of values of a metric (0 where there is no value).
+        """
+        return self._columns[attr]
+
+    def mask(self, attr: str) -> typing.Sequence[int]:
+        """
+        Return null mask of a metric (1 where there is a value, 0 otherwise).
+        """
+        return self._masks[attr]
+
+    def values(self, attr: str, mask: bytes | None = None) -> array.array:
+        """
+        Return array of available values of a metric.
+        If mask is specified, only return values of rows where mask is 1.
+        """
+        column = self._columns[attr]
+        if mask is None:
+            mask = self._masks[attr]
+        else:
+            mask = mask_and(self._masks[attr], mask)
+        return array.array(ATTRS[attr], itertools.compress(column, mask))
@@ -0,0 +1,481 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Compressed traces: "upt-tool compress".
+
+Trace files compressed with gzip, zstd or lz4 (detected by their magic bytes)
+are read transparently: open_trace returns a file object of the uncompressed
+trace, so all offsets (e.g. in index files) are offsets in the uncompressed
+trace.
+
+"upt-tool compress" writes a trace as a sequence of independently compressed
+frames of frame_size uncompressed bytes each, followed by a seek table with
+the compressed size of each frame. Readers decompress only the frames they
+need, so index files and parallel parsing can still seek to event offsets.
+The seek table is stored where decompressors ignore it: in a skippable frame
+(zstd, lz4) or in the extra field of an empty member (gzip), so the files
+can still be decompressed with the usual tools.
+
+Compressed files without seek table are decompressed as a stream, seeking
+backwards starts over from the beginning of the stream.
+
+The zstd and lz4 formats need the Python modules zstandard and lz4.
+"""
+
+import abc
+import contextlib
+import gzip
+import importlib
+import io
+import struct
+import zlib
+
+import uproctrace.files
+
+# default number of uncompressed bytes per frame
+FRAME_SIZE = 4 << 20
+
+# seek table: compressed sizes of frames, followed by footer
+_SIZE = struct.Struct("<L")
+_FOOTER = struct.Struct("<QQL8s")  # frame size, total size, frames, magic
+_TABLE_MAGIC = b"uptseek1"
+
+# skippable frame of zstd and lz4: magic, size of data
+_SKIPPABLE = struct.Struct("<LL")
+_SKIPPABLE_MAGIC = 0x184D2A5E
+
+
+class _Codec(abc.ABC):
+    """
+    Compression format of trace files.
+    """
+
+    name = ""
+    magic = b""  # magic bytes at begin of compressed files
+    suffix = ""  # suffix of file names
+    overhead = 0  # size of table frame without seek table
+    trailer = 0  # size of table frame behind seek table
+    max_table = 0xFFFFFFFF  # maximum size of seek table
+    module = ""  # Python module needed (empty: standard library)
+
+    def require(self):
+        """
+        Import and return Python module needed for format.
+        Raise ImportError if it is not installed.
+        """
+        if not self.module:
+            return None
+        try:
+            return importlib.import_module(self.module)
+        except ImportError as exc:
+            raise ImportError(
+                f"Python module {self.module:s} needed for {self.name:s}"
+                " compressed traces"
+            ) from exc
+
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        """
+        Return data compressed as independent frame.
+        """
+
+    @abc.abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        """
+        Return decompressed data of frame.
+        """
+
+    @abc.abstractmethod
+    def stream(self, raw_file):
+        """
+        Return file object reading decompressed data from compressed file.
+        """
+
+    def tableFrame(self, table: bytes) -> bytes:
+        """
+        Return frame ignored by decompressors that contains seek table.
+        """
+        return _SKIPPABLE.pack(_SKIPPABLE_MAGIC, len(table)) + table
+
+
+class _Gzip(_Codec):
+    """
+    gzip format (seek table in extra field of empty member).
+    """
+
+    name = "gzip"
+    magic = b"\x1f\x8b"
+    suffix = ".gz"
+    overhead = 26
+    trailer = 10
+    max_table = 0xFFFF - 4
+
+    # header of member with extra field (no mtime, unknown OS)
+    _HEADER = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff"
+    # empty deflate block, CRC-32 and size of empty data
+    _EMPTY = b"\x03\x00" + bytes(8)
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, mtime=0)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+    def stream(self, raw_file):
+        return gzip.GzipFile(fileobj=raw_file, mode="rb")
+
+    def tableFrame(self, table: bytes) -> bytes:
+        extra = b"UP" + struct.pack("<H", len(table)) + table
+        return self._HEADER + struct.pack("<H", len(extra)) + extra + self._EMPTY
+
+
+class _Zstd(_Codec):
+    """
+    zstd format (seek table in skippable frame).
+    """
+
+    name = "zstd"
+    magic = b"\x28\xb5\x2f\xfd"
+    suffix = ".zst"
+    overhead = _SKIPPABLE.size
+    module = "zstandard"
+
+    def compress(self, data: bytes) -> bytes:
+        return self.require().ZstdCompressor().compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.require().ZstdDecompressor().decompress(data)
+
+    def stream(self, raw_file):
+        return (
+            self.require()
+            .ZstdDecompressor()
+            .stream_reader(raw_file, read_across_frames=True, closefd=False)
+        )
+
+
+class _Lz4(_Codec):
+    """
+    lz4 frame format (seek table in skippable frame).
+    """
+
+    name = "lz4"
+    magic = b"\x04\x22\x4d\x18"
+    suffix = ".lz4"
+    overhead = _SKIPPABLE.size
+    module = "lz4.frame"
+
+    def compress(self, data: bytes) -> bytes:
+        return self.require().compress(data, store_size=True)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.require().decompress(data)
+
+    def stream(self, raw_file):
+        return self.require().LZ4FrameFile(raw_file, mode="rb")
+
+
+# supported compression formats by name
+CODECS = {codec.name: codec for codec in (_Gzip(), _Lz4(), _Zstd())}
+
+
+def compressed_filename(upt_trace: str, codec: str) -> str:
+    """
+    Return default file name of trace file compressed with codec.
+    """
+    return upt_trace + CODECS[codec].suffix
+
+
+class _FramedFile(io.RawIOBase):
+    """
+    Uncompressed data of a compressed file with seek table.
+    The last decompressed frame is kept for further reads.
+    """
+
+    def __init__(self, raw_file, codec: _Codec, table: tuple[int, int, list[int]]):
+        """
+        Initialize for compressed file (raw_file) and its seek table
+        (frame size, uncompressed size, offsets of frames in raw_file and
+        offset behind last frame).
+        """
+        super().__init__()
+        self._raw_file = raw_file
+        self._codec = codec
+        self._frame_size, self._size, self._offsets = table
+        self._pos = 0
+        self._frame = (-1, b"")  # index and data of last decompressed frame
+
+    @property
+    def name(self):
+        """
+        Name of compressed file.
+        """
+        return self._raw_file.name
+
+    def close(self):
+        """
+        Close compressed file.
+        """
+        self._raw_file.close()
+        super().close()
+
+    def readable(self) -> bool:
+        """
+        Uncompressed data can be read.
+        """
+        return True
+
+    def seekable(self) -> bool:
+        """
+        Uncompressed data supports seeking.
+        """
+        return True
+
+    def tell(self) -> int:
+        """
+        Return position in uncompressed data.
+        """
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """
+        Set position in uncompressed data, return new position.
+        """
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return offset
+
+    def _getFrame(self, frame_idx: int) -> memoryview:
+        """
+        Return decompressed data of frame.
+        """
+        if frame_idx != self._frame[0]:
+            self._raw_file.seek(self._offsets[frame_idx])
+            size = self._offsets[frame_idx + 1] - self._offsets[frame_idx]
+            frame = self._codec.decompress(self._raw_file.read(size))
+            expected = min(self._frame_size, self._size - frame_idx * self._frame_size)
+            if len(frame) != expected:
+                raise ValueError(f"compressed frame {frame_idx:d} is corrupted")
+            self._frame = (frame_idx, frame)
+        return memoryview(self._frame[1])
+
+    def readinto(self, buffer) -> int:
+        """
+        Read uncompressed data into buffer, return number of bytes read.
+        """
+        if self._pos >= self._size:
+            return 0
+        frame_idx, begin = divmod(self._pos, self._frame_size)
+        frame = self._getFrame(frame_idx)[begin:]
+        size = min(len(buffer), len(frame))
+        buffer[:size] = frame[:size]
+        self._pos += size
+        return size
+
+
+class _StreamFile(io.RawIOBase):
+    """
+    Uncompressed data of a compressed file without seek table.
+    """
+
+    # size of data skipped at once when seeking
+    SKIP_SIZE = 1 << 20
+
+    def __init__(self, raw_file, codec: _Codec):
+        """
+        Initialize for compressed file (raw_file).
+        """
+        super().__init__()
+        self._raw_file = raw_file
+        self._codec = codec
+        self._stream = codec.stream(raw_file)
+        self._pos = 0  # position in uncompressed data
+        self._stream_pos = 0  # position of stream (may be at EOF before _pos)
+
+    @property
+    def name(self):
+        """
+        Name of compressed file.
+        """
+        return self._raw_file.name
+
+    def close(self):
+        """
+        Close compressed file.
+        """
+        self._stream.close()
+        self._raw_file.close()
+        super().close()
+
+    def readable(self) -> bool:
+        """
+        Uncompressed data can be read.
+        """
+        return True
+
+    def seekable(self) -> bool:
+        """
+        Uncompressed data supports seeking.
+        """
+        return True
+
+    def tell(self) -> int:
+        """
+        Return position in uncompressed data.
+        """
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """
+        Set position in uncompressed data, return new position.
+        """
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            raise io.UnsupportedOperation("size of compressed stream is unknown")
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._pos = offset
+        return offset
+
+    def _skipTo(self, offset: int):
+        """
+        Advance stream to offset (restart if offset is before its position).
+        """
+        if offset < self._stream_pos:
+            self._stream.close()
+            self._raw_file.seek(0)
+            self._stream = self._codec.stream(self._raw_file)
+            self._stream_pos = 0
+        while self._stream_pos < offset:
+            data = self._stream.read(min(offset - self._stream_pos, self.SKIP_SIZE))
+            if not data:
+                break  # EOF
+            self._stream_pos += len(data)
+
+    def readinto(self, buffer) -> int:
+        """
+        Read uncompressed data into buffer, return number of bytes read.
+        """
+        self._skipTo(self._pos)
+        if self._stream_pos != self._pos:
+            return 0  # behind EOF
+        data = self._stream.read(len(buffer))
+        buffer[: len(data)] = data
+        self._pos = self._stream_pos = self._pos + len(data)
+        return len(data)
+
+
+def _read_table(raw_file, codec: _Codec) -> tuple[int, int, list[int]] | None:
+    """
+    Read seek table at end of compressed file.
+    Return frame size, uncompressed size and offsets of frames (and of end of
+    last frame) or None if there is no valid seek table.
+    """
+    file_size = raw_file.seek(0, io.SEEK_END)
+    footer_end = file_size - codec.trailer
+    if footer_end < codec.overhead + _FOOTER.size:
+        return None
+    raw_file.seek(footer_end - _FOOTER.size)
+    frame_size, size, count, magic = _FOOTER.unpack(raw_file.read(_FOOTER.size))
+    table_size = count * _SIZE.size + _FOOTER.size
+    if magic != _TABLE_MAGIC or table_size + codec.overhead > file_size:
+        return None
+    raw_file.seek(file_size - table_size - codec.overhead)
+    table_frame = raw_file.read(table_size + codec.overhead)
+    begin = codec.overhead - codec.trailer
+    if table_frame != codec.tableFrame(table_frame[begin : begin + table_size]):
+        return None
+    offsets = [0]
+    for (comp_size,) in _SIZE.iter_unpack(
+        table_frame[begin : begin + count * _SIZE.size]
+    ):
+        offsets.append(offsets[-1] + comp_size)
+    if (
+        offsets[-1] != file_size - len(table_frame)
+        or frame_size <= 0
+        or count != -(-size // frame_size)
+    ):
+        return None
+    return frame_size, size, offsets
+
+
+def is_compressed(upt_trace: str) -> bool:
+    """
+    Check if trace file is compressed (detected by its magic bytes).
+    """
+    try:
+        with open(upt_trace, "rb") as raw_file:
+            head = raw_file.read(4)
+    except OSError:
+        return False
+    return any(head.startswith(codec.magic) for codec in CODECS.values())
+
+
+def open_trace(upt_trace: str):
+    """
+    Open trace file for reading (binary).
+    If the trace file is compressed, return a file object of the uncompressed
+    trace.
+    """
+    with contextlib.ExitStack() as stack:
+        raw_file = stack.enter_context(open(upt_trace, "rb"))
+        head = raw_file.read(4)
+        raw_file.seek(0)
+        for codec in CODECS.values():
+            if head.startswith(codec.magic):
+                codec.require()
+                table = _read_table(raw_file, codec)
+                raw_file.seek(0)
+                if table is None:
+                    trace_file = _StreamFile(raw_file, codec)
+                else:
+                    trace_file = _FramedFile(raw_file, codec, table)
+                stack.pop_all()
+                return io.BufferedReader(trace_file)
+        stack.pop_all()
+        return raw_file
+
+
+def compress_trace(
+    proto_file, filename: str, codec: str, frame_size: int = FRAME_SIZE
+) -> tuple[int, int]:
+    """
+    Write trace file (proto_file, from its current position) compressed with
+    codec in frames of frame_size uncompressed bytes and with seek table.
+    The file is replaced atomically.
+    Return uncompressed and compressed size.
+    """
+    comp = CODECS[codec]
+    comp.require()
+    if frame_size <= 0:
+        raise ValueError("frame size must be positive")
+    sizes = []
+    size = 0
+    with uproctrace.files.replace_file(filename) as tmp_filename:
+        with open(tmp_filename, "wb") as comp_file:
+            while True:
+                data = proto_file.read(frame_size)
+                if not data:
+                    break
+                frame = comp.compress(data)
+                comp_file.write(frame)
+                sizes.append(len(frame))
+                size += len(data)
+            table = b"".join(map(_SIZE.pack, sizes)) + _FOOTER.pack(
+                frame_size, size, len(sizes), _TABLE_MAGIC
+            )
+            if len(table) > comp.max_table:
+                raise ValueError(
+                    f"too many frames for seek table of {codec:s},"
+                    " use larger frame size"
+                )
+            comp_file.write(comp.tableFrame(table))
+            comp_size = comp_file.tell()
+    return size, comp_size
@@ -0,0 +1,373 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Critical path and parallelism analysis of UProcTrace: "upt-tool critpath".
+
+Processes without begin timestamp are transparent (their children are
+treated as children of their parent), processes without end timestamp are
+assumed to run until the end of the trace.
+"""
+
+import argparse
+import bisect
+import math
+
+import tabulate
+import uproctrace.formatting
+import uproctrace.index
+import uproctrace.processes
+
+
+def spans(processes: uproctrace.processes.Processes) -> dict:
+    """
+    Return (begin timestamp, end timestamp) of all processes with begin
+    timestamp: proc_id -> (begin, end).
+    """
+    trace_end = None
+    for proc in processes.getAllProcesses().values():
+        for timestamp in (proc.begin_timestamp, proc.end_timestamp):
+            if timestamp is not None and (trace_end is None or timestamp > trace_end):
+                trace_end = timestamp
+    result = {}
+    for proc_id, proc in processes.getAllProcesses().items():
+        if proc.begin_timestamp is None:
+            continue
+        end = trace_end if proc.end_timestamp is None else proc.end_timestamp
+        result[proc_id] = (proc.begin_timestamp, max(end, proc.begin_timestamp))
+    return result
+
+
+def timed_children(procs: list, proc_spans: dict) -> list:
+    """
+    Return processes in procs that have a span, with processes without span
+    replaced by their children (recursively).
+    """
+    result = []
+    to_be_checked = list(procs)
+    while to_be_checked:
+        proc = to_be_checked.pop()
+        if proc.proc_id in proc_spans:
+            result.append(proc)
+        else:
+            to_be_checked.extend(proc.children)
+    return result
+
+
+def _path_children(processes: uproctrace.processes.Processes, proc_spans: dict) -> dict:
+    """
+    Find processes on critical path (see critical_path).
+    Return children on path (in chronological order) of processes on path:
+    proc_id -> list of processes (None as key for toplevel processes).
+    """
+    path_children: dict = {}
+    to_be_done = [(None, processes.toplevel, math.inf)]
+    while to_be_done:
+        parent, procs, limit = to_be_done.pop()
+        candidates = sorted(
+            timed_children(procs, proc_spans),
+            key=lambda proc: proc_spans[proc.proc_id][1],
+            reverse=True,
+        )
+        path = []
+        for proc in candidates:
+            begin, end = proc_spans[proc.proc_id]
+            if end > limit:
+                continue
+            path.append(proc)
+            to_be_done.append((proc, proc.children, end))
+            limit = begin
+        path.reverse()
+        path_children[None if parent is None else parent.proc_id] = path
+    return path_children
+
+
+def critical_path(
+    processes: uproctrace.processes.Processes, proc_spans: dict
+) -> list[tuple[int, uproctrace.processes.Process, float]]:
+    """
+    Compute critical path: Starting at the end of the trace, the process that
+    ended last, then (before its begin) the process that ended last before,
+    and so on. Inside each process on the path, the same is done for its
+    children, starting at the end of the process.
+    Return list of (depth, process, self time on path) in chronological
+    order (depth-first), self time is the duration of the process minus the
+    durations of its children on the path.
+    """
+    path_children = _path_children(processes, proc_spans)
+    # flatten path depth-first, compute self time
+    result = []
+    to_be_output = [(0, path_children[None][::-1])]
+    while to_be_output:
+        depth, procs = to_be_output[-1]
+        if not procs:
+            del to_be_output[-1]
+            continue
+        proc = procs.pop()
+        begin, end = proc_spans[proc.proc_id]
+        children = path_children[proc.proc_id]
+        self_time = (end - begin) - sum(
+            proc_spans[child.proc_id][1] - proc_spans[child.proc_id][0]
+            for child in children
+        )
+        result.append((depth, proc, self_time))
+        to_be_output.append((depth + 1, children[::-1]))
+    return result
+
+
+def timeline(proc_spans: dict, processes: uproctrace.processes.Processes) -> list:
+    """
+    Sweep over begin and end events of processes.
+    Return list of segments (begin, end, running processes, busy CPUs) of
+    constant values in chronological order (without holes), where the CPU
+    time of each process is assumed to be spread evenly over its duration.
+    """
+    events = []
+    for proc_id, (begin, end) in proc_spans.items():
+        cpu_time = processes.getProcess(proc_id).cpu_time
+        rate = cpu_time / (end - begin) if cpu_time and end > begin else 0.0
+        events.append((begin, 1, rate))
+        events.append((end, -1, -rate))
+    events.sort()
+    segments = []
+    running = 0
+    busy = 0.0
+    prev = None
+    for timestamp, delta, rate in events:
+        if prev is not None and timestamp > prev:
+            segments.append((prev, timestamp, running, max(busy, 0.0)))
+        running += delta
+        busy += rate
+        prev = timestamp
+    return segments
+
+
+def profile(segments: list, count: int) -> list[tuple[float, float, float, float]]:
+    """
+    Compute concurrency profile: divide time of segments (see timeline) into
+    count intervals of equal length.
+    Return list of (begin, end, average running processes, average busy CPUs)
+    of intervals.
+    """
+    if not segments or count < 1:
+        return []
+    first = segments[0][0]
+    width = (segments[-1][1] - first) / count
+    if width <= 0:
+        return []
+    running_area = [0.0] * count
+    busy_area = [0.0] * count
+    for begin, end, running, busy in segments:
+        idx = min(int((begin - first) / width), count - 1)
+        while begin < end:
+            part_end = end if idx == count - 1 else min(end, first + (idx + 1) * width)
+            running_area[idx] += running * (part_end - begin)
+            busy_area[idx] += busy * (part_end - begin)
+            begin = part_end
+            idx += 1
+    return [
+        (
+            first + idx * width,
+            first + (idx + 1) * width,
+            running_area[idx] / width,
+            busy_area[idx] / width,
+        )
+        for idx in range(count)
+    ]
+
+
+def gaps(
+    segments: list, threshold: float, min_duration: float
+) -> list[tuple[float, float, float]]:
+    """
+    Find gaps in parallelism: maximal intervals of at least min_duration in
+    which fewer than threshold CPUs were busy (see timeline).
+    Return list of (begin, end, average busy CPUs), longest first.
+    """
+    result = []
+    gap_begin = None
+    gap_area = 0.0
+    prev_end = None
+    for begin, end, _running, busy in segments + [(math.inf, math.inf, 0, math.inf)]:
+        if gap_begin is not None and busy >= threshold:
+            if prev_end - gap_begin >= min_duration:
+                result.append((gap_begin, prev_end, gap_area / (prev_end - gap_begin)))
+            gap_begin = None
+        if busy < threshold:
+            if gap_begin is None:
+                gap_begin = begin
+                gap_area = 0.0
+            gap_area += busy * (end - begin)
+        prev_end = end
+    result.sort(key=lambda gap: gap[0] - gap[1])
+    return result
+
+
+def gap_processes(
+    proc_spans: dict,
+    processes: uproctrace.processes.Processes,
+    gap_list: list[tuple[float, float, float]],
+) -> list[list]:
+    """
+    Return processes running during each gap in gap_list (see gaps) that do
+    not have children running during the gap, i.e. the processes everything
+    else was waiting for (longest first).
+    """
+    order = sorted(range(len(gap_list)), key=lambda idx: gap_list[idx][0])
+    gap_begins = [gap_list[idx][0] for idx in order]
+    running = [set() for _ in gap_list]
+    parents = [set() for _ in gap_list]
+    for proc_id, (begin, end) in proc_spans.items():
+        # gaps are disjoint, find the ones overlapping the process
+        pos = max(bisect.bisect_right(gap_begins, begin) - 1, 0)
+        while pos < len(order) and gap_begins[pos] < end:
+            idx = order[pos]
+            pos += 1
+            if gap_list[idx][1] <= begin:
+                continue
+            running[idx].add(proc_id)
+            # mark parent (skipping processes without span)
+            parent = processes.getProcess(proc_id).parent
+            while parent is not None and parent.proc_id not in proc_spans:
+                parent = parent.parent
+            if parent is not None:
+                parents[idx].add(parent.proc_id)
+    return [
+        [
+            processes.getProcess(proc_id)
+            for proc_id in sorted(
+                running[idx] - parents[idx],
+                key=lambda proc_id: proc_spans[proc_id][0] - proc_spans[proc_id][1],
+            )
+        ]
+        for idx in range(len(gap_list))
+    ]
+
+
+def seconds2str(seconds: float) -> str:
+    """
+    Convert a duration in seconds to a short string.
+    """
+    return f"{seconds:.3f} s"
+
+
+def print_path(
+    args: argparse.Namespace,
+    processes: uproctrace.processes.Processes,
+    proc_spans: dict,
+    first: float,
+) -> None:
+    """
+    Print critical path (see critical_path), timestamps relative to first.
+    """
+    path = critical_path(processes, proc_spans)
+    if 0 < args.path_limit < len(path):
+        # keep processes with largest self time (in chronological order)
+        print(
+            f"critical path ({len(path):d} processes,"
+            f" {args.path_limit:d} with largest self time shown):"
+        )
+        ranked = sorted(range(len(path)), key=lambda idx: -path[idx][2])
+        path = [path[idx] for idx in sorted(ranked[: args.path_limit])]
+    else:
+        print(f"critical path ({len(path):d} processes):")
+    rows = []
+    for depth, proc, self_time in path:
+        begin, end = proc_spans[proc.proc_id]
+        rows.append(
+            [
+                depth * "--" + ">",
+                uproctrace.formatting.cmdline2str(proc.cmdline),
+                seconds2str(begin - first),
+                seconds2str(end - begin),
+                seconds2str(self_time),
+            ]
+        )
+    print(tabulate.tabulate(rows, ["tree", "process", "begin", "duration", "self"]))
+
+
+def print_profile(args: argparse.Namespace, segments: list) -> None:
+    """
+    Print concurrency profile (see profile).
+    """
+    print("concurrency profile:")
+    first = segments[0][0]
+    intervals = profile(segments, args.intervals)
+    max_busy = max((interval[3] for interval in intervals), default=0)
+    rows = []
+    for begin, end, running, busy in intervals:
+        hashes = "#" * math.ceil(busy * 40 / max_busy) if max_busy > 0 else ""
+        rows.append(
+            [
+                seconds2str(begin - first),
+                seconds2str(end - first),
+                f"{running:.2f}",
+                f"{busy:.2f}",
+                hashes,
+            ]
+        )
+    print(
+        tabulate.tabulate(rows, ["begin", "end", "running processes", "busy CPUs", ""])
+    )
+
+
+def print_gaps(
+    args: argparse.Namespace,
+    processes: uproctrace.processes.Processes,
+    proc_spans: dict,
+    segments: list,
+) -> None:
+    """
+    Print gaps in parallelism (see gaps) and the processes running during
+    them (see gap_processes).
+    """
+    print(
+        f"gaps (fewer than {args.gap_threshold:g} busy CPUs"
+        f" for at least {args.min_gap:g} s):"
+    )
+    first = segments[0][0]
+    gap_list = gaps(segments, args.gap_threshold, args.min_gap)[: args.gaps]
+    rows = []
+    for gap, procs in zip(gap_list, gap_processes(proc_spans, processes, gap_list)):
+        rows.append(
+            [
+                seconds2str(gap[0] - first),
+                seconds2str(gap[1] - gap[0]),
+                f"{gap[2]:.2f}",
+                "\n".join(
+                    uproctrace.formatting.cmdline2str(proc.cmdline)
+                    for proc in procs[:3]
+                ),
+            ]
+        )
+    print(tabulate.tabulate(rows, ["begin", "duration", "busy CPUs", "running"]))
+
+
+def critpath(args: argparse.Namespace) -> None:
+    """
+    Print critical path, concurrency profile and gaps in parallelism.
+    """
+    processes = uproctrace.index.load_processes(
+        args.trace[0], not args.no_index, args.jobs
+    )
+    proc_spans = spans(processes)
+    segments = timeline(proc_spans, processes)
+    if not segments:
+        print("no processes with duration")
+        return
+    first = segments[0][0]
+    duration = segments[-1][1] - first
+    cpu_time = sum(
+        processes.getProcess(proc_id).cpu_time or 0 for proc_id in proc_spans
+    )
+    print(f"begin: {uproctrace.formatting.timestamp2str(first):s}")
+    print(f"duration: {seconds2str(duration):s}")
+    print(f"CPU time: {seconds2str(cpu_time):s}")
+    print(f"average parallelism: {cpu_time / duration:.2f} CPUs")
+    print(f"max. running processes: {max(seg[2] for seg in segments):d}")
+    print()
+    print_path(args, processes, proc_spans, first)
+    print()
+    print_profile(args, segments)
+    print()
+    print_gaps(args, processes, proc_spans, segments)
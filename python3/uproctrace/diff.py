@@ -0,0 +1,332 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Trace diff command line interface of UProcTrace: "upt-tool diff".
+
+Matches the processes of two traces (e.g. of two builds) and reports added
+and removed processes and the changes of their metrics per process and per
+executable.
+
+A process is identified by the hash of its executable, its normalized
+command line (see normalize_cmdline), the identity of its parent process and
+the number of processes with the same identity before it, so processes match
+if they run the same command at the same position in the process tree.
+Processes without begin event cannot be identified, their children are
+identified relative to the closest ancestor that can.
+"""
+
+import argparse
+import functools
+import hashlib
+import re
+import typing
+
+import tabulate
+import uproctrace.formatting
+import uproctrace.index
+import uproctrace.parallel
+import uproctrace.processes
+
+# compared metrics: name -> (title, unit)
+METRICS = {
+    "cpu_time": ("CPU time", "s"),
+    "wall_time": ("wall time", "s"),
+    "max_rss_kb": ("memory", "KiB"),
+}
+
+# metrics aggregated by maximum instead of sum
+MAX_METRICS = {"max_rss_kb"}
+
+# parts of command lines that differ between runs of the same command
+_VOLATILE_RE = re.compile(r"/tmp/[^\s'\"]*|\b[0-9a-fA-F]{8,}\b")
+
+# indices of metrics aggregated by maximum in accumulated values
+# [count a, count b, metric values a..., metric values b...]
+_MAX_INDICES = {
+    2 + side * len(METRICS) + idx
+    for side in (0, 1)
+    for idx, name in enumerate(METRICS)
+    if name in MAX_METRICS
+}
+
+# size of process identity hashes (bytes)
+_DIGEST_SIZE = 16
+
+
+def normalize_cmdline(cmdline: list[str] | None) -> str:
+    """
+    Return command line as string with parts that usually differ between
+    runs of the same command (temporary files, long hexadecimal numbers like
+    hashes) replaced by "*".
+    """
+    if cmdline is None:
+        return "???"
+    return _VOLATILE_RE.sub("*", uproctrace.formatting.cmdline2str(cmdline))
+
+
+def identify(
+    processes: uproctrace.processes.Processes,
+) -> typing.Iterator[tuple[bytes, uproctrace.processes.Process, str, str]]:
+    """
+    Iterate over (identity hash, process, exe, normalized command line) of
+    all processes with begin event (see module docstring).
+    """
+    counts: dict[bytes, int] = {}
+    to_be_done = [(b"", proc) for proc in reversed(processes.toplevel)]
+    while to_be_done:
+        parent_key, proc = to_be_done.pop()
+        key = parent_key
+        # decode begin event only once for both fields
+        begin = proc.getBegin()
+        cmdline = None if begin is None else begin.cmdline
+        if cmdline is not None:
+            exe = begin.exe or "???"
+            cmdline_str = normalize_cmdline(cmdline)
+            key = hashlib.blake2b(
+                parent_key + f"{exe:s}\0{cmdline_str:s}".encode(errors="replace"),
+                digest_size=_DIGEST_SIZE,
+            ).digest()
+            # number processes with same identity
+            count = counts.get(key, 0)
+            counts[key] = count + 1
+            if count:
+                key = hashlib.blake2b(
+                    key + count.to_bytes(8, "little"), digest_size=_DIGEST_SIZE
+                ).digest()
+            yield key, proc, exe, cmdline_str
+        to_be_done.extend((key, child) for child in reversed(proc.children))
+
+
+def summarize(upt_trace: str, use_index: bool = True) -> dict:
+    """
+    Load trace and return compact summary of its processes: identity hash ->
+    (exe, normalized command line, metric values (see METRICS, 0 if not
+    available)).
+    """
+    processes = uproctrace.index.load_processes(upt_trace, use_index)
+    summary = {}
+    for key, proc, exe, cmdline_str in identify(processes):
+        begin = proc.begin_timestamp
+        end = proc.end_timestamp
+        summary[key] = (
+            exe,
+            cmdline_str,
+            proc.cpu_time or 0.0,
+            0.0 if begin is None or end is None else end - begin,
+            proc.max_rss_kb or 0,
+        )
+    return summary
+
+
+def _accumulate(acc: list, side: int, values: typing.Iterable) -> None:
+    """
+    Add metric values of a process of trace side (0 for a, 1 for b) to
+    accumulated values [count a, count b, metric values a..., metric
+    values b...].
+    """
+    acc[side] += 1
+    offset = 2 + side * len(METRICS)
+    for idx, value in enumerate(values, offset):
+        if idx in _MAX_INDICES:
+            acc[idx] = max(acc[idx], value)
+        else:
+            acc[idx] += value
+
+
+def _merge(acc: list, other: list) -> None:
+    """
+    Merge accumulated values other into accumulated values acc.
+    """
+    for idx, value in enumerate(other):
+        if idx in _MAX_INDICES:
+            acc[idx] = max(acc[idx], value)
+        else:
+            acc[idx] += value
+
+
+def compare(summary_a: dict, summary_b: dict) -> tuple[list, dict, list]:
+    """
+    Compare summaries of two traces (see summarize).
+    Return (total, per executable, per process) accumulated values
+    [count a, count b, metric values a..., metric values b...], per
+    executable as mapping exe -> values, per process as list of
+    (command line, values).
+    """
+    size = 2 + 2 * len(METRICS)
+    per_exe: dict[str, list] = {}
+    per_proc = []
+    for key, (exe, cmdline, *values) in summary_a.items():
+        acc = [0] * size
+        _accumulate(acc, 0, values)
+        other = summary_b.get(key)
+        if other is not None:
+            _accumulate(acc, 1, other[2:])
+        per_proc.append((cmdline, acc, exe))
+    for key, (exe, cmdline, *values) in summary_b.items():
+        if key not in summary_a:
+            acc = [0] * size
+            _accumulate(acc, 1, values)
+            per_proc.append((cmdline, acc, exe))
+    for _cmdline, acc, exe in per_proc:
+        exe_acc = per_exe.get(exe)
+        if exe_acc is None:
+            per_exe[exe] = acc.copy()
+        else:
+            _merge(exe_acc, acc)
+    total = [0] * size
+    for exe_acc in per_exe.values():
+        _merge(total, exe_acc)
+    return total, per_exe, [(cmdline, acc) for cmdline, acc, _exe in per_proc]
+
+
+def delta(acc: list, metric: str) -> tuple:
+    """
+    Return (value a, value b, b - a) of metric of accumulated values.
+    """
+    idx = 2 + list(METRICS).index(metric)
+    value_a = acc[idx]
+    value_b = acc[idx + len(METRICS)]
+    return value_a, value_b, value_b - value_a
+
+
+def status(acc: list) -> str:
+    """
+    Return status of accumulated values of a process: added, removed or
+    changed.
+    """
+    if not acc[0]:
+        return "added"
+    if not acc[1]:
+        return "removed"
+    return "changed"
+
+
+def format_value(value: float, unit: str, sign: bool = False) -> str:
+    """
+    Format metric value with unit (with sign if sign is True).
+    """
+    plus = "+" if sign else ""
+    if unit == "s":
+        return f"{value:{plus}.3f} s"
+    return f"{value:{plus}d} {unit:s}"
+
+
+def percent(value_a: float, value_b: float) -> str:
+    """
+    Format relative change from value_a to value_b.
+    """
+    if not value_a:
+        return "" if not value_b else "new"
+    return f"{(value_b - value_a) / value_a * 100:+.1f} %"
+
+
+def rank(args: argparse.Namespace, entries: list) -> list:
+    """
+    Rank entries (name, accumulated values) by absolute change of sort
+    metric (largest first), keep only changed ones (up to limit).
+    """
+    changed = [
+        entry
+        for entry in entries
+        if delta(entry[1], args.sort)[2] or status(entry[1]) != "changed"
+    ]
+    changed.sort(key=lambda entry: (-abs(delta(entry[1], args.sort)[2]), entry[0]))
+    if args.limit > 0:
+        changed = changed[: args.limit]
+    return changed
+
+
+def rows_of(kind: str, ranked: list) -> list[list[str]]:
+    """
+    Build output rows of ranked entries (see rank) of kind "exe" or
+    "process".
+    """
+    rows = []
+    for name, acc in ranked:
+        row = [kind, name, status(acc), f"{acc[0]:d}", f"{acc[1]:d}"]
+        for metric, (_title, unit) in METRICS.items():
+            value_a, value_b, value_delta = delta(acc, metric)
+            row += [
+                format_value(value_a, unit),
+                format_value(value_b, unit),
+                format_value(value_delta, unit, True),
+                percent(value_a, value_b),
+            ]
+        rows.append(row)
+    return rows
+
+
+def headers_of(name: str) -> list[str]:
+    """
+    Return headers of output rows (see rows_of), name is the title of the
+    name column.
+    """
+    headers = ["kind", name, "status", "count a", "count b"]
+    for title, _unit in METRICS.values():
+        headers += [f"{title:s} a", f"{title:s} b", f"{title:s} delta", "change"]
+    return headers
+
+
+def print_summary(total: list, counts: tuple[int, int, int]) -> None:
+    """
+    Print summary of diff: totals and numbers of matched, added and removed
+    processes.
+    """
+    print(f"processes: {total[0]:d} -> {total[1]:d}")
+    print(f"matched: {counts[0]:d}, added: {counts[1]:d}, removed: {counts[2]:d}")
+    for metric, (title, unit) in METRICS.items():
+        value_a, value_b, value_delta = delta(total, metric)
+        print(
+            f"{title:s}: {format_value(value_a, unit):s}"
+            f" -> {format_value(value_b, unit):s}"
+            f" ({format_value(value_delta, unit, True):s},"
+            f" {percent(value_a, value_b) or '0 %':s})"
+        )
+
+
+def diff(args: argparse.Namespace) -> int:
+    """
+    Print differences between two traces.
+    Return 1 if the total of the sort metric increased by more than
+    args.fail_above percent, 0 otherwise.
+    """
+    summary_a, summary_b = uproctrace.parallel.map_jobs(
+        functools.partial(summarize, use_index=not args.no_index),
+        args.trace,
+        args.jobs,
+    )
+    total, per_exe, per_proc = compare(summary_a, summary_b)
+    matched = sum(1 for key in summary_a if key in summary_b)
+    exe_ranked = rank(args, list(per_exe.items()))
+    proc_ranked = rank(args, per_proc)
+
+    if args.format in ("csv", "json"):
+        headers = headers_of("name")
+        rows = rows_of("exe", exe_ranked) + rows_of("process", proc_ranked)
+        if args.format == "csv":
+            uproctrace.formatting.print_csv(headers, rows)
+        else:
+            uproctrace.formatting.print_json(headers, rows)
+    else:
+        print_summary(
+            total, (matched, len(summary_b) - matched, len(summary_a) - matched)
+        )
+        print()
+        print("per executable:")
+        rows = rows_of("exe", exe_ranked)
+        # short executable names (if unique), full names are available as CSV
+        # and JSON
+        names = uproctrace.formatting.short_paths([row[1] for row in rows])
+        rows = [[row[0], name] + row[2:] for row, name in zip(rows, names)]
+        print(tabulate.tabulate([row[1:] for row in rows], headers_of("exe")[1:]))
+        print()
+        print("per process:")
+        rows = rows_of("process", proc_ranked)
+        print(tabulate.tabulate([row[1:] for row in rows], headers_of("cmdline")[1:]))
+
+    if args.fail_above is not None:
+        value_a, value_b, _value_delta = delta(total, args.sort)
+        if value_b > value_a * (1 + args.fail_above / 100):
+            return 1
+    return 0
@@ -5,7 +5,11 @@
 Dumping of uproctrace protobuf 2 events.
 """
 
+import itertools
+
 import uproctrace.parse
+import uproctrace.query
+import uproctrace.uproctrace_pb2 as pb2
 
 
 def dump_event(proto_file, out) -> bool:
@@ -18,9 +22,73 @@ def dump_event(proto_file, out) -> bool:
     if pb2_ev is None:
         return False
     # dump event
-    print('event {', file=out)
-    for line in repr(pb2_ev).split('\n'):
-        if line != '':
-            print('  ' + line, file=out)
-    print('}', file=out)
+    _dump(pb2_ev, out)
     return True
+
+
+def dump_events(proto_file, out) -> None:
+    """
+    Read all events from f and dump them to out.
+    """
+    for pb2_ev in uproctrace.parse.read_events(proto_file):
+        _dump(pb2_ev, out)
+
+
+def dump_selected_events(proto_file, processes, out, window=None, where=None) -> None:
+    """
+    Dump the events from f that happened in a time window (since, until)
+    (see timeindex.TimeIndex.window) and/or belong to processes matching a
+    filter expression where (see module query) to out.
+    processes are the processes of f, their time index and event offsets are
+    used to find the events without reading the whole trace.
+    The string table events of an interned trace (see module stringtable)
+    before the last selected event are dumped as well, so the ids in the
+    selected events can be resolved.
+    """
+    mask = uproctrace.query.select_mask(processes, where)
+    if window is None:
+        proc_ids = itertools.compress(range(len(mask)), mask)
+        offsets = [
+            offset
+            for proc_id in proc_ids
+            for offset in processes.getEventOffsets(proc_id)
+        ]
+    else:
+        time_index = processes.time_index
+        t_begin, t_end = time_index.window(*window)
+        offsets = [
+            processes.getEventOffsets(proc_id)[0]
+            for proc_id in time_index.began(t_begin, t_end)
+            if mask is None or mask[proc_id]
+        ]
+        offsets += [
+            processes.getEventOffsets(proc_id)[1]
+            for proc_id in time_index.ended(t_begin, t_end)
+            if mask is None or mask[proc_id]
+        ]
+    offsets = sorted(offset for offset in offsets if offset is not None)
+    if offsets:
+        # string tables the selected events of an interned trace may refer to
+        offsets = sorted(
+            offsets
+            + [
+                offset
+                for offset in processes.string_table_offsets
+                if offset < offsets[-1]
+            ]
+        )
+    for offset in offsets:
+        data = uproctrace.parse.read_payload(proto_file, offset)
+        if data is not None:
+            _dump(pb2.event.FromString(data), out)
+
+
+def _dump(pb2_ev, out) -> None:
+    """
+    Dump an event to out.
+    """
+    print("event {", file=out)
+    for line in repr(pb2_ev).split("\n"):
+        if line != "":
+            print("  " + line, file=out)
+    print("}", file=out)
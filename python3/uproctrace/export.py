@@ -0,0 +1,233 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Export of processes to a columnar binary file: "upt-tool export".
+
+The export file (<trace>.uptc) contains one typed row per process, stored
+column-wise in batches of up to BATCH_SIZE rows, so it can be written and
+read without holding all rows in memory.
+
+The file consists of a header followed by the batches. Each batch consists
+of a batch header and the arrays of the columns (in native byte order, each
+padded to a multiple of 8 bytes, like index files), which are
+memory-mapped when reading:
+  - the integer and float columns in COLUMNS (-1 for missing ids),
+  - the metrics of columns.ATTRS (0 for missing values),
+  - a null mask (1 byte per row) per metric and per string column,
+  - per string column in STRING_COLUMNS, an offsets array (rows + 1 entries)
+    into the UTF-8 data of the column (string of row i is
+    data[offsets[i]:offsets[i + 1]]); the arguments of the command line are
+    separated by NUL characters.
+The offsets/data layout is the one of Arrow string arrays, so the buffers can
+be wrapped without copying (e.g. numpy.frombuffer, pyarrow.Array.from_buffers).
+"""
+
+import array
+import itertools
+import mmap
+import struct
+import typing
+
+import uproctrace.columns
+import uproctrace.files
+import uproctrace.processes
+
+# magic bytes and version of export file format
+MAGIC = b"uptexp01"
+# value to detect byte order
+BYTE_ORDER_CHECK = 0x0102030405060708
+
+# header: magic, byte order check, number of rows
+_HEADER = struct.Struct("=8sQQ")
+
+# maximum number of rows per batch
+BATCH_SIZE = 65536
+
+# id columns: name -> type code
+COLUMNS = {
+    "proc_id": "q",
+    "pid": "q",
+    "ppid": "q",
+    "parent": "q",
+}
+
+# string columns (null mask, offsets and data)
+STRING_COLUMNS = ["exe", "cwd", "cmdline"]
+
+# batch header: number of rows, size of data of each string column
+_BATCH_HEADER = struct.Struct("=Q" + "Q" * len(STRING_COLUMNS))
+
+
+def export_filename(upt_trace: str) -> str:
+    """
+    Return default file name of export file for trace file.
+    """
+    return upt_trace + ".uptc"
+
+
+def _padded(size: int) -> int:
+    """
+    Return size padded to multiple of 8 bytes.
+    """
+    return (size + 7) // 8 * 8
+
+
+def _layout(batch_header: tuple) -> list[tuple[str, str, int]]:
+    """
+    Return layout of arrays of a batch: list of (name, type code, number of
+    entries) for batch header values.
+    """
+    rows = batch_header[0]
+    layout = [(name, code, rows) for name, code in COLUMNS.items()]
+    layout += [(attr, code, rows) for attr, code in uproctrace.columns.ATTRS.items()]
+    layout += [("mask " + attr, "B", rows) for attr in uproctrace.columns.ATTRS]
+    for name, size in zip(STRING_COLUMNS, batch_header[1:]):
+        layout += [
+            ("mask " + name, "B", rows),
+            ("offsets " + name, "q", rows + 1),
+            ("data " + name, "B", size),
+        ]
+    return layout
+
+
+def _string_value(proc: uproctrace.processes.Process, name: str) -> str | None:
+    """
+    Return value of string column of process (None if not available).
+    """
+    if name == "cmdline":
+        cmdline = proc.cmdline
+        return None if cmdline is None else "\0".join(cmdline)
+    return getattr(proc, name)
+
+
+def _string_arrays(arrays: dict, encoded: dict[str, list[bytes]]) -> list[int]:
+    """
+    Add offsets and data arrays of encoded string columns (name -> list of
+    UTF-8 strings) to arrays. Return sizes of data of string columns.
+    """
+    sizes = []
+    for name in STRING_COLUMNS:
+        arrays["offsets " + name] = array.array(
+            "q", itertools.chain((0,), itertools.accumulate(map(len, encoded[name])))
+        )
+        arrays["data " + name] = b"".join(encoded[name])
+        sizes.append(len(arrays["data " + name]))
+    return sizes
+
+
+def _build_batch(
+    processes: uproctrace.processes.Processes, proc_ids: typing.Sequence[int]
+) -> tuple[tuple, dict]:
+    """
+    Build batch of rows of processes with proc_ids.
+    Return batch header and arrays (name -> array).
+    """
+    arrays = {name: array.array(code) for name, code in COLUMNS.items()}
+    encoded: dict[str, list[bytes]] = {name: [] for name in STRING_COLUMNS}
+    for name in STRING_COLUMNS:
+        arrays["mask " + name] = bytearray()
+    for proc_id in proc_ids:
+        proc = processes.getProcess(proc_id)
+        parent = proc.parent
+        ppid = proc.ppid
+        arrays["proc_id"].append(proc_id)
+        arrays["pid"].append(proc.pid)
+        arrays["ppid"].append(-1 if ppid is None else ppid)
+        arrays["parent"].append(-1 if parent is None else parent.proc_id)
+        for name in STRING_COLUMNS:
+            value = _string_value(proc, name)
+            arrays["mask " + name].append(value is not None)
+            encoded[name].append(
+                b"" if value is None else value.encode(errors="replace")
+            )
+    # metrics: gather from columnar table
+    columns = processes.columns
+    for attr, code in uproctrace.columns.ATTRS.items():
+        column = columns.column(attr)
+        mask = columns.mask(attr)
+        arrays[attr] = array.array(code, map(column.__getitem__, proc_ids))
+        arrays["mask " + attr] = bytearray(map(mask.__getitem__, proc_ids))
+    return (len(proc_ids), *_string_arrays(arrays, encoded)), arrays
+
+
+def _write_batch(export_file, batch_header: tuple, arrays: dict) -> None:
+    """
+    Write batch (see _build_batch) to export file.
+    """
+    export_file.write(_BATCH_HEADER.pack(*batch_header))
+    for name, _code, _cnt in _layout(batch_header):
+        export_file.write(memoryview(arrays[name]).cast("B"))
+        pos = export_file.tell()
+        export_file.write(bytes(_padded(pos) - pos))
+
+
+def write_export(
+    filename: str,
+    processes: uproctrace.processes.Processes,
+    proc_ids: typing.Sequence[int] | None = None,
+) -> int:
+    """
+    Write processes with proc_ids (all processes if None) to export file,
+    batch by batch. The file is replaced atomically.
+    Return number of rows written.
+    """
+    if proc_ids is None:
+        proc_ids = range(len(processes.columns))
+    with uproctrace.files.replace_file(filename) as tmp_filename:
+        with open(tmp_filename, "wb") as export_file:
+            export_file.write(_HEADER.pack(MAGIC, BYTE_ORDER_CHECK, len(proc_ids)))
+            for begin in range(0, len(proc_ids), BATCH_SIZE):
+                _write_batch(
+                    export_file,
+                    *_build_batch(processes, proc_ids[begin : begin + BATCH_SIZE]),
+                )
+    return len(proc_ids)
+
+
+def read_export(filename: str) -> typing.Iterator[dict]:
+    """
+    Read export file (memory-mapped).
+    Return iterator over batches: mapping of array name (see module
+    docstring: column name, "mask <column>", "offsets <column>" and
+    "data <column>") to memoryview of array.
+    Raise ValueError if the file is not a valid export file.
+    """
+    with open(filename, "rb") as export_file:
+        mapped = mmap.mmap(export_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < _HEADER.size or _HEADER.unpack_from(mapped)[:2] != (
+        MAGIC,
+        BYTE_ORDER_CHECK,
+    ):
+        raise ValueError(f"{filename:s}: not an export file (of this machine)")
+    data = memoryview(mapped)
+    pos = _HEADER.size
+    while pos < len(mapped):
+        if pos + _BATCH_HEADER.size > len(mapped):
+            raise ValueError(f"{filename:s}: truncated")
+        batch_header = _BATCH_HEADER.unpack_from(mapped, pos)
+        pos += _BATCH_HEADER.size
+        batch = {}
+        for name, code, cnt in _layout(batch_header):
+            end = pos + cnt * struct.calcsize(code)
+            if end > len(mapped):
+                raise ValueError(f"{filename:s}: truncated")
+            batch[name] = data[pos:end].cast(code)
+            pos = _padded(end)
+        yield batch
+
+
+def strings(batch: dict, name: str) -> list[str | None]:
+    """
+    Decode string column of a batch (see read_export).
+    """
+    offsets = batch["offsets " + name]
+    data = batch["data " + name]
+    return [
+        (
+            bytes(data[offsets[idx] : offsets[idx + 1]]).decode(errors="replace")
+            if valid
+            else None
+        )
+        for idx, valid in enumerate(batch["mask " + name])
+    ]
@@ -0,0 +1,29 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Writing files that are replaced atomically (index files, databases, exported,
+compressed, interned and merged traces).
+"""
+
+import contextlib
+import os
+import typing
+
+
+@contextlib.contextmanager
+def replace_file(filename: str) -> typing.Iterator[str]:
+    """
+    Context manager for replacing file atomically: yield name of temporary
+    file (next to filename) to write. If the block completes, the temporary
+    file replaces filename, otherwise (exception) it is removed.
+    """
+    tmp_filename = f"{filename:s}.{os.getpid():d}.tmp"
+    if os.path.exists(tmp_filename):
+        os.unlink(tmp_filename)  # left over, e.g. process with same pid killed
+    try:
+        yield tmp_filename
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.unlink(tmp_filename)
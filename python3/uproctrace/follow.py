@@ -0,0 +1,71 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Following a trace file while it is being written.
+"""
+
+import os
+import sys
+import time
+import typing
+
+import uproctrace.index
+import uproctrace.processes
+
+# default interval for polling trace file (in s)
+INTERVAL = 1.0
+
+
+def wait_for_growth(proto_file, size: int, interval: float = INTERVAL) -> int:
+    """
+    Wait until trace file (proto_file) is larger or smaller than size
+    (i.e. data has been appended or the file has been truncated).
+    Poll file size every interval seconds.
+    Return new size of file.
+    """
+    while True:
+        new_size = os.fstat(proto_file.fileno()).st_size
+        if new_size != size:
+            return new_size
+        time.sleep(interval)
+
+
+def separate(count: int) -> None:
+    """
+    Separate the output for the next update (count is the number of outputs
+    so far): clear the terminal or print an empty line if standard output is
+    not a terminal.
+    """
+    if sys.stdout.isatty():
+        sys.stdout.write("\033[H\033[J")
+    elif count > 0:
+        sys.stdout.write("\n")
+
+
+def follow_processes(
+    upt_trace: str, use_index: bool = True, interval: float = INTERVAL
+) -> typing.Iterator[uproctrace.processes.Processes]:
+    """
+    Follow trace file while it is being written (only plain trace files,
+    not compressed ones, databases or directories of shards).
+    Yield the processes after loading the trace and again whenever events
+    have been appended (the same object is updated incrementally).
+    If the trace file is truncated (e.g. a new trace is started), the
+    processes are loaded again (a new object is yielded).
+    This runs forever, stop iteration to stop following the trace.
+    """
+    with open(upt_trace, "rb") as proto_file:
+        processes = uproctrace.index.load_processes(upt_trace, use_index)
+        yield processes
+        # check for events appended during loading immediately
+        size = processes.trace_offset
+        while True:
+            size = wait_for_growth(proto_file, size, interval)
+            if size < processes.trace_offset:
+                # trace file truncated -> start again
+                proto_file.seek(0)
+                processes = uproctrace.processes.Processes(proto_file)
+                yield processes
+            elif processes.update(proto_file):
+                yield processes
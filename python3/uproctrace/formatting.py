@@ -5,9 +5,15 @@
 Formatting of metrics to text for UProcTrace.
 """
 
+import collections
+import csv
+import json
+import os
 import re
 import shlex
+import sys
 import time
+import typing
 
 # regular expression for an environment variable assignment
 RE_ENV_VAR = re.compile(r"^(?P<name>[A-Za-z_][A-Za-z0-9_]*)=(?P<value>.*)$")
@@ -117,6 +123,18 @@ def kb2str(size_kb: int) -> str:
     return txt
 
 
+def short_paths(paths: list[str]) -> list[str]:
+    """
+    Shorten paths (e.g. of executables) to their base names, but keep the full
+    path of all paths whose base name is not unique.
+    """
+    counts = collections.Counter(os.path.basename(path) for path in set(paths))
+    return [
+        os.path.basename(path) if counts[os.path.basename(path)] == 1 else path
+        for path in paths
+    ]
+
+
 def str2str(str_or_none: str) -> str:
     """
     Convert string (or None) to string.
@@ -136,3 +154,31 @@ def timestamp2str(timestamp: float) -> str:
     nsec = int((timestamp - sec) * 1e9)
     time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
     return time_str + f".{nsec:09d}"
+
+
+def print_csv(headers: list[str], rows: typing.Iterable[list]) -> None:
+    """
+    Print table as CSV (";" as delimiter, all fields quoted) to standard output.
+    Rows are printed as they are produced by rows.
+    """
+    wr = csv.writer(sys.stdout, delimiter=";", quoting=csv.QUOTE_ALL)
+    wr.writerow(headers)
+    for row in rows:
+        wr.writerow(row)
+
+
+def print_json(headers: list[str], rows: list[list[str]]) -> None:
+    """
+    Print table as JSON object with "headers" and "rows" to standard output.
+    """
+    data = {"headers": headers, "rows": rows}
+    print(json.dumps(data, indent=2))
+
+
+def print_jsonl(headers: list[str], rows: typing.Iterable[list]) -> None:
+    """
+    Print table as JSON Lines (one JSON object per row, with headers as keys)
+    to standard output. Rows are printed as they are produced by rows.
+    """
+    for row in rows:
+        sys.stdout.write(json.dumps(dict(zip(headers, row))) + "\n")
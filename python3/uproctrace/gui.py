@@ -10,6 +10,7 @@ import signal
 
 import uproctrace.formatting
 import uproctrace.gui_glade
+import uproctrace.index
 import uproctrace.processes
 
 import gi
@@ -46,13 +47,27 @@ class UptGui(Gtk.Application):
     PROC_FILE_SYS_OPS_TEXT = 13
     PROC_CTX_SW = 14
     PROC_CTX_SW_TEXT = 15
-
-    def __init__(self, proto_filename):
+    PROC_INCL_COUNT = 16
+    PROC_INCL_COUNT_TEXT = 17
+    PROC_INCL_CPU_TIME = 18
+    PROC_INCL_CPU_TIME_TEXT = 19
+    PROC_INCL_MAX_RSS_KB = 20
+    PROC_INCL_MAX_RSS_KB_TEXT = 21
+
+    def __init__(
+        self, proto_filename, use_index: bool = True, follow_interval: float = None
+    ):
         """
         Construct the GUI.
+        If follow_interval is set, poll the trace file every follow_interval
+        seconds and show appended events.
         """
         super().__init__()
         self.proto_filename = proto_filename
+        self.use_index = use_index
+        self.follow_interval = follow_interval
+        self.follow_file = None
+        self.follow_timeout = None
         self.builder = None
         self.clipboard = None
         self.show_processes_as_tree = None
@@ -163,6 +178,28 @@ class UptGui(Gtk.Application):
             uproctrace.formatting.int2str,
             uproctrace.formatting.add_none(proc.n_v_csw, proc.n_iv_csw),
         )
+        inc = proc.inclusive
+        self.fillProcessesEntryAttr(
+            proc_iter,
+            self.PROC_INCL_COUNT,
+            self.PROC_INCL_COUNT_TEXT,
+            uproctrace.formatting.int2str,
+            inc.count,
+        )
+        self.fillProcessesEntryAttr(
+            proc_iter,
+            self.PROC_INCL_CPU_TIME,
+            self.PROC_INCL_CPU_TIME_TEXT,
+            uproctrace.formatting.duration2str,
+            inc.cpu_time,
+        )
+        self.fillProcessesEntryAttr(
+            proc_iter,
+            self.PROC_INCL_MAX_RSS_KB,
+            self.PROC_INCL_MAX_RSS_KB_TEXT,
+            uproctrace.formatting.kb2str,
+            inc.max_rss_kb,
+        )
 
     def fillProcessesEntryAttr(
         self, proc_iter, col: int, text_col: int, val2str_func, val
@@ -318,10 +355,35 @@ class UptGui(Gtk.Application):
         Open a trace file.
         """
         # load new data
-        with open(proto_filename, "rb") as proto_file:
-            self.processes = uproctrace.processes.Processes(proto_file)
+        self.processes = uproctrace.index.load_processes(proto_filename, self.use_index)
         # populate processes view
         self.populateProcesses()
+        # follow trace file
+        if self.follow_interval is not None:
+            self.follow_file = open(  # pylint: disable=consider-using-with
+                proto_filename, "rb"
+            )
+            self.follow_timeout = GLib.timeout_add(
+                int(self.follow_interval * 1000), self.onFollowTimeout
+            )
+
+    def onFollowTimeout(self):
+        """
+        Follow timeout: add events appended to trace file.
+        """
+        if self.processes.update(self.follow_file):
+            # re-populate processes view, keep selected process
+            proc_id = None
+            proc_sel = self.wid_processes_view.get_selection()
+            if proc_sel is not None:
+                proc_iter = proc_sel.get_selected()[1]
+                if proc_iter is not None:
+                    proc_id = self.wid_processes_tree.get_value(
+                        proc_iter, self.PROC_PROC_ID
+                    )
+            self.populateProcesses()
+            self.selectProcess(proc_id)
+        return GLib.SOURCE_CONTINUE
 
     def populateProcesses(self):
         """
@@ -379,7 +441,7 @@ class UptGui(Gtk.Application):
         """
         Show details of process.
         """
-        # pylint: disable=R0914
+        # pylint: disable=R0914,R0915
         # forget old details
         self.wid_details_tree.clear()
         # leave if invalid proc_id
@@ -462,6 +524,40 @@ class UptGui(Gtk.Application):
         add_sum("page faults", ["major", "minor"], [proc.maj_flt, proc.min_flt])
         add("pid", uproctrace.formatting.int2str(proc.pid))
         add("ppid", uproctrace.formatting.int2str(proc.ppid))
+        # add inclusive metrics of process and all its descendants
+        inc = proc.inclusive
+        tree_iter = add("process tree", f"{inc.count:d} processes")
+        add_sum(
+            "context switches",
+            ["involuntary", "voluntary"],
+            [inc.n_iv_csw, inc.n_v_csw],
+            tree_iter,
+        )
+        add("CPU time", uproctrace.formatting.duration2str(inc.cpu_time), tree_iter)
+        add_sum(
+            "file system operations",
+            ["input", "output"],
+            [inc.in_block, inc.ou_block],
+            tree_iter,
+        )
+        add(
+            "max. resident memory",
+            uproctrace.formatting.kb2str(inc.max_rss_kb),
+            tree_iter,
+        )
+        add_sum(
+            "page faults", ["major", "minor"], [inc.maj_flt, inc.min_flt], tree_iter
+        )
+        add(
+            "system CPU time",
+            uproctrace.formatting.duration2str(inc.sys_time),
+            tree_iter,
+        )
+        add(
+            "user CPU time",
+            uproctrace.formatting.duration2str(inc.user_time),
+            tree_iter,
+        )
         add("system CPU time", uproctrace.formatting.duration2str(proc.sys_time))
         add("user CPU time", uproctrace.formatting.duration2str(proc.user_time))
         add("working directory", uproctrace.formatting.str2str(proc.cwd))
@@ -496,9 +592,10 @@ class UptGui(Gtk.Application):
             )
 
 
-def run(proto_filename):
+def run(proto_filename, use_index: bool = True, follow_interval: float = None):
     """
     Run the graphical user interface for the specified trace file.
+    If follow_interval is set, follow the trace file while it is being written.
     """
-    app = UptGui(proto_filename)
+    app = UptGui(proto_filename, use_index, follow_interval)
     app.run(None)
@@ -0,0 +1,179 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Histograms with logarithmic buckets for estimating quantiles of metrics.
+"""
+
+import math
+import typing
+
+
+class Histogram:
+    """
+    Histogram with logarithmic buckets.
+
+    Bucket i contains the values in [2 ** (i / RESOLUTION),
+    2 ** ((i + 1) / RESOLUTION)), values <= 0 are counted separately. Only
+    non-empty buckets are stored, so the memory needed does not depend on the
+    number of values. Quantiles are estimated with a relative error of at most
+    2 ** (1 / (2 * RESOLUTION)) - 1 (about 2 %). Histograms can be merged,
+    e.g. to combine the histograms of multiple traces.
+    """
+
+    # number of buckets per factor of 2
+    RESOLUTION = 16
+
+    def __init__(self) -> None:
+        """
+        Initialize empty histogram.
+        """
+        self._buckets: dict[int, int] = {}  # bucket index -> count
+        self._zeros = 0  # count of values <= 0
+        self._count = 0
+        self._min = None
+        self._max = None
+
+    def __len__(self) -> int:
+        """
+        Number of values.
+        """
+        return self._count
+
+    @classmethod
+    def _bucketBounds(cls, idx: int, factor: int = 1) -> tuple[float, float]:
+        """
+        Return lower and upper bound of bucket idx (with buckets combined by
+        factor, see buckets).
+        """
+        return (
+            2.0 ** (idx * factor / cls.RESOLUTION),
+            2.0 ** ((idx + 1) * factor / cls.RESOLUTION),
+        )
+
+    def add(self, value: float) -> None:
+        """
+        Add a value.
+        """
+        self.addValues((value,))
+
+    def addValues(self, values: typing.Iterable[float]) -> None:
+        """
+        Add values.
+        """
+        buckets = self._buckets
+        log2 = math.log2
+        res = self.RESOLUTION
+        count = 0
+        vmin = self._min
+        vmax = self._max
+        for value in values:
+            if value <= 0:
+                self._zeros += 1
+            else:
+                idx = math.floor(log2(value) * res)
+                buckets[idx] = buckets.get(idx, 0) + 1
+            if vmin is None:
+                vmin = vmax = value
+            elif value < vmin:
+                vmin = value
+            elif value > vmax:
+                vmax = value
+            count += 1
+        self._count += count
+        self._min = vmin
+        self._max = vmax
+
+    def merge(self, other: "Histogram") -> None:
+        """
+        Add all values of other histogram.
+        """
+        # pylint: disable=protected-access
+        buckets = self._buckets
+        for idx, count in other._buckets.items():
+            buckets[idx] = buckets.get(idx, 0) + count
+        self._zeros += other._zeros
+        self._count += other._count
+        if other._min is not None:
+            self._min = other._min if self._min is None else min(self._min, other._min)
+            self._max = other._max if self._max is None else max(self._max, other._max)
+
+    def quantile(self, quant: float) -> float | None:
+        """
+        Estimate quantile (0 <= quant <= 1, e.g. 0.9 for the 90th percentile)
+        of values. Return None if the histogram is empty.
+        """
+        if not self._count:
+            return None
+        # rank of value (nearest rank method)
+        rank = max(1, math.ceil(quant * self._count))
+        if rank <= self._zeros:
+            return min(max(0, self._min), self._max)
+        cum = self._zeros
+        for idx in sorted(self._buckets):
+            cum += self._buckets[idx]
+            if cum >= rank:
+                # geometric mean of bucket bounds, clamped to range of values
+                low, high = self._bucketBounds(idx)
+                return min(max(math.sqrt(low * high), self._min), self._max)
+        return self._max  # not reached, rank <= count
+
+    def buckets(
+        self, factor: int = 1, max_rows: int | None = None
+    ) -> list[tuple[float, float, int]]:
+        """
+        Return list of (lower bound, upper bound, count) of buckets from the
+        lowest to the highest non-empty bucket (including empty buckets in
+        between). Values <= 0 are returned as bucket (0, 0, count) first.
+        If factor is greater than 1, factor buckets are combined into one.
+        If there are more than max_rows buckets (not counting values <= 0),
+        the lowest buckets are combined into one.
+        """
+        result = []
+        if self._zeros:
+            result.append((0, 0, self._zeros))
+        if not self._buckets:
+            return result
+        combined: dict[int, int] = {}
+        for idx, count in self._buckets.items():
+            combined[idx // factor] = combined.get(idx // factor, 0) + count
+        low_idx = min(combined)
+        high_idx = max(combined)
+        if max_rows is not None and high_idx - low_idx + 1 > max_rows:
+            # combine lowest buckets
+            cut_idx = high_idx - max_rows + 1
+            low = self._bucketBounds(low_idx, factor)[0]
+            high = self._bucketBounds(cut_idx, factor)[1]
+            count = sum(count for idx, count in combined.items() if idx <= cut_idx)
+            result.append((low, high, count))
+            low_idx = cut_idx + 1
+        for idx in range(low_idx, high_idx + 1):
+            result.append((*self._bucketBounds(idx, factor), combined.get(idx, 0)))
+        return result
+
+    def render(
+        self, fmt: typing.Callable[[float], str], width: int = 40, max_rows: int = 20
+    ) -> list[str]:
+        """
+        Render histogram as text lines (one per factor of 2 of the values)
+        with bars of up to width characters. fmt is used to format the bounds.
+        If there are more than max_rows lines (not counting values <= 0), the
+        lowest lines are combined.
+        """
+        buckets = self.buckets(self.RESOLUTION, max_rows)
+        if not buckets:
+            return []
+        labels = [
+            fmt(low) if high == 0 else f"{fmt(low):s} - {fmt(high):s}"
+            for low, high, _count in buckets
+        ]
+        label_width = max(map(len, labels))
+        max_count = max(count for _low, _high, count in buckets)
+        count_width = len(str(max_count))
+        lines = []
+        for label, (_low, _high, count) in zip(labels, buckets):
+            hashes = "#" * math.ceil(count * width / max_count)
+            lines.append(
+                f"{label:>{label_width}s} {count:{count_width}d} {hashes:s}".rstrip()
+            )
+        return lines
@@ -0,0 +1,446 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Index files for trace files.
+
+An index file (<trace>.idx) stores the process tree, the metrics of all
+processes and the offsets of their events in the trace file. It is only used
+if size and modification time of the trace file match the values recorded in
+the index file. This way, a trace file only needs to be parsed once.
+Index files are only written on request (see write_index), loading a trace
+uses a valid index, but does not create one (the directory of the trace might
+be read-only or shared).
+
+The index file consists of a header followed by arrays (in native byte order,
+each padded to a multiple of 8 bytes), which are memory-mapped when reading.
+"""
+
+import array
+import mmap
+import os
+import struct
+
+import uproctrace.columns
+import uproctrace.compress
+import uproctrace.files
+import uproctrace.parse
+import uproctrace.processes
+import uproctrace.shards
+import uproctrace.sqlite
+
+# magic bytes and version of index file format
+MAGIC = b"uptidx02"
+# value to detect byte order
+BYTE_ORDER_CHECK = 0x0102030405060708
+
+# header: magic, byte order check, trace size, trace modification time (ns),
+#         trace offset behind last event, number of processes,
+#         number of entries in children, current, toplevel and string_tables
+#         arrays
+_HEADER = struct.Struct("=8sQQqQQQQQQ")
+
+# arrays with one entry per process: name -> type code
+# (-1 is used for missing values)
+PROC_ARRAYS = {
+    "pid": "q",
+    "ppid": "q",
+    "parent": "q",
+    "begin_offset": "q",
+    "end_offset": "q",
+}
+
+
+def index_filename(upt_trace: str) -> str:
+    """
+    Return file name of index file for trace file.
+    """
+    return upt_trace + ".idx"
+
+
+def _padded(size: int) -> int:
+    """
+    Return size padded to multiple of 8 bytes.
+    """
+    return (size + 7) // 8 * 8
+
+
+def _trace_stat(proto_file) -> tuple[int, int]:
+    """
+    Return size and modification time (in ns) of trace file.
+    """
+    try:
+        stat = os.fstat(proto_file.fileno())
+    except OSError:  # compressed trace (see module compress)
+        stat = os.stat(proto_file.name)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class _IndexProcesses:
+    """
+    Processes of an index, made on access from index and trace file (for
+    looking up environments stored once per trace, see processes.Environs).
+    """
+
+    def __init__(self, index: "Index", proto_file):
+        """
+        Initialize processes of index and trace file (proto_file).
+        """
+        self._index = index
+        self._proto_file = proto_file
+
+    def __len__(self) -> int:
+        """
+        Number of processes.
+        """
+        return len(self._index)
+
+    def __getitem__(self, proc_id: int) -> uproctrace.processes.Process:
+        """
+        Make process with proc_id.
+        """
+        return self._index.makeProcess(self._proto_file, proc_id)
+
+
+class Index:
+    """
+    Index of a trace file.
+    """
+
+    def __init__(self, trace_stat: tuple[int, int], trace_offset: int, arrays: dict):
+        """
+        Initialize index from size and modification time (in ns) of trace
+        file, offset behind last event in trace file and arrays
+        (name -> array or memoryview).
+        The arrays are the ones in PROC_ARRAYS, the columns and masks of
+        columns.ATTRS (named "column <attr>" and "mask <attr>"),
+        "children_begin" (start of children of process i at children_begin[i]),
+        "children" (proc_ids of children), "current" (proc_ids of processes
+        that have not ended), "toplevel" (proc_ids of toplevel processes) and
+        "string_tables" (offsets of string table events in trace file).
+        """
+        self._trace_stat = trace_stat
+        self._trace_offset = trace_offset
+        self._arrays = arrays
+        self._size = len(arrays["pid"])
+        self._columns = uproctrace.columns.Columns(
+            {attr: arrays["column " + attr] for attr in uproctrace.columns.ATTRS},
+            {attr: arrays["mask " + attr] for attr in uproctrace.columns.ATTRS},
+        )
+
+    def __len__(self) -> int:
+        """
+        Number of processes.
+        """
+        return self._size
+
+    @classmethod
+    def build(
+        cls, trace_stat: tuple[int, int], processes: uproctrace.processes.Processes
+    ) -> "Index":
+        """
+        Build index from processes read from a trace file and size and
+        modification time (in ns) of the trace file before reading it.
+        """
+        procs = list(processes.getAllProcesses().values())
+        arrays = {name: array.array(code) for name, code in PROC_ARRAYS.items()}
+        arrays["children_begin"] = array.array("q")
+        arrays["children"] = array.array("q")
+        for proc in procs:
+            begin_offset, end_offset = processes.getEventOffsets(proc.proc_id)
+            ppid = proc.ppid
+            parent = proc.parent
+            arrays["pid"].append(proc.pid)
+            arrays["ppid"].append(-1 if ppid is None else ppid)
+            arrays["parent"].append(-1 if parent is None else parent.proc_id)
+            arrays["begin_offset"].append(-1 if begin_offset is None else begin_offset)
+            arrays["end_offset"].append(-1 if end_offset is None else end_offset)
+            arrays["children_begin"].append(len(arrays["children"]))
+            arrays["children"].extend(child.proc_id for child in proc.children)
+        arrays["children_begin"].append(len(arrays["children"]))
+        columns = processes.columns
+        for attr in uproctrace.columns.ATTRS:
+            arrays["column " + attr] = columns.column(attr)
+            arrays["mask " + attr] = columns.mask(attr)
+        arrays["current"] = array.array("q", [p.proc_id for p in processes.current])
+        arrays["toplevel"] = array.array("q", [p.proc_id for p in processes.toplevel])
+        arrays["string_tables"] = array.array("q", processes.string_table_offsets)
+        return cls(trace_stat, processes.trace_offset, arrays)
+
+    @staticmethod
+    def _layout(size: int, header: tuple) -> list[tuple[str, str, int]]:
+        """
+        Return layout of arrays in index file: list of (name, type code,
+        number of entries) for index with size processes and header values.
+        """
+        children_cnt, current_cnt, toplevel_cnt, string_tables_cnt = header[-4:]
+        layout = [(name, code, size) for name, code in PROC_ARRAYS.items()]
+        for attr, code in uproctrace.columns.ATTRS.items():
+            layout.append(("column " + attr, code, size))
+        for attr in uproctrace.columns.ATTRS:
+            layout.append(("mask " + attr, "B", size))
+        layout += [
+            ("children_begin", "q", size + 1),
+            ("children", "q", children_cnt),
+            ("current", "q", current_cnt),
+            ("toplevel", "q", toplevel_cnt),
+            ("string_tables", "q", string_tables_cnt),
+        ]
+        return layout
+
+    @classmethod
+    def read(cls, filename: str, proto_file) -> "Index | None":
+        """
+        Read index from file (memory-mapped) and check it is valid for trace
+        file (proto_file). Return None if no valid index could be read.
+        """
+        try:
+            with open(filename, "rb") as index_file:
+                mapped = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None  # does not exist or empty
+        if len(mapped) < _HEADER.size:
+            return None
+        header = _HEADER.unpack_from(mapped)
+        trace_stat = header[2:4]
+        if header[:2] != (MAGIC, BYTE_ORDER_CHECK):
+            return None  # no index file or different format
+        if trace_stat != _trace_stat(proto_file):
+            return None  # index file is outdated
+        data = memoryview(mapped)
+        arrays = {}
+        pos = _HEADER.size
+        for name, code, cnt in cls._layout(header[5], header):
+            end = pos + cnt * struct.calcsize(code)
+            if end > len(mapped):
+                return None  # truncated
+            arrays[name] = data[pos:end].cast(code)
+            pos = _padded(end)
+        return cls(trace_stat, header[4], arrays)
+
+    def write(self, filename: str):
+        """
+        Write index to file.
+        The file is replaced atomically, so readers never see a partial index.
+        """
+        children, current, toplevel, string_tables = (
+            self._arrays[name]
+            for name in ("children", "current", "toplevel", "string_tables")
+        )
+        header = (
+            MAGIC,
+            BYTE_ORDER_CHECK,
+            *self._trace_stat,
+            self._trace_offset,
+            self._size,
+            len(children),
+            len(current),
+            len(toplevel),
+            len(string_tables),
+        )
+        with uproctrace.files.replace_file(filename) as tmp_filename:
+            with open(tmp_filename, "wb") as index_file:
+                index_file.write(_HEADER.pack(*header))
+                pos = _HEADER.size
+                for name, _code, _cnt in self._layout(self._size, header):
+                    data = memoryview(self._arrays[name]).cast("B")
+                    index_file.write(data)
+                    pos += len(data)
+                    index_file.write(bytes(_padded(pos) - pos))
+                    pos = _padded(pos)
+
+    @property
+    def columns(self) -> uproctrace.columns.Columns:
+        """
+        Columnar table of process metrics (row index is proc_id).
+        """
+        return self._columns
+
+    @property
+    def current(self):
+        """
+        proc_ids of processes that have not ended.
+        """
+        return self._arrays["current"]
+
+    @property
+    def string_table_offsets(self):
+        """
+        Offsets of string table events in trace file.
+        """
+        return self._arrays["string_tables"]
+
+    @property
+    def toplevel(self):
+        """
+        proc_ids of toplevel processes.
+        """
+        return self._arrays["toplevel"]
+
+    @property
+    def trace_offset(self) -> int:
+        """
+        Offset in trace file behind the last event.
+        """
+        return self._trace_offset
+
+    def array(self, name: str):
+        """
+        Return array with one entry per process (see PROC_ARRAYS).
+        """
+        return self._arrays[name]
+
+    def children(self, proc_id: int):
+        """
+        Return proc_ids of children of process.
+        """
+        children_begin = self._arrays["children_begin"]
+        return self._arrays["children"][
+            children_begin[proc_id] : children_begin[proc_id + 1]
+        ]
+
+    def loadProcess(self, proto_file, proc_id: int) -> uproctrace.processes.Process:
+        """
+        Load a single process including its parent and children from trace
+        file (proto_file), without loading all other processes.
+        Parent and children are not linked any further.
+        Return None if there is no process with proc_id.
+        """
+        if proc_id < 0 or proc_id >= self._size:
+            return None
+        proc = self.makeProcess(proto_file, proc_id)
+        parent_proc_id = self._arrays["parent"][proc_id]
+        if parent_proc_id >= 0:
+            proc.setParent(self.makeProcess(proto_file, parent_proc_id))
+        for child_proc_id in self.children(proc_id):
+            child = self.makeProcess(proto_file, child_proc_id)
+            proc.addChild(child)
+            child.setParent(proc)
+        # strings and environments stored in other events can only be looked
+        # up while the trace file is open
+        loaded = [proc] + proc.children
+        if proc.parent is not None:
+            loaded.append(proc.parent)
+        strings = uproctrace.parse.Strings()
+        for offset in self.string_table_offsets:
+            string_table = uproctrace.parse.read_string_table(proto_file, offset)
+            if string_table is not None:
+                strings.add(string_table)
+        for other in loaded:
+            other.setStrings(strings)
+        environs = uproctrace.processes.Environs(_IndexProcesses(self, proto_file))
+        environs.prefetch(loaded)
+        return proc
+
+    def makeProcess(self, proto_file, proc_id: int) -> uproctrace.processes.Process:
+        """
+        Make process (without parent and children) from index and begin event
+        in trace file (proto_file).
+        """
+        proc = uproctrace.processes.Process(proc_id, self._arrays["pid"][proc_id])
+        begin_offset = self._arrays["begin_offset"][proc_id]
+        begin_data = None
+        if begin_offset >= 0:
+            begin_data = uproctrace.parse.read_payload(proto_file, begin_offset)
+        ppid = self._arrays["ppid"][proc_id]
+        values = {}
+        for attr in uproctrace.columns.ATTRS:
+            if self._arrays["mask " + attr][proc_id]:
+                values[attr] = self._arrays["column " + attr][proc_id]
+            else:
+                values[attr] = None
+        proc.restore(begin_data, None if ppid < 0 else ppid, values)
+        return proc
+
+
+def read_index(proto_file, upt_trace: str) -> Index | None:
+    """
+    Read index of trace file (proto_file, named upt_trace).
+    Return index or None if there is no valid index.
+    """
+    return Index.read(index_filename(upt_trace), proto_file)
+
+
+def write_index(
+    proto_file, upt_trace: str, ignore_errors: bool = True, jobs: int = 1
+) -> tuple[Index, uproctrace.processes.Processes]:
+    """
+    Parse trace file (proto_file, named upt_trace) with up to jobs worker
+    processes and write its index.
+    If ignore_errors is True, errors writing the index are ignored, as the
+    index is only an optimization (e.g. the directory might not be writable).
+    Return index and processes.
+    """
+    # get size and modification time before parsing, so the index is not
+    # valid if the trace file is appended to during parsing
+    trace_stat = _trace_stat(proto_file)
+    proto_file.seek(0)
+    processes = uproctrace.processes.Processes(proto_file, jobs=jobs)
+    index = Index.build(trace_stat, processes)
+    try:
+        index.write(index_filename(upt_trace))
+    except OSError:
+        if not ignore_errors:
+            raise
+    return index, processes
+
+
+def load_columns(upt_trace: str, use_index: bool = True, jobs: int = 1):
+    """
+    Load columnar table of process metrics of trace file.
+    Use a valid index file if use_index is True.
+    The trace file is parsed with up to jobs worker processes.
+    If upt_trace is a database (see module sqlite) or a directory of shards
+    (see module shards), load from it instead.
+    """
+    if uproctrace.sqlite.is_database(upt_trace):
+        return uproctrace.sqlite.load_columns(upt_trace)
+    if uproctrace.shards.is_shard_dir(upt_trace):
+        return uproctrace.shards.load_processes(upt_trace).columns
+    with uproctrace.compress.open_trace(upt_trace) as proto_file:
+        index = read_index(proto_file, upt_trace) if use_index else None
+        if index is None:
+            return uproctrace.processes.Processes(proto_file, jobs=jobs).columns
+        return index.columns
+
+
+def load_process(
+    upt_trace: str, proc_id: int, use_index: bool = True
+) -> uproctrace.processes.Process | None:
+    """
+    Load process (including parent and children) with proc_id from trace file.
+    Use a valid index file if use_index is True.
+    If upt_trace is a database (see module sqlite) or a directory of shards
+    (see module shards), load from it instead.
+    Return None if there is no process with proc_id.
+    """
+    if uproctrace.sqlite.is_database(upt_trace):
+        return uproctrace.sqlite.load_process(upt_trace, proc_id)
+    if uproctrace.shards.is_shard_dir(upt_trace):
+        return uproctrace.shards.load_processes(upt_trace).getProcess(proc_id)
+    with uproctrace.compress.open_trace(upt_trace) as proto_file:
+        index = read_index(proto_file, upt_trace) if use_index else None
+        if index is None:
+            return uproctrace.processes.Processes(proto_file).getProcess(proc_id)
+        return index.loadProcess(proto_file, proc_id)
+
+
+def load_processes(
+    upt_trace: str, use_index: bool = True, jobs: int = 1
+) -> uproctrace.processes.Processes:
+    """
+    Load all processes of trace file.
+    Use a valid index file if use_index is True.
+    The trace file is parsed with up to jobs worker processes.
+    If upt_trace is a database (see module sqlite) or a directory of shards
+    (see module shards), load from it instead.
+    """
+    if uproctrace.sqlite.is_database(upt_trace):
+        return uproctrace.sqlite.load_processes(upt_trace)
+    if uproctrace.shards.is_shard_dir(upt_trace):
+        return uproctrace.shards.load_processes(upt_trace)
+    with uproctrace.compress.open_trace(upt_trace) as proto_file:
+        index = read_index(proto_file, upt_trace) if use_index else None
+        if index is None:
+            return uproctrace.processes.Processes(proto_file, jobs=jobs)
+        return uproctrace.processes.Processes(proto_file, index)
@@ -0,0 +1,24 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Parallel processing of traces in multiple worker processes.
+"""
+
+import concurrent.futures
+import typing
+
+
+def map_jobs(func: typing.Callable, items: list, jobs: int = 1) -> typing.Iterator:
+    """
+    Call func for all items and return iterator over the results (in the
+    order of the items).
+    If jobs is greater than 1, use up to jobs worker processes.
+    func, items and results must be picklable in this case.
+    """
+    if jobs <= 1 or len(items) <= 1:
+        yield from map(func, items)
+        return
+    workers = min(jobs, len(items))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(func, items)
@@ -6,34 +6,226 @@ Parsing of uproctrace protobuf 2 events.
 """
 
 import abc
+import contextlib
+import mmap
 import struct
+import sys
+import typing
 
 import uproctrace.uproctrace_pb2 as pb2
 
+# magic bytes in front of each event
+MAGIC = b"upt0"
+# size of event data (32 bit network byte order)
+_SIZE = struct.Struct("!L")
+# size of event header: magic and size of event data
+HEADER_SIZE = len(MAGIC) + _SIZE.size
 
-def read_event(proto_file):
+
+class Reader:
     """
-    Read the first event from proto_file and return it.
-    Return None if no event could be found.
+    Reader for events in a trace file.
+
+    The trace file is memory-mapped if possible, otherwise it is read in large
+    chunks. Events are located by searching for the magic bytes, so corrupted
+    parts of the trace are skipped quickly.
     """
-    # skip till after magic
-    magic = proto_file.read(4)
-    while magic != b"upt0":
-        if len(magic) < 4:
-            return None  # EOF
-        magic = magic[1:] + proto_file.read(1)  # search magic byte for byte
-    # read size of next event (32 bit network byte order)
-    size = proto_file.read(4)
-    if len(size) < 4:
-        return None  # EOF
-    size = struct.unpack("!L", size)[0]
-    # read event data
+
+    # size of chunks to read if trace file cannot be memory-mapped
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, proto_file, offset: int | None = None):
+        """
+        Initialize reader for trace file (proto_file).
+        Reading starts at offset (default: current position of proto_file).
+        """
+        self._proto_file = proto_file
+        self._seekable = proto_file.seekable()
+        if offset is None:
+            offset = proto_file.tell() if self._seekable else 0
+        self._offset = offset
+        self._event_offset = None
+
+    def __iter__(self) -> typing.Iterator[pb2.event]:
+        """
+        Iterate over all (remaining) events in trace file.
+        """
+        return map(pb2.event.FromString, self.payloads())
+
+    def _map(self) -> mmap.mmap | None:
+        """
+        Memory-map trace file, return None if this is not possible.
+        """
+        try:
+            fileno = self._proto_file.fileno()
+            return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # not a real file, not mappable or empty
+            return None
+
+    @property
+    def event_offset(self) -> int | None:
+        """
+        Offset in trace file of the last event read (None if none read yet).
+        """
+        return self._event_offset
+
+    @property
+    def offset(self) -> int:
+        """
+        Offset in trace file behind the last event read.
+        """
+        return self._offset
+
+    def payloads(self) -> typing.Iterator[bytes]:
+        """
+        Iterate over payloads of all (remaining) events in trace file.
+        After the iteration, the trace file is positioned behind the last
+        event read.
+        """
+        # pylint: disable=too-many-branches
+        mapped = self._map()
+        if mapped is None:
+            data, data_offset = b"", self._offset
+            if self._seekable:
+                self._proto_file.seek(self._offset)
+        else:
+            data, data_offset = mapped, 0
+        unpack_from = _SIZE.unpack_from
+        pos = self._offset - data_offset
+        try:
+            while True:
+                find = data.find
+                size = len(data)
+                while True:
+                    # search magic
+                    keep = find(MAGIC, pos)
+                    if keep < 0:
+                        # keep possible start of magic
+                        keep = max(pos, size - len(MAGIC) + 1)
+                        break
+                    begin = keep + HEADER_SIZE
+                    if begin > size:
+                        break  # incomplete header
+                    # size of event data is behind magic
+                    end = begin + unpack_from(data, begin - _SIZE.size)[0]
+                    if end > size:
+                        break  # incomplete event
+                    self._event_offset = data_offset + keep
+                    self._offset = data_offset + end
+                    yield data[begin:end]
+                    pos = end
+                if mapped is not None:
+                    return  # entire file has been searched
+                # read next chunk, keep unprocessed rest of data
+                chunk = self._proto_file.read(self.CHUNK_SIZE)
+                if not chunk:
+                    return  # EOF
+                data = data[keep:] + chunk
+                data_offset += keep
+                pos = 0
+        finally:
+            if mapped is not None:
+                mapped.close()
+            if self._seekable:
+                self._proto_file.seek(self._offset)
+
+    def read(self) -> pb2.event | None:
+        """
+        Read the next event and return it.
+        Return None if no event could be found.
+        """
+        # close payloads generator right away (unmaps, positions trace file)
+        with contextlib.closing(self.payloads()) as payloads:
+            for payload in payloads:
+                return pb2.event.FromString(payload)
+        return None
+
+
+def frame(payload: bytes) -> bytes:
+    """
+    Return event (as stored in trace file: header and payload) for payload.
+    """
+    return MAGIC + _SIZE.pack(len(payload)) + payload
+
+
+def read_payload(proto_file, offset: int) -> bytes | None:
+    """
+    Read the payload of the event at offset in proto_file and return it.
+    Return None if there is no complete event at offset.
+    """
+    proto_file.seek(offset)
+    header = proto_file.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        return None
+    size = _SIZE.unpack_from(header, len(MAGIC))[0]
     data = proto_file.read(size)
     if len(data) < size:
-        return None  # EOF
-    # unpack event
+        return None
+    return data
+
+
+def read_string_table(proto_file, offset: int) -> "StringTable | None":
+    """
+    Read string table event at offset in trace file.
+    Return None if there is no string table event.
+    """
+    data = read_payload(proto_file, offset)
+    if data is None:
+        return None
     pb2_ev = pb2.event.FromString(data)
-    return pb2_ev
+    if not pb2_ev.HasField("string_table"):
+        return None
+    return StringTable(pb2_ev, offset)
+
+
+def read_event(proto_file):
+    """
+    Read the first event from proto_file and return it.
+    Return None if no event could be found.
+    """
+    return Reader(proto_file).read()
+
+
+def read_events(proto_file) -> typing.Iterator[pb2.event]:
+    """
+    Read all events from proto_file.
+    """
+    return iter(Reader(proto_file))
+
+
+class _cached:
+    """
+    Decorator for a property that is computed on first access and then
+    stored in the instance (like functools.cached_property, but without
+    locking overhead).
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, func):
+        """
+        Initialize decorator for function computing the property.
+        """
+        self._func = func
+        self._name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        """
+        Remember name of property.
+        """
+        self._name = name
+
+    def __get__(self, instance, owner=None):
+        """
+        Compute property and store it in instance.
+        """
+        if instance is None:
+            return self
+        value = self._func(instance)
+        instance.__dict__[self._name] = value
+        return value
 
 
 class BaseEvent:
@@ -43,14 +235,29 @@ class BaseEvent:
 
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, pb2_ev: pb2.event):
+    def __init__(self, pb2_ev: pb2.event, offset: int | None = None):
         """
         Initialize base event from PB2 event.
+        offset is the offset of the event in the trace file (if known).
         """
         super().__init__()
         self._pb2_ev = pb2_ev
+        self._offset = offset
         self._timestamp = self._pb2GetTimespec(pb2_ev.timestamp)
 
+    @classmethod
+    def fromBytes(cls, data: bytes) -> "BaseEvent":
+        """
+        Create event from serialized PB2 event (see toBytes).
+        """
+        return cls(pb2.event.FromString(data))
+
+    def toBytes(self) -> bytes:
+        """
+        Serialize PB2 event of this event to a (compact) bytes object.
+        """
+        return self._pb2_ev.SerializeToString()
+
     def _pb2GetString(self, s: str | bytes) -> str:
         if isinstance(s, str):
             return s
@@ -73,6 +280,22 @@ class BaseEvent:
             sec += t_s.nsec * 1e-9
         return sec
 
+    @property
+    def offset(self) -> int | None:
+        """
+        Offset of event in trace file (None if not known).
+        """
+        return self._offset
+
+    @property
+    def timespec(self) -> tuple[int, int | None]:
+        """
+        Time of event as seconds and nanoseconds (None if not set) from epoch,
+        as stored in the event (timestamp is rounded).
+        """
+        t_s = self._pb2_ev.timestamp
+        return t_s.sec, t_s.nsec if t_s.HasField("nsec") else None
+
     @property
     def timestamp(self) -> float:
         """
@@ -86,11 +309,11 @@ class ProcBeginOrEnd(BaseEvent):
     Process begin or end event.
     """
 
-    def __init__(self, pb2_ev: pb2.event):
+    def __init__(self, pb2_ev: pb2.event, offset: int | None = None):
         """
         Initialize process begin or end event from PB2 event.
         """
-        super().__init__(pb2_ev)
+        super().__init__(pb2_ev, offset)
         self._process = None
         self._pid = None
         self._ppid = None
@@ -126,44 +349,109 @@ class ProcBeginOrEnd(BaseEvent):
 class ProcBegin(ProcBeginOrEnd):
     """
     Process begin event.
+
+    Only PID and parent PID are decoded immediately, all other fields are
+    decoded from the PB2 event on first access.
+    In interned traces, executable, working directory and command line are
+    referenced by id and looked up in the strings of the trace.
     """
 
-    def __init__(self, pb2_ev: pb2.event):
+    def __init__(
+        self,
+        pb2_ev: pb2.event,
+        offset: int | None = None,
+        strings: "Strings | None" = None,
+    ):
         """
-        Initialize process begin event from PB2 event.
+        Initialize process begin event from PB2 event and strings of the
+        trace (if known).
         """
-        super().__init__(pb2_ev)
+        super().__init__(pb2_ev, offset)
         p_b = pb2_ev.proc_begin
         self._pid = p_b.pid
         self._ppid = p_b.ppid if p_b.HasField("ppid") else None
-        self._exe = self._pb2GetString(p_b.exe) if p_b.HasField("exe") else None
-        self._cwd = self._pb2GetString(p_b.cwd) if p_b.HasField("cwd") else None
-        self._cmdline = (
-            self._pb2GetStringList(p_b.cmdline) if p_b.HasField("cmdline") else None
-        )
-        self._environ = (
-            self._pb2GetStringList(p_b.environ) if p_b.HasField("environ") else None
-        )
+        self._strings = strings
 
-    @property
+    @classmethod
+    def fromBytes(cls, data: bytes, strings: "Strings | None" = None) -> "ProcBegin":
+        """
+        Create event from serialized PB2 event (see toBytes) and strings of
+        the trace (if known).
+        """
+        return cls(pb2.event.FromString(data), strings=strings)
+
+    def _getStringById(self, string_id: int) -> str | None:
+        """
+        Get string with id from strings of trace.
+        """
+        if self._strings is None:
+            return None
+        return self._strings.get(string_id)
+
+    @_cached
+    def _cmdline(self) -> list[str] | None:
+        """
+        Decoded command line arguments of process.
+        """
+        p_b = self._pb2_ev.proc_begin
+        if p_b.HasField("cmdline"):
+            return self._pb2GetStringList(p_b.cmdline)
+        if p_b.HasField("cmdline_ids"):
+            cmdline = [self._getStringById(arg_id) for arg_id in p_b.cmdline_ids.id]
+            return None if None in cmdline else cmdline
+        return None
+
+    @_cached
+    def _environ(self) -> list[str] | None:
+        """
+        Decoded environment variables of process.
+        """
+        p_b = self._pb2_ev.proc_begin
+        if not p_b.HasField("environ"):
+            return None
+        return self._pb2GetStringList(p_b.environ)
+
+    @_cached
+    def environ_hash(self) -> int | None:
+        """
+        Hash of environment variables of process (environment capture policy
+        "hash"). If the environment is not stored in this event, it is stored
+        in the begin event of another process with the same hash.
+        """
+        p_b = self._pb2_ev.proc_begin
+        return p_b.environ_hash if p_b.HasField("environ_hash") else None
+
+    @_cached
     def exe(self) -> str:
         """
         Executable name of process.
         """
-        return self._exe
+        p_b = self._pb2_ev.proc_begin
+        if p_b.HasField("exe"):
+            return self._pb2GetString(p_b.exe)
+        if p_b.HasField("exe_id"):
+            return self._getStringById(p_b.exe_id)
+        return None
 
-    @property
+    @_cached
     def cwd(self) -> str:
         """
         Current working directory of process.
         """
-        return self._cwd
+        p_b = self._pb2_ev.proc_begin
+        if p_b.HasField("cwd"):
+            return self._pb2GetString(p_b.cwd)
+        if p_b.HasField("cwd_id"):
+            return self._getStringById(p_b.cwd_id)
+        return None
 
     @property
     def cmdline(self) -> list[str]:
         """
         Command line arguments of process (list of strings).
         """
+        if self._cmdline is None:
+            return None
         return self._cmdline.copy()
 
     @property
@@ -171,110 +459,170 @@ class ProcBegin(ProcBeginOrEnd):
         """
         Environment variables of process (list of strings).
         """
+        if self._environ is None:
+            return None
         return self._environ.copy()
 
 
 class ProcEnd(ProcBeginOrEnd):
     """
     Process end event.
-    """
 
-    # pylint: disable=R0902
+    Only PID and parent PID are decoded immediately, all other fields are
+    decoded from the PB2 event together on first access.
+    """
 
-    def __init__(self, pb2_ev: pb2.event):
+    def __init__(self, pb2_ev: pb2.event, offset: int | None = None):
         """
         Initialize process end event from PB2 event.
         """
-        super().__init__(pb2_ev)
+        super().__init__(pb2_ev, offset)
         p_e = pb2_ev.proc_end
         self._pid = p_e.pid
         self._ppid = p_e.ppid if p_e.HasField("ppid") else None
-        self._cpu_time = (
-            self._pb2GetTimespec(p_e.cpu_time) if p_e.HasField("cpu_time") else None
-        )
-        self._user_time = (
-            self._pb2GetTimespec(p_e.user_time) if p_e.HasField("user_time") else None
-        )
-        self._sys_time = (
-            self._pb2GetTimespec(p_e.sys_time) if p_e.HasField("sys_time") else None
-        )
-        self._max_rss_kb = p_e.max_rss_kb if p_e.HasField("max_rss_kb") else None
-        self._min_flt = p_e.min_flt if p_e.HasField("min_flt") else None
-        self._maj_flt = p_e.maj_flt if p_e.HasField("maj_flt") else None
-        self._in_block = p_e.in_block if p_e.HasField("in_block") else None
-        self._ou_block = p_e.ou_block if p_e.HasField("ou_block") else None
-        self._n_v_csw = p_e.n_v_csw if p_e.HasField("n_v_csw") else None
-        self._n_iv_csw = p_e.n_iv_csw if p_e.HasField("n_iv_csw") else None
+
+    @_cached
+    def _fields(self) -> dict:
+        """
+        Decoded fields of process end event: field name -> value.
+        Timespec fields are converted to seconds, missing fields are omitted.
+        """
+        fields = {}
+        for field, value in self._pb2_ev.proc_end.ListFields():
+            if field.message_type is not None:
+                value = self._pb2GetTimespec(value)
+            fields[field.name] = value
+        return fields
 
     @property
     def cpu_time(self) -> float:
         """
         CPU time usage (in s).
         """
-        return self._cpu_time
+        return self._fields.get("cpu_time")
 
     @property
     def user_time(self) -> float:
         """
         CPU time usage in user-space (in s).
         """
-        return self._user_time
+        return self._fields.get("user_time")
 
     @property
     def sys_time(self) -> float:
         """
         CPU time usage in system (kernel) (in s).
         """
-        return self._sys_time
+        return self._fields.get("sys_time")
 
     @property
     def max_rss_kb(self) -> int:
         """
         Maximum amount of memory used (in KiB).
         """
-        return self._max_rss_kb
+        return self._fields.get("max_rss_kb")
 
     @property
     def min_flt(self) -> int:
         """
         Minor page fault count (i.e. no I/O).
         """
-        return self._min_flt
+        return self._fields.get("min_flt")
 
     @property
     def maj_flt(self) -> int:
         """
         Major page fault count (i.e. I/O needed).
         """
-        return self._maj_flt
+        return self._fields.get("maj_flt")
 
     @property
     def in_block(self) -> int:
         """
         Number of input operations on file system.
         """
-        return self._in_block
+        return self._fields.get("in_block")
 
     @property
     def ou_block(self) -> int:
         """
         Number of output operations on file system.
         """
-        return self._ou_block
+        return self._fields.get("ou_block")
 
     @property
     def n_v_csw(self) -> int:
         """
         Number of voluntary context switches.
         """
-        return self._n_v_csw
+        return self._fields.get("n_v_csw")
 
     @property
     def n_iv_csw(self) -> int:
         """
         Number of involuntary context switches.
         """
-        return self._n_iv_csw
+        return self._fields.get("n_iv_csw")
+
+
+class StringTable(BaseEvent):
+    """
+    String table event: strings referenced by id in later events.
+    """
+
+    def __init__(self, pb2_ev: pb2.event, offset: int | None = None):
+        """
+        Initialize string table event from PB2 event.
+        """
+        super().__init__(pb2_ev, offset)
+        self._first_id = pb2_ev.string_table.first_id
+
+    @property
+    def first_id(self) -> int:
+        """
+        ID of first string.
+        """
+        return self._first_id
+
+    @property
+    def strings(self) -> list[str]:
+        """
+        Strings (with ids first_id, first_id + 1, ...).
+        """
+        return self._pb2GetStringList(self._pb2_ev.string_table)
+
+
+class Strings:
+    """
+    Strings of the string table events of a trace: id -> string.
+    The strings are interned, so each distinct string is kept in memory once,
+    no matter how many events reference it.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty strings.
+        """
+        self._strings: dict[int, str] = {}
+
+    def __len__(self) -> int:
+        """
+        Number of strings.
+        """
+        return len(self._strings)
+
+    def add(self, string_table: StringTable) -> None:
+        """
+        Add strings of string table event.
+        """
+        for string_id, string in enumerate(string_table.strings, string_table.first_id):
+            self._strings[string_id] = sys.intern(string)
+
+    def get(self, string_id: int) -> str | None:
+        """
+        Return string with id, or None if not known.
+        """
+        return self._strings.get(string_id)
 
 
 class Visitor(abc.ABC):
@@ -294,6 +642,23 @@ class Visitor(abc.ABC):
         Visit a process end event.
         """
 
+    def visitStringTable(self, string_table: StringTable):
+        """
+        Visit a string table event (ignored by default).
+        """
+
+
+def visit_event(pb2_ev: pb2.event, visitor: Visitor, offset: int | None = None) -> None:
+    """
+    Parse PB2 event (at offset in trace file, if known) and call visitor.
+    """
+    if pb2_ev.HasField("string_table"):
+        visitor.visitStringTable(StringTable(pb2_ev, offset))
+    if pb2_ev.HasField("proc_begin"):
+        visitor.visitProcBegin(ProcBegin(pb2_ev, offset))
+    if pb2_ev.HasField("proc_end"):
+        visitor.visitProcEnd(ProcEnd(pb2_ev, offset))
+
 
 def parse_event(proto_file, visitor: Visitor) -> bool:
     """
@@ -303,8 +668,14 @@ def parse_event(proto_file, visitor: Visitor) -> bool:
     pb2_ev = read_event(proto_file)
     if pb2_ev is None:
         return False
-    if pb2_ev.HasField("proc_begin"):
-        visitor.visitProcBegin(ProcBegin(pb2_ev))
-    if pb2_ev.HasField("proc_end"):
-        visitor.visitProcEnd(ProcEnd(pb2_ev))
+    visit_event(pb2_ev, visitor)
     return True
+
+
+def parse_events(proto_file, visitor: Visitor) -> None:
+    """
+    Read all events from proto_file, parse them and call visitor.
+    """
+    reader = Reader(proto_file)
+    for pb2_ev in reader:
+        visit_event(pb2_ev, visitor, reader.event_offset)
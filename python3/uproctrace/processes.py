@@ -5,41 +5,189 @@
 Processes in a trace file.
 """
 
+import array
 import collections
+import functools
+import itertools
+import os
+import typing
+
+import google.protobuf.message
+import uproctrace.columns
+import uproctrace.compress
+import uproctrace.parallel
 import uproctrace.parse
+import uproctrace.query
+import uproctrace.timeindex
+
+# inclusive metrics of a process and all its descendants (see
+# Process.inclusive): number of processes, sums of the metric values
+# (maximum for max_rss_kb)
+Inclusive = collections.namedtuple(
+    "Inclusive",
+    (
+        "count",
+        "cpu_time",
+        "user_time",
+        "sys_time",
+        "max_rss_kb",
+        "min_flt",
+        "maj_flt",
+        "in_block",
+        "ou_block",
+        "n_v_csw",
+        "n_iv_csw",
+    ),
+)
 
 
 class Process:
     """
     A process parsed from a trace.
+
+    To keep traces with millions of processes manageable, a process does not
+    keep its begin and end events. The values of the end event are copied
+    and the begin event is kept in serialized form, from which the strings
+    (command line, environment, ...) are decoded on access.
+    The memory needed per process (without the serialized begin event) is
+    below MEMORY_PER_PROCESS bytes (as long as the inclusive metrics have not
+    been computed).
     """
 
-    # pylint: disable=R0904
+    # pylint: disable=R0902,R0904
+
+    # upper limit of memory per process (without serialized begin event)
+    MEMORY_PER_PROCESS = 1024
+
+    # values of end event (in order) passed to setEndValues
+    END_VALUES = (
+        "cpu_time",
+        "user_time",
+        "sys_time",
+        "max_rss_kb",
+        "min_flt",
+        "maj_flt",
+        "in_block",
+        "ou_block",
+        "n_v_csw",
+        "n_iv_csw",
+    )
+
+    __slots__ = (
+        "_proc_id",
+        "_pid",
+        "_begin_data",
+        "_begin_ppid",
+        "_begin_timestamp",
+        "_end_ppid",
+        "_end_timestamp",
+        "_cpu_time",
+        "_user_time",
+        "_sys_time",
+        "_max_rss_kb",
+        "_min_flt",
+        "_maj_flt",
+        "_in_block",
+        "_ou_block",
+        "_n_v_csw",
+        "_n_iv_csw",
+        "_parent",
+        "_children",
+        "_inclusive",
+        "_environs",
+        "_strings",
+    )
+
     def __init__(self, proc_id: int, pid: int) -> None:
         """
         Initialize process.
         """
         self._proc_id = proc_id
         self._pid = pid
-        self._begin = None
-        self._end = None
+        self._begin_data = None  # serialized begin event
+        self._begin_ppid = None
+        self._begin_timestamp = None
+        self._end_ppid = None
+        self._end_timestamp = None
+        self._cpu_time = None
+        self._user_time = None
+        self._sys_time = None
+        self._max_rss_kb = None
+        self._min_flt = None
+        self._maj_flt = None
+        self._in_block = None
+        self._ou_block = None
+        self._n_v_csw = None
+        self._n_iv_csw = None
         self._parent = None
-        self._children = collections.OrderedDict()  # proc_id -> Process
+        self._children = None  # proc_id -> Process (None if no children)
+        self._inclusive = None  # cached inclusive metrics (None if outdated)
+        self._environs = None  # environments stored once per trace (see Environs)
+        self._strings = None  # strings of interned trace (see parse.Strings)
+
+    def _computeInclusive(self) -> None:
+        """
+        Compute inclusive metrics of process and all descendants that do not
+        have valid cached inclusive metrics (iterative post-order traversal,
+        so deep trees do not hit the recursion limit).
+        """
+        # pylint: disable=protected-access
+        rss_idx = Inclusive._fields.index("max_rss_kb")
+        stack = [self]
+        while stack:
+            proc = stack[-1]
+            children = proc._children.values() if proc._children else ()
+            pending = [child for child in children if child._inclusive is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            del stack[-1]
+            totals = [1] + [
+                getattr(proc, "_" + attr) or 0 for attr in Inclusive._fields[1:]
+            ]
+            for child in children:
+                for idx, value in enumerate(child._inclusive):
+                    if idx == rss_idx:
+                        totals[idx] = max(totals[idx], value)
+                    else:
+                        totals[idx] += value
+            proc._inclusive = Inclusive._make(totals)
+
+    def _invalidateInclusive(self) -> None:
+        """
+        Invalidate cached inclusive metrics of process and its ancestors.
+        """
+        # pylint: disable=protected-access
+        # if inclusive metrics of a process are cached, the ones of all its
+        # descendants are cached as well, so stop at first outdated process
+        proc = self
+        while proc is not None and proc._inclusive is not None:
+            proc._inclusive = None
+            proc = proc._parent
+
+    def getBegin(self) -> uproctrace.parse.ProcBegin | None:
+        """
+        Get begin event of process (decoded from serialized event on each
+        call, keep it to read several of its fields).
+        """
+        if self._begin_data is None:
+            return None
+        return uproctrace.parse.ProcBegin.fromBytes(self._begin_data, self._strings)
 
     @property
     def begin_timestamp(self) -> float:
         """
         Begin timestamp of process.
         """
-        if self._begin is None:
-            return None
-        return self._begin.timestamp
+        return self._begin_timestamp
 
     @property
     def children(self) -> list["Process"]:
         """
         List of child processes.
         """
+        if self._children is None:
+            return []
         return list(self._children.values())
 
     @property
@@ -47,117 +195,120 @@ class Process:
         """
         Command line of process.
         """
-        if self._begin is None:
+        begin = self.getBegin()
+        if begin is None:
             return None
-        return self._begin.cmdline
+        return begin.cmdline
 
     @property
     def cpu_time(self) -> float:
         """
         CPU time of process (in s).
         """
-        if self._end is None:
-            return None
-        return self._end.cpu_time
+        return self._cpu_time
 
     @property
     def cwd(self) -> str:
         """
         Working directory of process.
         """
-        if self._begin is None:
+        begin = self.getBegin()
+        if begin is None:
             return None
-        return self._begin.cwd
+        return begin.cwd
 
     @property
     def end_timestamp(self) -> float:
         """
         End timestamp of process.
         """
-        if self._end is None:
-            return None
-        return self._end.timestamp
+        return self._end_timestamp
 
     @property
     def environ(self) -> list[str]:
         """
-        Environment of process.
+        Environment of process (looked up by hash if not stored in the begin
+        event of the process, see Environs).
         """
-        if self._begin is None:
+        begin = self.getBegin()
+        if begin is None:
             return None
-        return self._begin.environ
+        environ = begin.environ
+        if environ is None and begin.environ_hash is not None:
+            if self._environs is not None:
+                environ = self._environs.get(begin.environ_hash)
+        return environ
 
     @property
     def exe(self) -> str:
         """
         Executable of process.
         """
-        if self._begin is None:
+        begin = self.getBegin()
+        if begin is None:
             return None
-        return self._begin.exe
+        return begin.exe
 
     @property
     def in_block(self) -> int:
         """
         Number of input operations on file system.
         """
-        if self._end is None:
-            return None
-        return self._end.in_block
+        return self._in_block
+
+    @property
+    def inclusive(self) -> Inclusive:
+        """
+        Inclusive metrics of process and all its descendants (see Inclusive).
+        Missing values (e.g. of processes that have not ended) count as 0.
+        Computed on first access for the whole subtree and cached until a
+        process in the subtree changes.
+        """
+        if self._inclusive is None:
+            self._computeInclusive()
+        return self._inclusive
 
     @property
     def maj_flt(self) -> int:
         """
         Major page fault count (i.e. I/O needed).
         """
-        if self._end is None:
-            return None
-        return self._end.maj_flt
+        return self._maj_flt
 
     @property
     def max_rss_kb(self) -> int:
         """
         Maximum resident set size of process (in KiB).
         """
-        if self._end is None:
-            return None
-        return self._end.max_rss_kb
+        return self._max_rss_kb
 
     @property
     def min_flt(self) -> int:
         """
         Minor page fault count (i.e. no I/O).
         """
-        if self._end is None:
-            return None
-        return self._end.min_flt
+        return self._min_flt
 
     @property
     def n_iv_csw(self) -> int:
         """
         Number of involuntary context switches.
         """
-        if self._end is None:
-            return None
-        return self._end.n_iv_csw
+        return self._n_iv_csw
 
     @property
     def n_v_csw(self) -> int:
         """
         Number of voluntary context switches.
         """
-        if self._end is None:
-            return None
-        return self._end.n_v_csw
+        return self._n_v_csw
 
     @property
     def ou_block(self) -> int:
         """
         Number of output operations on file system.
         """
-        if self._end is None:
-            return None
-        return self._end.ou_block
+        return self._ou_block
 
     @property
     def parent(self) -> "Process | None":
@@ -178,12 +329,10 @@ class Process:
         """
         Linux process ID of parent process.
         """
-        if self._begin is not None:
-            if self._begin.ppid is not None:
-                return self._begin.ppid
-        if self._end is not None:
-            if self._end.ppid:
-                return self._end.ppid
+        if self._begin_ppid is not None:
+            return self._begin_ppid
+        if self._end_ppid:
+            return self._end_ppid
         return None
 
     @property
@@ -198,43 +347,114 @@ class Process:
         """
         System CPU time of process (in s).
         """
-        if self._end is None:
-            return None
-        return self._end.sys_time
+        return self._sys_time
 
     @property
     def user_time(self) -> float:
         """
         User CPU time of process (in s).
         """
-        if self._end is None:
-            return None
-        return self._end.user_time
+        return self._user_time
 
     def addChild(self, child) -> None:
         """
         Add a child process.
         """
+        if self._children is None:
+            self._children = {}
         self._children[child.proc_id] = child
+        self._invalidateInclusive()
 
     def removeChild(self, child_proc_id: int) -> None:
         """
         Remove a child process.
         """
-        if child_proc_id in self._children:
-            del self._children[child_proc_id]
+        if self._children is None or child_proc_id not in self._children:
+            return
+        del self._children[child_proc_id]
+        if not self._children:
+            self._children = None
+        self._invalidateInclusive()
+
+    def restore(self, begin_data: bytes | None, ppid: int | None, values: dict):
+        """
+        Restore process (e.g. from an index) from serialized begin event
+        (see parse.BaseEvent.toBytes), parent PID and metric values
+        (attribute name -> value, see columns.ATTRS).
+        """
+        self._begin_data = begin_data
+        self._begin_ppid = ppid
+        for attr, value in values.items():
+            setattr(self, "_" + attr, value)
+        self._invalidateInclusive()
 
     def setBegin(self, proc_begin: uproctrace.parse.ProcBegin) -> None:
         """
         Set begin event of process.
         """
-        self._begin = proc_begin
+        self.setBeginValues(proc_begin.toBytes(), proc_begin.ppid, proc_begin.timestamp)
+
+    def setBeginValues(
+        self, begin_data: bytes, ppid: int | None, timestamp: float
+    ) -> None:
+        """
+        Set values of begin event of process: serialized begin event (see
+        parse.BaseEvent.toBytes), parent PID and timestamp.
+        """
+        self._begin_data = begin_data
+        self._begin_ppid = ppid
+        self._begin_timestamp = timestamp
 
     def setEnd(self, proc_end: uproctrace.parse.ProcEnd) -> None:
         """
         Set end event of process.
         """
-        self._end = proc_end
+        self._end_ppid = proc_end.ppid
+        self._end_timestamp = proc_end.timestamp
+        self._cpu_time = proc_end.cpu_time
+        self._user_time = proc_end.user_time
+        self._sys_time = proc_end.sys_time
+        self._max_rss_kb = proc_end.max_rss_kb
+        self._min_flt = proc_end.min_flt
+        self._maj_flt = proc_end.maj_flt
+        self._in_block = proc_end.in_block
+        self._ou_block = proc_end.ou_block
+        self._n_v_csw = proc_end.n_v_csw
+        self._n_iv_csw = proc_end.n_iv_csw
+        self._invalidateInclusive()
+
+    def setEndValues(self, ppid: int | None, timestamp: float, values: tuple):
+        """
+        Set values of end event of process: parent PID, timestamp and
+        metric values (in order of END_VALUES).
+        """
+        self._end_ppid = ppid
+        self._end_timestamp = timestamp
+        (
+            self._cpu_time,
+            self._user_time,
+            self._sys_time,
+            self._max_rss_kb,
+            self._min_flt,
+            self._maj_flt,
+            self._in_block,
+            self._ou_block,
+            self._n_v_csw,
+            self._n_iv_csw,
+        ) = values
+        self._invalidateInclusive()
+
+    def setEnvirons(self, environs: "Environs") -> None:
+        """
+        Set table of environments stored once per trace.
+        """
+        self._environs = environs
+
+    def setStrings(self, strings: uproctrace.parse.Strings) -> None:
+        """
+        Set strings of interned trace (referenced by begin event).
+        """
+        self._strings = strings
 
     def setParent(self, parent: "Process") -> None:
         """
@@ -243,26 +463,213 @@ class Process:
         self._parent = parent
 
 
+class Environs:
+    """
+    Environments stored once per trace (environment capture policy "hash"):
+    The begin events of processes only contain the hash of their environment,
+    the environment itself is stored in the begin event of one process with
+    the same hash (not necessarily an ancestor or an earlier process).
+    The begin events are scanned in order of proc_id on demand until the
+    environment is found, so each begin event is decoded at most once.
+    """
+
+    def __init__(self, processes: typing.Sequence[Process]):
+        """
+        Initialize empty table for processes (sequence indexed by proc_id, may
+        grow while the trace is read).
+        """
+        self._processes = processes
+        self._scanned = 0  # number of processes scanned
+        self._environs: dict[int, list[str]] = {}  # hash -> environment
+
+    def get(self, environ_hash: int) -> list[str] | None:
+        """
+        Return environment with hash, or None if not (yet) found.
+        """
+        while environ_hash not in self._environs:
+            if self._scanned >= len(self._processes):
+                return None
+            begin = self._processes[self._scanned].getBegin()
+            self._scanned += 1
+            if begin is not None and begin.environ_hash is not None:
+                environ = begin.environ
+                if environ is not None:
+                    self._environs.setdefault(begin.environ_hash, environ)
+        return self._environs[environ_hash].copy()
+
+    def prefetch(self, processes) -> None:
+        """
+        Use table for processes and look up their environments now (e.g.
+        while the trace file the table reads begin events from is open).
+        """
+        for proc in processes:
+            proc.setEnvirons(self)
+            _environ = proc.environ
+
+
+class _RangeParser(uproctrace.parse.Visitor):
+    """
+    Parser for the events in a byte range of a trace file, run in a worker
+    process when parsing a trace in parallel.
+
+    The events are converted to compact records, which are replayed by
+    Processes in the main process:
+      - (True, offset, pid, ppid, timestamp, serialized begin event)
+      - (False, offset, pid, ppid, timestamp, values (see END_VALUES))
+      - (None, offset, None, None, timestamp, serialized string table event)
+    """
+
+    def __init__(self):
+        """
+        Initialize empty list of records.
+        """
+        super().__init__()
+        self.records = []
+
+    def visitProcBegin(self, proc_begin: uproctrace.parse.ProcBegin):
+        """
+        Add record for process begin event.
+        """
+        self.records.append(
+            (
+                True,
+                proc_begin.offset,
+                proc_begin.pid,
+                proc_begin.ppid,
+                proc_begin.timestamp,
+                proc_begin.toBytes(),
+            )
+        )
+
+    def visitProcEnd(self, proc_end: uproctrace.parse.ProcEnd):
+        """
+        Add record for process end event.
+        """
+        self.records.append(
+            (
+                False,
+                proc_end.offset,
+                proc_end.pid,
+                proc_end.ppid,
+                proc_end.timestamp,
+                tuple(getattr(proc_end, attr) for attr in Process.END_VALUES),
+            )
+        )
+
+    def visitStringTable(self, string_table: uproctrace.parse.StringTable):
+        """
+        Add record for string table event.
+        """
+        self.records.append(
+            (
+                None,
+                string_table.offset,
+                None,
+                None,
+                string_table.timestamp,
+                string_table.toBytes(),
+            )
+        )
+
+
+def _find_magic(proto_file, offset: int) -> int:
+    """
+    Return offset of the first magic bytes at or behind offset in trace file
+    (proto_file), -1 if there are none.
+    """
+    magic = uproctrace.parse.MAGIC
+    proto_file.seek(offset)
+    data = b""
+    while True:
+        chunk = proto_file.read(uproctrace.parse.Reader.CHUNK_SIZE)
+        if not chunk:
+            return -1
+        # keep possible start of magic
+        keep = data[max(len(data) - len(magic) + 1, 0) :]
+        offset += len(data) - len(keep)
+        data = keep + chunk
+        found = data.find(magic)
+        if found >= 0:
+            return offset + found
+
+
+def _parse_range(
+    upt_trace: str, span: tuple[int, int], resync: bool = True
+) -> tuple[list, int, bool]:
+    """
+    Parse the events starting in byte range span = (start, stop) of trace file
+    upt_trace. The first event is located by searching the magic bytes from
+    start on.
+    If resync is True, start may be inside an event, so the magic bytes found
+    may be a false match. No records are returned if an event cannot be
+    decoded in this case.
+    Return records (see _RangeParser), offset behind the last event parsed (or
+    start) and whether the end of the events in the trace file was reached.
+    """
+    start, stop = span
+    parser = _RangeParser()
+    end = start
+    with uproctrace.compress.open_trace(upt_trace) as proto_file:
+        reader = uproctrace.parse.Reader(proto_file, start)
+        try:
+            for pb2_ev in reader:
+                if reader.event_offset >= stop:
+                    return parser.records, end, False
+                uproctrace.parse.visit_event(pb2_ev, parser, reader.event_offset)
+                end = reader.offset
+        except google.protobuf.message.DecodeError:
+            if not resync:
+                raise
+            return [], start, False
+    return parser.records, end, True
+
+
 class Processes(uproctrace.parse.Visitor):
     """
     Collection of all processes from a trace.
     """
 
-    def __init__(self, proto_file) -> None:
+    # pylint: disable=R0902
+
+    # minimum size of byte range of trace file parsed by one worker process
+    MIN_SPAN_SIZE = 1 << 20
+
+    def __init__(self, proto_file, index=None, jobs: int = 1) -> None:
         """
         Initialize processes from a trace file (f).
+        If a (valid) index of the trace file is passed, restore processes from
+        it instead of parsing the trace file.
+        If jobs is greater than 1, parse the trace file with up to jobs worker
+        processes in parallel.
         """
         super().__init__()
-        # time -> list(parse.BaseEvent)
-        self._timeline: dict[float, list[uproctrace.parse.BaseEvent]] = {}
-        # proc_id -> process
-        self._all_processes: dict[int, Process] = {}
+        # all processes, index is proc_id
+        self._all_processes: list[Process] = []
+        # offsets of begin and end events of processes in trace (or -1)
+        self._begin_offsets = array.array("q")
+        self._end_offsets = array.array("q")
         # pid -> process (while pid alive)
         self._current_processes: dict[int, Process] = {}
         # ordered dictionary of toplevel processes: proc_id -> Process
         self._toplevel_processes: dict[int, Process] = collections.OrderedDict()
-        # parse trace
-        self._readTrace(proto_file)
+        # columnar table of process metrics (built on demand)
+        self._columns: uproctrace.columns.Columns | None = None
+        # time index of process lifetimes (built on demand)
+        self._time_index: uproctrace.timeindex.TimeIndex | None = None
+        # offset in trace file behind last event
+        self._trace_offset = 0
+        # processes created or changed during update (None if not updating)
+        self._changed: set[Process] | None = None
+        # environments stored once per trace, looked up by hash
+        self._environs = Environs(self._all_processes)
+        # strings of interned trace and offsets of their string table events
+        self._strings = uproctrace.parse.Strings()
+        self._string_table_offsets = array.array("q")
+        # parse trace or restore from index
+        if index is not None:
+            self._readIndex(proto_file, index)
+        elif jobs <= 1 or not self._readTraceParallel(proto_file, jobs):
+            self._readTrace(proto_file)
 
     def _getProcess(self, pid: int) -> Process:
         """
@@ -283,9 +690,15 @@ class Processes(uproctrace.parse.Visitor):
         """
         proc_id = len(self._all_processes)
         proc = Process(proc_id, pid)
-        self._all_processes[proc_id] = proc
+        proc.setEnvirons(self._environs)
+        proc.setStrings(self._strings)
+        self._all_processes.append(proc)
+        self._begin_offsets.append(-1)
+        self._end_offsets.append(-1)
         self._current_processes[pid] = proc
         self._toplevel_processes[proc_id] = proc
+        if self._changed is not None:
+            self._changed.add(proc)
         return proc
 
     def _parentChild(self, parent: Process, child: Process):
@@ -295,25 +708,204 @@ class Processes(uproctrace.parse.Visitor):
         # terminate old relationship (if any)
         if child.parent is not None:
             child.parent.removeChild(child.proc_id)
+            if self._changed is not None:
+                self._changed.add(child.parent)
         if child.proc_id in self._toplevel_processes:
             del self._toplevel_processes[child.proc_id]
         # establish new relationship
         parent.addChild(child)
         child.setParent(parent)
+        if self._changed is not None:
+            self._changed.update((parent, child))
+
+    def _beginProcess(self, pid: int, ppid: int | None, offset: int | None):
+        """
+        Create process for a process begin event (at offset in trace file, if
+        known) and add it to its parent.
+        Return new process.
+        """
+        # new process
+        proc = self._newProcess(pid)
+        if offset is not None:
+            self._begin_offsets[proc.proc_id] = offset
+        # add process to parent if available
+        if ppid is not None:
+            parent = self._getProcess(ppid)
+            self._parentChild(parent, proc)
+        return proc
+
+    def _endProcess(self, pid: int, ppid: int | None, offset: int | None):
+        """
+        Get process for a process end event (at offset in trace file, if
+        known), add it to its parent and remove it from the current processes.
+        Return process.
+        """
+        # get process
+        proc = self._getProcess(pid)
+        if offset is not None:
+            self._end_offsets[proc.proc_id] = offset
+        # add process to parent if available
+        if ppid is not None:
+            parent = self._getProcess(ppid)
+            self._parentChild(parent, proc)
+        # remove process from dict of current processes (it ended)
+        #   - it is guaranteed to be in it, because it came from _getProcess()
+        del self._current_processes[pid]
+        if self._changed is not None:
+            self._changed.add(proc)
+        return proc
+
+    def _addStringTable(
+        self, string_table: uproctrace.parse.StringTable, offset: int | None
+    ):
+        """
+        Add strings of string table event (at offset in trace file, if known).
+        """
+        self._strings.add(string_table)
+        if offset is not None:
+            self._string_table_offsets.append(offset)
+
+    def _readIndex(self, proto_file, index):
+        """
+        Restore processes from index of trace file (proto_file).
+        """
+        procs = [
+            index.makeProcess(proto_file, proc_id) for proc_id in range(len(index))
+        ]
+        self._environs = Environs(procs)
+        for offset in index.string_table_offsets:
+            string_table = uproctrace.parse.read_string_table(proto_file, offset)
+            if string_table is not None:
+                self._addStringTable(string_table, offset)
+        for proc in procs:
+            proc.setEnvirons(self._environs)
+            proc.setStrings(self._strings)
+            for child_proc_id in index.children(proc.proc_id):
+                child = procs[child_proc_id]
+                proc.addChild(child)
+                child.setParent(proc)
+        self._all_processes = procs
+        self._begin_offsets = array.array("q", index.array("begin_offset"))
+        self._end_offsets = array.array("q", index.array("end_offset"))
+        for proc_id in index.current:
+            self._current_processes[procs[proc_id].pid] = procs[proc_id]
+        for proc_id in index.toplevel:
+            self._toplevel_processes[proc_id] = procs[proc_id]
+        self._trace_offset = index.trace_offset
+        self._columns = index.columns
+
+    def _readTrace(self, proto_file, offset: int | None = None):
+        """
+        Read events from trace file (proto_file), starting at offset (default:
+        current position), and add them.
+        """
+        reader = uproctrace.parse.Reader(proto_file, offset)
+        for pb2_ev in reader:
+            uproctrace.parse.visit_event(pb2_ev, self, reader.event_offset)
+        self._trace_offset = reader.offset
+
+    def _readTraceParallel(self, proto_file, jobs: int) -> bool:
+        """
+        Read events from trace file (proto_file) with up to jobs worker
+        processes and add them.
+        The trace file is split into byte ranges. Each worker locates the
+        first event in its range by searching the magic bytes and parses the
+        events starting in its range. The results are used in file order.
+        If the first event found by a worker is not the event a sequential
+        parser would find next (e.g. the magic bytes occurred inside an
+        event), the range is parsed again from the correct offset.
+        Return False if the trace file cannot be parsed in parallel (nothing
+        has been read in this case).
+        """
+        try:
+            upt_trace = proto_file.name
+            pos = proto_file.tell()
+            size = proto_file.seek(0, os.SEEK_END)
+        except (AttributeError, OSError, ValueError):
+            # not a real file or size unknown (e.g. compressed stream)
+            return False
+        if size <= pos:
+            proto_file.seek(pos)
+            return False
+        span_size = max(-(-(size - pos) // jobs), self.MIN_SPAN_SIZE)
+        spans = [
+            (start, min(start + span_size, size))
+            for start in range(pos, size, span_size)
+        ]
+        results = uproctrace.parallel.map_jobs(
+            functools.partial(_parse_range, upt_trace), spans, jobs
+        )
+        for (_, stop), (records, end, done) in zip(spans, results):
+            # skip events before pos (parsed with the previous range)
+            first = 0
+            while first < len(records) and records[first][1] < pos:
+                first += 1
+            # first event must be the one found by sequential parsing
+            synced = first < len(records) and records[first][1] == _find_magic(
+                proto_file, pos
+            )
+            if not synced:
+                # parse again from the offset of sequential parsing
+                records, end, done = _parse_range(upt_trace, (pos, stop), False)
+                first = 0
+            self._replay(records, first)
+            pos = max(pos, end)
+            if done:
+                break
+        self._trace_offset = pos
+        proto_file.seek(pos)
+        return True
+
+    def _replay(self, records: list, first: int = 0):
+        """
+        Add events from records (see _RangeParser), starting at index first.
+        """
+        for idx in range(first, len(records)):
+            is_begin, offset, pid, ppid, timestamp, values = records[idx]
+            if is_begin is None:
+                string_table = uproctrace.parse.StringTable.fromBytes(values)
+                self._addStringTable(string_table, offset)
+            elif is_begin:
+                proc = self._beginProcess(pid, ppid, offset)
+                proc.setBeginValues(values, ppid, timestamp)
+            else:
+                proc = self._endProcess(pid, ppid, offset)
+                proc.setEndValues(ppid, timestamp, values)
+
+    @property
+    def columns(self) -> uproctrace.columns.Columns:
+        """
+        Columnar table of process metrics (row index is proc_id).
+        """
+        if self._columns is None:
+            self._columns = uproctrace.columns.Columns.fromProcesses(
+                self._all_processes
+            )
+        return self._columns
+
+    @property
+    def current(self) -> list:
+        """
+        List of processes that have not ended (yet).
+        """
+        return list(self._current_processes.values())
 
-    def _readTrace(self, proto_file):
+    @property
+    def time_index(self) -> uproctrace.timeindex.TimeIndex:
         """
-        Read events from trace file (proto_file) and add them.
+        Time index of process lifetimes for time window queries
+        (see timeindex.TimeIndex, proc_ids are returned).
         """
-        while uproctrace.parse.parse_event(proto_file, self):
-            pass
+        if self._time_index is None:
+            self._time_index = uproctrace.timeindex.TimeIndex.fromColumns(self.columns)
+        return self._time_index
 
-    def _visitBaseEvent(self, event: uproctrace.parse.BaseEvent):
+    @property
+    def string_table_offsets(self) -> list[int]:
         """
-        Common processing for all events.
+        Offsets of string table events in trace file.
         """
-        # store event in timeline
-        self._timeline.setdefault(event.timestamp, []).append(event)
+        return list(self._string_table_offsets)
 
     @property
     def toplevel(self) -> list:
@@ -322,47 +914,87 @@ class Processes(uproctrace.parse.Visitor):
         """
         return list(self._toplevel_processes.values())
 
+    @property
+    def trace_offset(self) -> int:
+        """
+        Offset in trace file behind the last event read.
+        """
+        return self._trace_offset
+
     def getAllProcesses(self) -> dict:
         """
         Return all processes.
         """
-        return self._all_processes.copy()
+        return dict(enumerate(self._all_processes))
+
+    def getEventOffsets(self, proc_id: int) -> tuple[int | None, int | None]:
+        """
+        Return offsets of begin and end event of process with proc_id in trace
+        file (None if there is no such event).
+        """
+        begin = self._begin_offsets[proc_id]
+        end = self._end_offsets[proc_id]
+        return (begin if begin >= 0 else None, end if end >= 0 else None)
 
     def getProcess(self, proc_id: int) -> Process:
         """
         Return process with proc_id, or None if not found.
         """
-        return self._all_processes.get(proc_id)
+        if proc_id < 0 or proc_id >= len(self._all_processes):
+            return None
+        return self._all_processes[proc_id]
+
+    def select(self, where: "uproctrace.query.Query | str") -> list[int]:
+        """
+        Return proc_ids of processes matching filter expression where (see
+        module query, string or compiled query), e.g. "exe ~ 'clang'".
+        Raise query.QueryError if the filter expression is invalid.
+        """
+        if isinstance(where, str):
+            where = uproctrace.query.Query(where)
+        mask = where.mask(self)
+        return list(itertools.compress(range(len(mask)), mask))
+
+    def update(self, proto_file) -> set[Process]:
+        """
+        Read events appended to trace file (proto_file) since the last read
+        (i.e. starting at trace_offset), e.g. while the trace is still being
+        written, and add them.
+        A partially written event at the end is read by a later update.
+        Return set of processes that have been created or modified (including
+        parents whose children have been added, removed or re-linked).
+        """
+        self._changed = set()
+        try:
+            self._readTrace(proto_file, self._trace_offset)
+            changed = self._changed
+        finally:
+            self._changed = None
+        if changed:
+            self._columns = None  # columnar table is outdated
+            self._time_index = None  # time index is outdated
+        return changed
 
     def visitProcBegin(self, proc_begin: uproctrace.parse.ProcBegin):
         """
         Process a process begin event.
         """
-        self._visitBaseEvent(proc_begin)
-        # new process
-        proc = self._newProcess(proc_begin.pid)
+        proc = self._beginProcess(proc_begin.pid, proc_begin.ppid, proc_begin.offset)
         # set begin event of process and process of begin event
         proc.setBegin(proc_begin)
         proc_begin.setProcess(proc)
-        # add process to parent if available
-        if proc_begin.ppid is not None:
-            parent = self._getProcess(proc_begin.ppid)
-            self._parentChild(parent, proc)
+
+    def visitStringTable(self, string_table: uproctrace.parse.StringTable):
+        """
+        Process a string table event.
+        """
+        self._addStringTable(string_table, string_table.offset)
 
     def visitProcEnd(self, proc_end: uproctrace.parse.ProcEnd):
         """
         Process a process end event.
         """
-        self._visitBaseEvent(proc_end)
-        # get process
-        proc = self._getProcess(proc_end.pid)
+        proc = self._endProcess(proc_end.pid, proc_end.ppid, proc_end.offset)
         # set end event of process and process of end event
         proc.setEnd(proc_end)
         proc_end.setProcess(proc)
-        # add process to parent if available
-        if proc_end.ppid is not None:
-            parent = self._getProcess(proc_end.ppid)
-            self._parentChild(parent, proc)
-        # remove process from dict of current processes (it ended)
-        #   - it is guaranteed to be in it, because it came from _getProcess()
-        del self._current_processes[proc_end.pid]
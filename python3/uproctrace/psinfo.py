@@ -4,9 +4,11 @@
 """
 Process info command line interface of UProcTrace: "upt-tool psinfo".
 """
+
 import argparse
 import functools
 import uproctrace.formatting
+import uproctrace.index
 import uproctrace.processes
 
 
@@ -49,60 +51,73 @@ def output_sum(key: str, sub_keys: list, values: list[int], indent: int = 0):
         output(sub_key, uproctrace.formatting.int2str(val), indent + 1)
 
 
-def psinfo(args: argparse.Namespace) -> None:
+def output_process(proc: uproctrace.processes.Process) -> None:
     """
-    Print process information.
+    Output information about a process.
     """
     # pylint: disable=duplicate-code
+    output("begin time", uproctrace.formatting.timestamp2str(proc.begin_timestamp))
+    output_list("command line", proc.cmdline)
+    output_sum(
+        "context switches",
+        ["involuntary", "voluntary"],
+        [proc.n_iv_csw, proc.n_v_csw],
+    )
+    output("CPU time", uproctrace.formatting.duration2str(proc.cpu_time))
+    output("end time", uproctrace.formatting.timestamp2str(proc.end_timestamp))
+    output_list_sorted("environment", proc.environ)
+    output("executable", uproctrace.formatting.str2str(proc.exe))
+    output_sum(
+        "file system operations",
+        ["input", "output"],
+        [proc.in_block, proc.ou_block],
+    )
+    output("max. resident memory", uproctrace.formatting.kb2str(proc.max_rss_kb))
+    output_sum("page faults", ["major", "minor"], [proc.maj_flt, proc.min_flt])
+    output("pid", uproctrace.formatting.int2str(proc.pid))
+    output("ppid", uproctrace.formatting.int2str(proc.ppid))
+    output("system CPU time", uproctrace.formatting.duration2str(proc.sys_time))
+    output("user CPU time", uproctrace.formatting.duration2str(proc.user_time))
+    output("working directory", uproctrace.formatting.str2str(proc.cwd))
+    # output parent
+    parent_proc = proc.parent
+    if parent_proc is None:
+        output("parent", "???")
+    else:
+        output("parent", uproctrace.formatting.cmdline2str(parent_proc.cmdline))
+    # output children
+    child_procs = proc.children
+    if child_procs is None:
+        output("children", "???")
+    else:
+        output("children", f"{len(child_procs):d} entries")
+        for i, child_proc in enumerate(child_procs):
+            output(
+                f"child {i:d}",
+                uproctrace.formatting.cmdline2str(child_proc.cmdline),
+                1,
+            )
+
+
+def psinfo(args: argparse.Namespace) -> None:
+    """
+    Print process information of the process with proc_id (--proc_id) or
+    of all processes matching a filter expression (--where).
+    """
     for upt_trace in args.trace:
         if len(args.trace) != 1:
             print(f"[{upt_trace:s}]:")
-        with open(upt_trace, "rb") as proto_file:
-            processes = uproctrace.processes.Processes(proto_file)
-
-        proc = processes.getProcess(args.proc_id)
+        if args.where is not None:
+            processes = uproctrace.index.load_processes(upt_trace, not args.no_index)
+            proc_ids = processes.select(args.where)
+            if not proc_ids:
+                print("  no matching processes")
+            for proc_id in proc_ids:
+                print(f"proc_id {proc_id:d}:")
+                output_process(processes.getProcess(proc_id))
+            continue
+        proc = uproctrace.index.load_process(upt_trace, args.proc_id, not args.no_index)
         if proc is None:
             print(f"  proc_id {args.proc_id} not found")
             continue
-
-        output("begin time", uproctrace.formatting.timestamp2str(proc.begin_timestamp))
-        output_list("command line", proc.cmdline)
-        output_sum(
-            "context switches",
-            ["involuntary", "voluntary"],
-            [proc.n_iv_csw, proc.n_v_csw],
-        )
-        output("CPU time", uproctrace.formatting.duration2str(proc.cpu_time))
-        output("end time", uproctrace.formatting.timestamp2str(proc.end_timestamp))
-        output_list_sorted("environment", proc.environ)
-        output("executable", uproctrace.formatting.str2str(proc.exe))
-        output_sum(
-            "file system operations",
-            ["input", "output"],
-            [proc.in_block, proc.ou_block],
-        )
-        output("max. resident memory", uproctrace.formatting.kb2str(proc.max_rss_kb))
-        output_sum("page faults", ["major", "minor"], [proc.maj_flt, proc.min_flt])
-        output("pid", uproctrace.formatting.int2str(proc.pid))
-        output("ppid", uproctrace.formatting.int2str(proc.ppid))
-        output("system CPU time", uproctrace.formatting.duration2str(proc.sys_time))
-        output("user CPU time", uproctrace.formatting.duration2str(proc.user_time))
-        output("working directory", uproctrace.formatting.str2str(proc.cwd))
-        # output parent
-        parent_proc = proc.parent
-        if parent_proc is None:
-            output("parent", "???")
-        else:
-            output("parent", uproctrace.formatting.cmdline2str(parent_proc.cmdline))
-        # output children
-        child_procs = proc.children
-        if child_procs is None:
-            output("children", "???")
-        else:
-            output("children", f"{len(child_procs):d} entries")
-            for i, child_proc in enumerate(child_procs):
-                output(
-                    f"child {i:d}",
-                    uproctrace.formatting.cmdline2str(child_proc.cmdline),
-                    1,
-                )
+        output_process(proc)
@@ -4,64 +4,161 @@
 """
 Process tree command line interface of UProcTrace: "upt-tool pstree".
 """
+
 import argparse
-import csv
-import json
+import functools
+import itertools
 import sys
+import typing
+
 import tabulate
+import uproctrace.columns
+import uproctrace.follow
 import uproctrace.formatting
+import uproctrace.index
+import uproctrace.parallel
 import uproctrace.processes
+import uproctrace.query
 
 
-def build(
+def select(
     args: argparse.Namespace, processes: uproctrace.processes.Processes
-) -> list[list[str]]:
+) -> set[int] | None:
     """
-    Build rows for pstree command.
+    Select processes to show: the processes alive in the time window
+    (--since, --until) and matching the filter expression (--where), and
+    their ancestors (to keep the tree intact).
+    Return set of proc_ids, None to show all processes.
     """
+    window = None
+    if args.since is not None or args.until is not None:
+        window = (args.since, args.until)
+    mask = uproctrace.query.select_mask(processes, args.where, window)
+    if mask is None:
+        return None
+    selected: set[int] = set()
+    for proc_id in itertools.compress(range(len(mask)), mask):
+        proc = processes.getProcess(proc_id)
+        while proc is not None and proc.proc_id not in selected:
+            selected.add(proc.proc_id)
+            proc = proc.parent
+    return selected
+
 
-    # build process tree (iterative)
+def walk(
+    args: argparse.Namespace, processes: uproctrace.processes.Processes
+) -> typing.Iterator[tuple[int, uproctrace.processes.Process]]:
+    """
+    Walk process tree depth-first (iterative), yielding (tree level, process)
+    for the selected processes (see select) as they are visited.
+    """
+    selected = select(args, processes)
     to_be_output = [processes.toplevel]
-    rows: list[list[str]] = []
     while to_be_output:
         procs = to_be_output[-1]
-        # pylint: disable=duplicate-code
         if not procs:
             del to_be_output[-1]
             continue
         proc = procs[0]
         del procs[0]
-
-        # tree level / indentation level
-        indent = str(len(to_be_output) - 1)
-        row = [indent]
-        # PIDs
-        if args.pids:
-            row += [f"{proc.proc_id}", f"{proc.pid}", f"{proc.ppid}"]
-        # command line
-        cmdline_str = uproctrace.formatting.cmdline2str(proc.cmdline)
-        row.append(cmdline_str)
-        # details
-        if args.details:
-            row += [
-                uproctrace.formatting.timestamp2str(proc.begin_timestamp),
-                uproctrace.formatting.timestamp2str(proc.end_timestamp),
-                uproctrace.formatting.duration2str(proc.cpu_time),
-                uproctrace.formatting.kb2str(proc.max_rss_kb),
-                uproctrace.formatting.int2str(
-                    uproctrace.formatting.add_none(proc.min_flt, proc.maj_flt)
-                ),
-                uproctrace.formatting.int2str(
-                    uproctrace.formatting.add_none(proc.in_block, proc.ou_block)
-                ),
-                uproctrace.formatting.int2str(
-                    uproctrace.formatting.add_none(proc.n_v_csw, proc.n_iv_csw)
-                ),
-            ]
-        rows.append(row)
+        if selected is not None and proc.proc_id not in selected:
+            continue  # neither process nor any descendant selected
+        yield len(to_be_output) - 1, proc
         to_be_output.append(proc.children)
 
-    return rows
+
+def build_row(
+    args: argparse.Namespace, level: int, proc: uproctrace.processes.Process
+) -> list[str]:
+    """
+    Build row of pstree command for process at tree level.
+    """
+    # pylint: disable=duplicate-code
+    # tree level / indentation level
+    row = [str(level)]
+    # PIDs
+    if args.pids:
+        row += [f"{proc.proc_id}", f"{proc.pid}", f"{proc.ppid}"]
+    # command line
+    cmdline_str = uproctrace.formatting.cmdline2str(proc.cmdline)
+    row.append(cmdline_str)
+    # details
+    if args.details:
+        row += [
+            uproctrace.formatting.timestamp2str(proc.begin_timestamp),
+            uproctrace.formatting.timestamp2str(proc.end_timestamp),
+            uproctrace.formatting.duration2str(proc.cpu_time),
+            uproctrace.formatting.kb2str(proc.max_rss_kb),
+            uproctrace.formatting.int2str(
+                uproctrace.formatting.add_none(proc.min_flt, proc.maj_flt)
+            ),
+            uproctrace.formatting.int2str(
+                uproctrace.formatting.add_none(proc.in_block, proc.ou_block)
+            ),
+            uproctrace.formatting.int2str(
+                uproctrace.formatting.add_none(proc.n_v_csw, proc.n_iv_csw)
+            ),
+        ]
+    # inclusive metrics of process tree
+    if args.inclusive:
+        inc = proc.inclusive
+        row += [
+            uproctrace.formatting.int2str(inc.count),
+            uproctrace.formatting.duration2str(inc.cpu_time),
+            uproctrace.formatting.kb2str(inc.max_rss_kb),
+            uproctrace.formatting.int2str(inc.min_flt + inc.maj_flt),
+            uproctrace.formatting.int2str(inc.in_block + inc.ou_block),
+            uproctrace.formatting.int2str(inc.n_v_csw + inc.n_iv_csw),
+        ]
+    return row
+
+
+def build(
+    args: argparse.Namespace, processes: uproctrace.processes.Processes
+) -> list[list[str]]:
+    """
+    Build rows for pstree command.
+    """
+    return [build_row(args, level, proc) for level, proc in walk(args, processes)]
+
+
+def raw_headers(args: argparse.Namespace) -> list[str]:
+    """
+    Return field names of raw rows (see raw_row).
+    """
+    headers = ["tree_level"]
+    if args.pids:
+        headers += ["proc_id", "pid", "ppid"]
+    headers.append("cmdline")
+    if args.details:
+        headers += list(uproctrace.columns.ATTRS)
+    if args.inclusive:
+        headers += [
+            "inclusive_" + field for field in uproctrace.processes.Inclusive._fields
+        ]
+    return headers
+
+
+def raw_row(
+    args: argparse.Namespace, level: int, proc: uproctrace.processes.Process
+) -> list:
+    """
+    Build raw row (machine values: timestamps and durations in seconds,
+    memory in KiB, counts, None if not available) for process at tree level.
+    The command line is a list of strings for JSON and a string otherwise.
+    """
+    row = [level]
+    if args.pids:
+        row += [proc.proc_id, proc.pid, proc.ppid]
+    cmdline = proc.cmdline
+    if args.format not in ("json", "jsonl"):
+        cmdline = uproctrace.formatting.cmdline2str(cmdline)
+    row.append(cmdline)
+    if args.details:
+        row += [getattr(proc, field) for field in uproctrace.columns.ATTRS]
+    if args.inclusive:
+        row += list(proc.inclusive)
+    return row
 
 
 def output(args: argparse.Namespace, rows: list[list[str]]) -> None:
@@ -82,6 +179,15 @@ def output(args: argparse.Namespace, rows: list[list[str]]) -> None:
             "filesys ops",
             "ctx switches",
         ]
+    if args.inclusive:
+        headers += [
+            "processes",
+            "total CPU time",
+            "peak memory",
+            "total page faults",
+            "total filesys ops",
+            "total ctx switches",
+        ]
 
     if args.format == "table":
         headers[0] = "tree"
@@ -91,15 +197,11 @@ def output(args: argparse.Namespace, rows: list[list[str]]) -> None:
         return
 
     if args.format == "csv":
-        wr = csv.writer(sys.stdout, delimiter=";", quoting=csv.QUOTE_ALL)
-        wr.writerow(headers)
-        for row in rows:
-            wr.writerow(row)
+        uproctrace.formatting.print_csv(headers, rows)
         return
 
     if args.format == "json":
-        data = {"headers": headers, "rows": rows}
-        print(json.dumps(data, indent=2))
+        uproctrace.formatting.print_json(headers, rows)
         return
 
     # default: plain
@@ -108,16 +210,84 @@ def output(args: argparse.Namespace, rows: list[list[str]]) -> None:
         print(" ".join(row))
 
 
+def output_raw(
+    args: argparse.Namespace,
+    processes: uproctrace.processes.Processes,
+    upt_trace: str | None = None,
+) -> None:
+    """
+    Output raw rows (see raw_row) of pstree command. With formats csv and
+    jsonl, each row is printed as soon as its process is visited, so output
+    starts immediately and memory does not depend on the number of rows.
+    If upt_trace is specified, it is added as field "trace" to each row.
+    """
+    headers = raw_headers(args)
+    rows = (raw_row(args, level, proc) for level, proc in walk(args, processes))
+    if upt_trace is not None:
+        headers.insert(0, "trace")
+        rows = ([upt_trace] + row for row in rows)
+    if args.format == "jsonl":
+        uproctrace.formatting.print_jsonl(headers, rows)
+    elif args.format == "csv":
+        uproctrace.formatting.print_csv(headers, rows)
+    else:
+        uproctrace.formatting.print_json(headers, list(rows))
+
+
+def build_trace(
+    args: argparse.Namespace, upt_trace: str, jobs: int = 1
+) -> list[list[str]]:
+    """
+    Load trace (with up to jobs worker processes) and build rows for pstree
+    command.
+    """
+    processes = uproctrace.index.load_processes(upt_trace, not args.no_index, jobs)
+    return build(args, processes)
+
+
 def pstree(args: argparse.Namespace) -> None:
     """
     Print process tree.
     """
-    # pylint: disable=duplicate-code
-    for upt_trace in args.trace:
+    if args.raw or args.format == "jsonl":
+        # raw rows are streamed, load and output one trace after another
+        for upt_trace in args.trace:
+            processes = uproctrace.index.load_processes(
+                upt_trace, not args.no_index, args.jobs
+            )
+            if len(args.trace) == 1:
+                output_raw(args, processes)
+            elif args.format == "jsonl":
+                output_raw(args, processes, upt_trace)
+            else:
+                print(f"[{upt_trace:s}]:")
+                output_raw(args, processes)
+        return
+    if len(args.trace) == 1:
+        # single trace -> parse it in parallel
+        all_rows = [build_trace(args, args.trace[0], args.jobs)]
+    else:
+        all_rows = uproctrace.parallel.map_jobs(
+            functools.partial(build_trace, args), args.trace, args.jobs
+        )
+    for upt_trace, rows in zip(args.trace, all_rows):
         if len(args.trace) != 1:
             print(f"[{upt_trace:s}]:")
-        with open(upt_trace, "rb") as proto_file:
-            processes = uproctrace.processes.Processes(proto_file)
-
-        rows = build(args, processes)
         output(args, rows)
+
+
+def follow(args: argparse.Namespace) -> None:
+    """
+    Print process tree of a single trace and print it again whenever events
+    are appended to the trace.
+    """
+    processes_iter = uproctrace.follow.follow_processes(
+        args.trace[0], not args.no_index, args.interval
+    )
+    for count, processes in enumerate(processes_iter):
+        uproctrace.follow.separate(count)
+        if args.raw or args.format == "jsonl":
+            output_raw(args, processes)
+        else:
+            output(args, build(args, processes))
+        sys.stdout.flush()
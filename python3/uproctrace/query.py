@@ -0,0 +1,458 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Filter expressions for selecting processes, e.g.
+"exe ~ 'clang' and cpu_time > 2" or "descendant_of proc_id 17".
+
+Grammar (keywords are case-insensitive):
+  expr       := term ("or" term)*
+  term       := factor ("and" factor)*
+  factor     := "not" factor | "(" expr ")" | comparison | descendant
+  comparison := field operator value
+  descendant := "descendant_of" ["proc_id"] number
+Numeric fields (process metrics, proc_id, pid, ppid, duration) support the
+operators == != < <= > >= and numbers as values, string fields (exe, cwd,
+cmdline, argv0, environ) support == != ~ (regular expression search),
+startswith, endswith and contains and quoted strings as values.
+In quoted strings, the quote character and backslash are escaped with a
+backslash, regular expressions are passed on unchanged (e.g. '\\.so$').
+A comparison with a missing value (e.g. the end timestamp of a process that
+has not ended) is false. environ matches if any entry of the environment
+matches.
+"""
+
+import itertools
+import math
+import operator
+import re
+
+import uproctrace.columns
+import uproctrace.formatting
+
+# numeric fields that are not in the columnar table: field -> cost
+_PROCESS_FIELDS = {"proc_id": 1, "pid": 2, "ppid": 2, "duration": 1}
+
+# numeric fields
+NUMERIC_FIELDS = [*uproctrace.columns.ATTRS, *_PROCESS_FIELDS]
+
+# string fields (the begin event of the process needs to be decoded)
+STRING_FIELDS = ["exe", "cwd", "cmdline", "argv0", "environ"]
+
+# operators for numeric fields
+_NUMERIC_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# operators for string fields
+_STRING_OPS = ["==", "!=", "~", "startswith", "endswith", "contains"]
+
+# cost of evaluating a comparison on a string field (relative to a metric)
+_STRING_COST = 20
+
+_TOKEN_RE = re.compile(
+    r"""\s*(?:
+      (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    | (?P<op>==|!=|<=|>=|=|<|>|~|\(|\))
+    | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""",
+    re.VERBOSE,
+)
+
+
+class QueryError(ValueError):
+    """
+    Invalid filter expression.
+    """
+
+
+def _mask_or(mask1: bytes, mask2: bytes) -> bytearray:
+    """
+    Combine masks of same length: entry is 1 if it is 1 in any mask.
+    """
+    size = len(mask1)
+    value = int.from_bytes(mask1, "little") | int.from_bytes(mask2, "little")
+    return bytearray(value.to_bytes(size, "little"))
+
+
+def _mask_and_not(mask1: bytes, mask2: bytes) -> bytearray:
+    """
+    Combine masks of same length: entry is 1 if it is 1 in mask1 and 0 in
+    mask2.
+    """
+    size = len(mask1)
+    value = int.from_bytes(mask1, "little") & ~int.from_bytes(mask2, "little")
+    return bytearray(value.to_bytes(size, "little"))
+
+
+class _And:
+    """
+    Conjunction of filter expressions.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, children: list) -> None:
+        # evaluate cheap expressions first, the expensive ones are only
+        # evaluated for the processes that are left
+        self.children = sorted(children, key=operator.attrgetter("cost"))
+        self.cost = sum(child.cost for child in children)
+
+    def mask(self, processes, candidates: bytearray) -> bytearray:
+        """
+        Return mask of candidates matching the expression.
+        """
+        for child in self.children:
+            if not any(candidates):
+                break
+            candidates = child.mask(processes, candidates)
+        return candidates
+
+
+class _Or:
+    """
+    Disjunction of filter expressions.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, children: list) -> None:
+        self.children = sorted(children, key=operator.attrgetter("cost"))
+        self.cost = sum(child.cost for child in children)
+
+    def mask(self, processes, candidates: bytearray) -> bytearray:
+        """
+        Return mask of candidates matching the expression.
+        """
+        result = bytearray(len(candidates))
+        for child in self.children:
+            # only check candidates not matched yet
+            matched = child.mask(processes, candidates)
+            result = _mask_or(result, matched)
+            candidates = _mask_and_not(candidates, matched)
+        return result
+
+
+class _Not:
+    """
+    Negation of a filter expression.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, child) -> None:
+        self.child = child
+        self.cost = child.cost
+
+    def mask(self, processes, candidates: bytearray) -> bytearray:
+        """
+        Return mask of candidates matching the expression.
+        """
+        return _mask_and_not(candidates, self.child.mask(processes, candidates))
+
+
+class _Compare:
+    """
+    Comparison of a field of processes with a constant value.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, field: str, op: str, value) -> None:
+        self.field = field
+        self.op = op
+        self.value = value
+        if field in uproctrace.columns.ATTRS:
+            self.cost = 1
+        elif field in _PROCESS_FIELDS:
+            self.cost = _PROCESS_FIELDS[field]
+        else:
+            self.cost = _STRING_COST
+
+    def _test(self, value) -> bool:
+        """
+        Check if a value of the field matches.
+        """
+        if self.op in _NUMERIC_OPS:
+            return _NUMERIC_OPS[self.op](value, self.value)
+        if self.op == "~":
+            return self.value.search(value) is not None
+        if self.op == "startswith":
+            return value.startswith(self.value)
+        if self.op == "endswith":
+            return value.endswith(self.value)
+        return self.value in value  # contains
+
+    def _getValue(self, proc):
+        """
+        Return value of the field of a process (None if not available).
+        """
+        field = self.field
+        if field == "duration":
+            if proc.begin_timestamp is None or proc.end_timestamp is None:
+                return None
+            return proc.end_timestamp - proc.begin_timestamp
+        if field == "cmdline":
+            cmdline = proc.cmdline
+            return (
+                None if cmdline is None else uproctrace.formatting.cmdline2str(cmdline)
+            )
+        if field == "argv0":
+            cmdline = proc.cmdline
+            return cmdline[0] if cmdline else None
+        return getattr(proc, field)
+
+    def mask(self, processes, candidates: bytearray) -> bytearray:
+        """
+        Return mask of candidates matching the expression.
+        """
+        result = bytearray(len(candidates))
+        test = self._test
+        indices = itertools.compress(range(len(candidates)), candidates)
+        if self.field in uproctrace.columns.ATTRS:
+            # metric: use columnar table
+            columns = processes.columns
+            column = columns.column(self.field)
+            valid = columns.mask(self.field)
+            for idx in indices:
+                if valid[idx] and test(column[idx]):
+                    result[idx] = 1
+            return result
+        for idx in indices:
+            value = self._getValue(processes.getProcess(idx))
+            if value is None:
+                continue
+            if self.field == "environ":
+                if any(map(test, value)):
+                    result[idx] = 1
+            elif test(value):
+                result[idx] = 1
+        return result
+
+
+class _DescendantOf:
+    """
+    Check if processes are descendants of a process.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, proc_id: int) -> None:
+        self.proc_id = proc_id
+        self.cost = 1
+
+    def mask(self, processes, candidates: bytearray) -> bytearray:
+        """
+        Return mask of candidates matching the expression.
+        """
+        result = bytearray(len(candidates))
+        proc = processes.getProcess(self.proc_id)
+        to_be_checked = [] if proc is None else list(proc.children)
+        while to_be_checked:
+            proc = to_be_checked.pop()
+            if candidates[proc.proc_id]:
+                result[proc.proc_id] = 1
+            to_be_checked.extend(proc.children)
+        return result
+
+
+class _Parser:
+    """
+    Recursive descent parser for filter expressions.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, text: str) -> None:
+        self._tokens = self._tokenize(text)
+        self._pos = 0
+
+    @staticmethod
+    def _tokenize(text: str) -> list[tuple[str, str]]:
+        """
+        Split text into tokens: list of (kind, text).
+        """
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = _TOKEN_RE.match(text, pos)
+            if match is None or match.end() == pos:
+                raise QueryError(f"invalid filter expression at: {text[pos:]:s}")
+            kind = match.lastgroup
+            token = match.group(kind)
+            if kind == "word":
+                token = token.lower()
+            elif kind == "op" and token == "=":
+                token = "=="
+            tokens.append((kind, token))
+            pos = match.end()
+        return tokens
+
+    def _peek(self) -> tuple[str, str] | None:
+        """
+        Return next token (None at end).
+        """
+        if self._pos >= len(self._tokens):
+            return None
+        return self._tokens[self._pos]
+
+    def _next(self, what: str) -> tuple[str, str]:
+        """
+        Consume and return next token, what is expected (for error message).
+        """
+        token = self._peek()
+        if token is None:
+            raise QueryError(f"unexpected end of filter expression, expected {what:s}")
+        self._pos += 1
+        return token
+
+    def _accept(self, token: str) -> bool:
+        """
+        Consume next token if it is token (word or operator).
+        """
+        if self._peek() is not None and self._peek()[1] == token:
+            self._pos += 1
+            return True
+        return False
+
+    def parse(self):
+        """
+        Parse filter expression and return its tree.
+        """
+        node = self._parseOr()
+        if self._peek() is not None:
+            raise QueryError(f"unexpected {self._peek()[1]:s} in filter expression")
+        return node
+
+    def _parseOr(self):
+        """
+        Parse disjunction.
+        """
+        children = [self._parseAnd()]
+        while self._accept("or"):
+            children.append(self._parseAnd())
+        return children[0] if len(children) == 1 else _Or(children)
+
+    def _parseAnd(self):
+        """
+        Parse conjunction.
+        """
+        children = [self._parseNot()]
+        while self._accept("and"):
+            children.append(self._parseNot())
+        return children[0] if len(children) == 1 else _And(children)
+
+    def _parseNot(self):
+        """
+        Parse negation, parenthesized expression, comparison or descendant_of.
+        """
+        if self._accept("not"):
+            return _Not(self._parseNot())
+        if self._accept("("):
+            node = self._parseOr()
+            if not self._accept(")"):
+                raise QueryError("missing ) in filter expression")
+            return node
+        if self._accept("descendant_of"):
+            self._accept("proc_id")
+            kind, token = self._next("proc_id")
+            if kind != "number" or not token.isdigit():
+                raise QueryError(f"descendant_of: invalid proc_id {token:s}")
+            return _DescendantOf(int(token))
+        return self._parseCompare()
+
+    def _parseCompare(self):
+        """
+        Parse comparison of field with value.
+        """
+        kind, field = self._next("field")
+        if kind != "word" or field not in NUMERIC_FIELDS + STRING_FIELDS:
+            raise QueryError(f"unknown field {field:s} in filter expression")
+        _kind, op = self._next("operator")
+        kind, token = self._next("value")
+        if field in NUMERIC_FIELDS:
+            if op not in _NUMERIC_OPS:
+                raise QueryError(f"invalid operator {op:s} for field {field:s}")
+            if kind != "number":
+                raise QueryError(f"{field:s}: number expected instead of {token:s}")
+            value = float(token)
+            if not math.isfinite(value):
+                raise QueryError(f"{field:s}: invalid number {token:s}")
+            return _Compare(field, op, value)
+        if op not in _STRING_OPS:
+            raise QueryError(f"invalid operator {op:s} for field {field:s}")
+        if kind != "string":
+            raise QueryError(f"{field:s}: quoted string expected instead of {token:s}")
+        if op == "~":
+            # keep escapes for the regular expression (escaped quotes match
+            # the quote character anyway)
+            value = token[1:-1]
+            try:
+                return _Compare(field, op, re.compile(value))
+            except re.error as exc:
+                raise QueryError(
+                    f"invalid regular expression {value:s}: {exc}"
+                ) from exc
+        value = re.sub(r"\\([\\" + token[0] + "])", r"\1", token[1:-1])
+        return _Compare(field, op, value)
+
+
+class Query:
+    """
+    Filter expression compiled into a tree of predicates (see module
+    docstring for the syntax).
+
+    The expression is evaluated as a mask over the processes (index is
+    proc_id, see columns.Columns). Conjunctions evaluate their cheap parts
+    (process metrics from the columnar table) first and the expensive parts
+    (strings from the begin events) only for the processes left.
+    Queries can be pickled, e.g. to pass them to worker processes.
+    """
+
+    def __init__(self, text: str) -> None:
+        """
+        Compile filter expression, raise QueryError if it is invalid.
+        """
+        self._text = text
+        self._root = _Parser(text).parse()
+
+    def __str__(self) -> str:
+        return self._text
+
+    def mask(self, processes, candidates: bytes | None = None) -> bytearray:
+        """
+        Evaluate filter expression for processes (see processes.Processes).
+        If candidates (mask) is specified, only check the processes where it
+        is 1. Return mask of matching processes (index is proc_id).
+        """
+        if candidates is None:
+            candidates = bytearray(b"\x01") * len(processes.columns)
+        return self._root.mask(processes, bytearray(candidates))
+
+
+def select_mask(
+    processes, where: "Query | str | None" = None, window: tuple | None = None
+) -> bytearray | None:
+    """
+    Return mask of processes (index is proc_id) alive in time window (since,
+    until) (see timeindex.TimeIndex.window) and matching filter expression
+    where. Either may be None. Return None if both are None (all processes).
+    """
+    mask = None
+    if window is not None:
+        time_index = processes.time_index
+        mask = bytearray(len(time_index))
+        for proc_id in time_index.overlapping(*time_index.window(*window)):
+            mask[proc_id] = 1
+    if where is not None:
+        if isinstance(where, str):
+            where = Query(where)
+        mask = where.mask(processes, mask)
+    return mask
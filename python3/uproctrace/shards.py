@@ -0,0 +1,116 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Sharded traces: "upt-tool merge".
+
+In sharded mode (see upt-trace), each traced process appends its events to
+its own shard file <trace directory>/<pid>.upt, so processes running in
+parallel never write to the same file.
+
+The shards are combined into a single stream of events by a k-way merge by
+event timestamp. Events with equal timestamps keep the order of the shards
+(by pid) and their order within their shard. The merged stream can be
+written to a trace file (see merge) or parsed directly (see load_processes),
+both yield the same processes.
+"""
+
+import heapq
+import io
+import operator
+import os
+import typing
+
+import uproctrace.files
+import uproctrace.parse
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+
+def _is_shard_name(name: str) -> bool:
+    """
+    Check if file name (without directory) is the name of a shard <pid>.upt.
+    """
+    return name.endswith(".upt") and name[: -len(".upt")].isdigit()
+
+
+def is_shard_dir(upt_trace: str) -> bool:
+    """
+    Check if upt_trace is a directory of shards (and not a trace file), i.e.
+    a directory containing at least one shard <pid>.upt.
+    """
+    return os.path.isdir(upt_trace) and any(map(_is_shard_name, os.listdir(upt_trace)))
+
+
+def merged_filename(shard_dir: str) -> str:
+    """
+    Return default file name of merged trace file for directory of shards.
+    """
+    return os.path.normpath(shard_dir) + ".upt"
+
+
+def shard_files(shard_dir: str) -> list[str]:
+    """
+    Return file names of shards in directory (ordered by pid).
+    """
+    names = [name for name in os.listdir(shard_dir) if _is_shard_name(name)]
+    names.sort(key=lambda name: (len(name), name))
+    return [os.path.join(shard_dir, name) for name in names]
+
+
+def _read_shard(filename: str) -> list[tuple[tuple[int, int], bytes]]:
+    """
+    Read events of shard: list of (timestamp (s, ns), payload), ordered by
+    timestamp.
+    """
+    events = []
+    with open(filename, "rb") as proto_file:
+        for payload in uproctrace.parse.Reader(proto_file).payloads():
+            timestamp = pb2.event.FromString(payload).timestamp
+            events.append(((timestamp.sec, timestamp.nsec), payload))
+    # events are appended in time order, sort only in case the clock jumped
+    events.sort(key=operator.itemgetter(0))
+    return events
+
+
+def merged_events(shard_dir: str) -> typing.Iterator[bytes]:
+    """
+    Iterate over events (header and payload) of all shards in directory in
+    the order of their timestamps.
+    Each shard is read entirely before merging (shards of processes are
+    small, and keeping all shards open could exceed the limit of open files).
+    """
+    shards = [_read_shard(filename) for filename in shard_files(shard_dir)]
+    for _timestamp, payload in heapq.merge(*shards, key=operator.itemgetter(0)):
+        yield uproctrace.parse.frame(payload)
+
+
+def merge(shard_dir: str, filename: str) -> int:
+    """
+    Merge shards in directory into trace file. The file is replaced
+    atomically.
+    Return number of events.
+    """
+    count = 0
+    with uproctrace.files.replace_file(filename) as tmp_filename:
+        with open(tmp_filename, "wb") as proto_file:
+            for event in merged_events(shard_dir):
+                proto_file.write(event)
+                count += 1
+    return count
+
+
+def open_merged(shard_dir: str) -> io.BytesIO:
+    """
+    Return file object of merged trace of directory of shards (without
+    writing a merged trace file).
+    """
+    return io.BytesIO(b"".join(merged_events(shard_dir)))
+
+
+def load_processes(shard_dir: str) -> uproctrace.processes.Processes:
+    """
+    Load all processes from directory of shards (without writing a merged
+    trace file). Event offsets refer to the merged trace (see merge).
+    """
+    return uproctrace.processes.Processes(open_merged(shard_dir))
@@ -0,0 +1,452 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+SQLite databases of traces: "upt-tool sqlite".
+
+A database contains the processes of a trace in indexed tables for ad-hoc
+SQL queries:
+  - processes: one row per process: proc_id, pid, ppid, parent (proc_id of
+    parent process), sibling (position among the children of the parent),
+    running (1 if the process has not ended), offsets of begin and end event
+    in the trace, begin_sec and begin_nsec (exact begin time), exe, cwd,
+    argc and envc (numbers of command line arguments and environment
+    variables), the metrics of columns.ATTRS (missing values are NULL),
+  - cmdline: command line arguments (proc_id, idx, arg),
+  - environ: environment variables (proc_id, idx, var),
+  - meta: key/value pairs (format version, trace file, offset behind the last
+    event in the trace file).
+The rows are inserted in large transactions with executemany, the indices are
+created after all rows have been inserted.
+
+A database can be passed to upt-tool instead of a trace file: the processes
+are loaded from the database (see load_processes, load_process and
+load_columns) instead of parsing the trace file.
+"""
+
+import array
+import contextlib
+import itertools
+import pathlib
+import sqlite3
+import typing
+
+import uproctrace.columns
+import uproctrace.files
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+# format version of databases
+VERSION = 2
+
+# first bytes of SQLite database files
+_SQLITE_MAGIC = b"SQLite format 3\0"
+
+# number of rows inserted per executemany call
+BATCH_SIZE = 65536
+
+# columns of processes table before the metrics: name -> SQL declaration
+PROC_COLUMNS = {
+    "proc_id": "INTEGER PRIMARY KEY",
+    "pid": "INTEGER NOT NULL",
+    "ppid": "INTEGER",
+    "parent": "INTEGER REFERENCES processes(proc_id)",
+    "sibling": "INTEGER",
+    "running": "INTEGER NOT NULL",
+    "begin_offset": "INTEGER",
+    "end_offset": "INTEGER",
+    "begin_sec": "INTEGER",
+    "begin_nsec": "INTEGER",
+    "exe": "TEXT",
+    "cwd": "TEXT",
+    "argc": "INTEGER",
+    "envc": "INTEGER",
+}
+
+_SCHEMA = f"""
+CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE processes (
+  {", ".join(f"{name:s} {decl:s}" for name, decl in PROC_COLUMNS.items()):s},
+  {", ".join(
+      f"{attr:s} {'REAL' if code == 'd' else 'INTEGER'}"
+      for attr, code in uproctrace.columns.ATTRS.items()
+  ):s}
+);
+CREATE TABLE cmdline (
+  proc_id INTEGER NOT NULL REFERENCES processes(proc_id),
+  idx INTEGER NOT NULL,
+  arg TEXT NOT NULL,
+  PRIMARY KEY (proc_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE environ (
+  proc_id INTEGER NOT NULL REFERENCES processes(proc_id),
+  idx INTEGER NOT NULL,
+  var TEXT NOT NULL,
+  PRIMARY KEY (proc_id, idx)
+) WITHOUT ROWID;
+"""
+
+_INDICES = """
+CREATE INDEX processes_parent ON processes (parent, sibling);
+CREATE INDEX processes_pid ON processes (pid);
+CREATE INDEX processes_exe ON processes (exe);
+CREATE INDEX processes_begin ON processes (begin_timestamp);
+CREATE INDEX processes_end ON processes (end_timestamp);
+CREATE INDEX cmdline_arg ON cmdline (arg);
+CREATE INDEX environ_var ON environ (var);
+"""
+
+
+def database_filename(upt_trace: str) -> str:
+    """
+    Return default file name of database for trace file.
+    """
+    return upt_trace + ".db"
+
+
+def is_database(filename: str) -> bool:
+    """
+    Check if file is an SQLite database (and not a trace file).
+    """
+    try:
+        with open(filename, "rb") as db_file:
+            return db_file.read(len(_SQLITE_MAGIC)) == _SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def _process_rows(
+    processes: uproctrace.processes.Processes,
+) -> typing.Iterator[tuple[tuple, list, list]]:
+    """
+    Iterate over rows of all processes: (row of processes table, rows of
+    cmdline table, rows of environ table).
+    """
+    running = {proc.proc_id for proc in processes.current}
+    siblings = {}
+    for proc in processes.getAllProcesses().values():
+        for sibling, child in enumerate(proc.children):
+            siblings[child.proc_id] = sibling
+    columns = processes.columns
+    metrics = [
+        map(
+            lambda value, valid: value if valid else None,
+            columns.column(attr),
+            columns.mask(attr),
+        )
+        for attr in uproctrace.columns.ATTRS
+    ]
+    for proc_id, values in enumerate(zip(*metrics)):
+        proc = processes.getProcess(proc_id)
+        parent = proc.parent
+        begin = proc.getBegin()  # decoded once for all its fields
+        cmdline = None if begin is None else begin.cmdline
+        environ = proc.environ  # may be looked up by hash (see Environs)
+        yield (
+            (
+                proc_id,
+                proc.pid,
+                proc.ppid,
+                None if parent is None else parent.proc_id,
+                siblings.get(proc_id),
+                int(proc_id in running),
+                *processes.getEventOffsets(proc_id),
+                *((None, None) if begin is None else begin.timespec),
+                None if begin is None else begin.exe,
+                None if begin is None else begin.cwd,
+                None if cmdline is None else len(cmdline),
+                None if environ is None else len(environ),
+                *values,
+            ),
+            [(proc_id, idx, arg) for idx, arg in enumerate(cmdline or ())],
+            [(proc_id, idx, var) for idx, var in enumerate(environ or ())],
+        )
+
+
+def _insert_rows(conn: sqlite3.Connection, rows: dict[str, list]) -> None:
+    """
+    Insert rows into tables (table name -> list of rows) and clear them.
+    """
+    for table, table_rows in rows.items():
+        if table_rows:
+            placeholders = ", ".join("?" * len(table_rows[0]))
+            conn.executemany(
+                f"INSERT INTO {table:s} VALUES ({placeholders:s})", table_rows
+            )
+            table_rows.clear()
+
+
+def write_database(
+    filename: str, processes: uproctrace.processes.Processes, upt_trace: str = ""
+) -> int:
+    """
+    Write processes (of trace file upt_trace) to a new SQLite database.
+    The file is replaced atomically.
+    Return number of processes written.
+    """
+    with uproctrace.files.replace_file(filename) as tmp_filename:
+        with contextlib.closing(sqlite3.connect(tmp_filename)) as conn:
+            # the file is only used after it is complete (atomic replace),
+            # so neither a journal nor syncing is needed while writing it
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.executescript(_SCHEMA)
+            rows: dict[str, list] = {
+                "meta": [
+                    ("version", VERSION),
+                    ("trace", upt_trace),
+                    ("trace_offset", processes.trace_offset),
+                ],
+                "processes": [],
+                "cmdline": [],
+                "environ": [],
+            }
+            with conn:  # single transaction
+                for proc_row, cmdline_rows, environ_rows in _process_rows(processes):
+                    rows["processes"].append(proc_row)
+                    rows["cmdline"] += cmdline_rows
+                    rows["environ"] += environ_rows
+                    if len(rows["processes"]) >= BATCH_SIZE:
+                        _insert_rows(conn, rows)
+                _insert_rows(conn, rows)
+            conn.executescript(_INDICES)
+    return len(processes.columns)
+
+
+class DatabaseError(ValueError):
+    """
+    File is not a database (of this format version).
+    """
+
+
+def _connect(filename: str) -> sqlite3.Connection:
+    """
+    Open database read-only and check its format version.
+    Raise DatabaseError if the file is not a database of this format version.
+    """
+    uri = pathlib.Path(filename).absolute().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        version = conn.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()
+    except sqlite3.DatabaseError:
+        version = None
+    if version != (VERSION,):
+        conn.close()
+        raise DatabaseError(
+            f"{filename:s}: not a UProcTrace database of version {VERSION:d}"
+        )
+    return conn
+
+
+def _begin_data(row: tuple, cmdline: list[str], environ: list[str]) -> bytes | None:
+    """
+    Rebuild serialized begin event (see parse.BaseEvent.toBytes) of process
+    from row (proc_id, pid, ppid, begin_sec, begin_nsec, exe, cwd, argc,
+    envc), command line and environment.
+    Return None if the process has no begin event.
+    """
+    _proc_id, pid, ppid, sec, nsec, exe, cwd, argc, envc = row
+    if sec is None:
+        return None
+    pb2_ev = pb2.event()
+    pb2_ev.timestamp.sec = sec
+    if nsec is not None:
+        pb2_ev.timestamp.nsec = nsec
+    p_b = pb2_ev.proc_begin
+    p_b.pid = pid
+    if ppid is not None:
+        p_b.ppid = ppid
+    if exe is not None:
+        p_b.exe = exe
+    if cwd is not None:
+        p_b.cwd = cwd
+    if argc is not None:
+        p_b.cmdline.SetInParent()
+        p_b.cmdline.s.extend(cmdline)
+    if envc is not None:
+        p_b.environ.SetInParent()
+        p_b.environ.s.extend(environ)
+    return pb2_ev.SerializeToString()
+
+
+def _strings(
+    conn: sqlite3.Connection, table: str, condition: str, params: tuple
+) -> dict[int, list[str]]:
+    """
+    Read string list table (cmdline or environ) for processes matching
+    condition (SQL expression on proc_id). Return proc_id -> list of strings.
+    """
+    cursor = conn.execute(
+        f"SELECT * FROM {table:s} WHERE {condition:s} ORDER BY proc_id, idx", params
+    )
+    return {
+        proc_id: [entry[2] for entry in entries]
+        for proc_id, entries in itertools.groupby(cursor, lambda entry: entry[0])
+    }
+
+
+def _make_processes(
+    conn: sqlite3.Connection, condition: str = "1", params: tuple = ()
+) -> dict[int, uproctrace.processes.Process]:
+    """
+    Make processes matching condition (SQL expression on proc_id) from
+    database, without parent and children. Return proc_id -> process.
+    """
+    attrs = list(uproctrace.columns.ATTRS)
+    cmdlines = _strings(conn, "cmdline", condition, params)
+    environs = _strings(conn, "environ", condition, params)
+    cursor = conn.execute(
+        "SELECT proc_id, pid, ppid, begin_sec, begin_nsec, exe, cwd, argc, envc, "
+        + ", ".join(attrs)
+        + f" FROM processes WHERE {condition:s} ORDER BY proc_id",
+        params,
+    )
+    procs = {}
+    for row in cursor:
+        proc_id, pid, ppid = row[:3]
+        values = dict(zip(attrs, row[9:]))
+        begin_data = _begin_data(
+            row[:9], cmdlines.get(proc_id, []), environs.get(proc_id, [])
+        )
+        proc = uproctrace.processes.Process(proc_id, pid)
+        proc.restore(begin_data, ppid, values)
+        procs[proc_id] = proc
+    return procs
+
+
+class _DatabaseIndex:
+    """
+    Processes loaded from a database, in the form of an index (see
+    index.Index) from which Processes restores them.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        """
+        Load all processes from database.
+        """
+        self._procs = _make_processes(conn)
+        self._children: dict[int, list[int]] = {}
+        self._arrays = {
+            "begin_offset": array.array("q"),
+            "end_offset": array.array("q"),
+        }
+        self.current = []
+        self.toplevel = []
+        cursor = conn.execute(
+            "SELECT proc_id, parent, running, begin_offset, end_offset"
+            " FROM processes ORDER BY proc_id"
+        )
+        for proc_id, parent, running, begin_offset, end_offset in cursor:
+            if parent is None:
+                self.toplevel.append(proc_id)
+            if running:
+                self.current.append(proc_id)
+            for name, offset in (
+                ("begin_offset", begin_offset),
+                ("end_offset", end_offset),
+            ):
+                self._arrays[name].append(-1 if offset is None else offset)
+        cursor = conn.execute(
+            "SELECT proc_id, parent FROM processes WHERE parent IS NOT NULL"
+            " ORDER BY parent, sibling"
+        )
+        for proc_id, parent in cursor:
+            self._children.setdefault(parent, []).append(proc_id)
+        self.trace_offset = conn.execute(
+            "SELECT value FROM meta WHERE key = 'trace_offset'"
+        ).fetchone()[0]
+        self.columns = uproctrace.columns.Columns.fromProcesses(self._procs.values())
+
+    def __len__(self) -> int:
+        """
+        Number of processes.
+        """
+        return len(self._procs)
+
+    def array(self, name: str):
+        """
+        Return array with one entry per process (begin_offset or end_offset).
+        """
+        return self._arrays[name]
+
+    def children(self, proc_id: int) -> list[int]:
+        """
+        Return proc_ids of children of process.
+        """
+        return self._children.get(proc_id, [])
+
+    def makeProcess(self, _proto_file, proc_id: int) -> uproctrace.processes.Process:
+        """
+        Return process (without parent and children).
+        """
+        return self._procs[proc_id]
+
+    @property
+    def string_table_offsets(self) -> list[int]:
+        """
+        Offsets of string table events (none, strings are stored resolved).
+        """
+        return []
+
+
+def load_processes(filename: str) -> uproctrace.processes.Processes:
+    """
+    Load all processes from database.
+    Raise DatabaseError if the file is not a database (of this format version).
+    """
+    with contextlib.closing(_connect(filename)) as conn:
+        return uproctrace.processes.Processes(None, _DatabaseIndex(conn))
+
+
+def load_process(filename: str, proc_id: int) -> uproctrace.processes.Process | None:
+    """
+    Load process (including parent and children) with proc_id from database,
+    without loading all other processes.
+    Parent and children are not linked any further.
+    Return None if there is no process with proc_id.
+    Raise DatabaseError if the file is not a database (of this format version).
+    """
+    with contextlib.closing(_connect(filename)) as conn:
+        row = conn.execute(
+            "SELECT parent FROM processes WHERE proc_id = ?", (proc_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        condition = "proc_id = ? OR proc_id = ? OR proc_id IN"
+        condition += " (SELECT proc_id FROM processes WHERE parent = ?)"
+        procs = _make_processes(conn, condition, (proc_id, row[0], proc_id))
+        children = conn.execute(
+            "SELECT proc_id FROM processes WHERE parent = ? ORDER BY sibling",
+            (proc_id,),
+        ).fetchall()
+    proc = procs[proc_id]
+    if row[0] is not None:
+        proc.setParent(procs[row[0]])
+    for (child_proc_id,) in children:
+        child = procs[child_proc_id]
+        proc.addChild(child)
+        child.setParent(proc)
+    return proc
+
+
+def load_columns(filename: str) -> uproctrace.columns.Columns:
+    """
+    Load columnar table of process metrics from database.
+    Raise DatabaseError if the file is not a database (of this format version).
+    """
+    attrs = list(uproctrace.columns.ATTRS)
+    with contextlib.closing(_connect(filename)) as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(attrs):s} FROM processes ORDER BY proc_id"
+        ).fetchall()
+    columns = {}
+    masks = {}
+    for idx, (attr, code) in enumerate(uproctrace.columns.ATTRS.items()):
+        values = [row[idx] for row in rows]
+        masks[attr] = bytearray(value is not None for value in values)
+        columns[attr] = array.array(
+            code, [0 if value is None else value for value in values]
+        )
+    return uproctrace.columns.Columns(columns, masks)
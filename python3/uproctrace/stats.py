@@ -5,11 +5,24 @@
 Statistics for uproctrace trace files.
 """
 
+import functools
+import sys
+import typing
+
 import tabulate
-import uproctrace.processes
+import uproctrace.columns
+import uproctrace.compress
+import uproctrace.follow
+import uproctrace.histogram
+import uproctrace.index
+import uproctrace.parallel
+import uproctrace.parse
+import uproctrace.query
+import uproctrace.shards
+import uproctrace.sqlite
 
 # Map of process attribute to attribute title and unit
-_PROCESS_ATTRS = {
+PROCESS_ATTRS = {
     "cpu_time": ("CPU Time", "s"),
     "sys_time": ("Kernel Time", "s"),
     "user_time": ("User Time", "s"),
@@ -20,62 +33,353 @@ _PROCESS_ATTRS = {
     "max_rss_kb": ("Maximum Resident Set Size", "KiB"),
 }
 
+# Quantiles to show: title -> quantile
+_QUANTILES = {
+    "P50": 0.5,
+    "P90": 0.9,
+    "P99": 0.99,
+}
+
 
-def calculate_stats(upt_traces: list) -> dict:
+def _new_stats(histograms: bool = False) -> dict:
     """
-    Calculates trace statistics, such like the CPU time of processes, for
-    the given list of traces and returns mapping of process attribute to
-    tuple of (min value, mean value, max value, cummulative value).
+    Return empty partial statistics (see _trace_stats).
     """
+    return dict(
+        (
+            attr,
+            [
+                None,
+                None,
+                0,
+                0,
+                uproctrace.histogram.Histogram() if histograms else None,
+            ],
+        )
+        for attr in PROCESS_ATTRS
+    )
 
-    # The overall statistics
-    attr_values = dict((attr, []) for attr in _PROCESS_ATTRS)
 
-    for upt_trace in upt_traces:
+class _StatsVisitor(uproctrace.parse.Visitor):
+    """
+    Visitor calculating partial statistics (see _trace_stats) while the
+    events are read, without keeping the processes.
 
-        # Load all processes of the trace file
-        with open(upt_trace, "rb") as upt_f:
-            processes = uproctrace.processes.Processes(upt_f)
+    Only the PIDs of running processes that have a begin event are kept, so
+    processes without a begin or an end event can be ignored.
+    """
 
-        for process in processes.getAllProcesses().values():
+    def __init__(self, histograms: bool = False):
+        """
+        Initialize empty statistics (with histograms if histograms is True).
+        """
+        super().__init__()
+        self.partial = _new_stats(histograms)
+        self._begun: set[int] = set()
 
-            # Ignore processes for which we do not have full information
-            if process.begin_timestamp is None or process.end_timestamp is None:
+    def visitProcBegin(self, proc_begin: uproctrace.parse.ProcBegin):
+        """
+        Remember that process has begun.
+        """
+        self._begun.add(proc_begin.pid)
+
+    def visitProcEnd(self, proc_end: uproctrace.parse.ProcEnd):
+        """
+        Add values of process end event to statistics, if process has begun.
+        """
+        pid = proc_end.pid
+        if pid not in self._begun:
+            return  # no begin event -> ignore process
+        self._begun.remove(pid)
+        for attr, acc in self.partial.items():
+            value = getattr(proc_end, attr)
+            if value is None:
                 continue
+            if acc[3]:
+                if value < acc[0]:
+                    acc[0] = value
+                elif value > acc[1]:
+                    acc[1] = value
+            else:
+                acc[0] = acc[1] = value
+            acc[2] += value
+            acc[3] += 1
+            if acc[4] is not None:
+                acc[4].add(value)
+
+
+def _trace_stats(
+    upt_trace: str,
+    use_index: bool = True,
+    histograms: bool = False,
+    window: tuple | None = None,
+    where: "uproctrace.query.Query | None" = None,
+) -> dict:
+    """
+    Calculate partial statistics of a single trace: mapping of process
+    attribute to [min value, max value, cumulative value, count, histogram].
+    The histogram (see module histogram) is only built if histograms is True
+    (None otherwise).
+    If use_index is True and there is a valid index of the trace, use it.
+    Otherwise, stream the events of the trace (without creating an index).
+    If upt_trace is a database (see module sqlite), use its metrics.
+    If upt_trace is a directory of shards (see module shards), merge them.
+    If window is (since, until) (see timeindex.TimeIndex.window), only
+    processes alive in this time window are taken into account; they are
+    found with the time index of the processes.
+    If where is specified, only processes matching this filter expression
+    (see module query) are taken into account.
+    """
+    if window is not None or where is not None:
+        processes = uproctrace.index.load_processes(upt_trace, use_index)
+        return _columns_stats(
+            processes.columns,
+            histograms,
+            uproctrace.query.select_mask(processes, where, window),
+        )
+    if uproctrace.sqlite.is_database(upt_trace):
+        return _columns_stats(uproctrace.sqlite.load_columns(upt_trace), histograms)
+    if uproctrace.shards.is_shard_dir(upt_trace):
+        processes = uproctrace.shards.load_processes(upt_trace)
+        return _columns_stats(processes.columns, histograms)
+    with uproctrace.compress.open_trace(upt_trace) as proto_file:
+        if use_index:
+            index = uproctrace.index.read_index(proto_file, upt_trace)
+            if index is not None:
+                return _columns_stats(index.columns, histograms)
+        visitor = _StatsVisitor(histograms)
+        for pb2_ev in uproctrace.parse.Reader(proto_file):
+            uproctrace.parse.visit_event(pb2_ev, visitor)
+        return visitor.partial
+
+
+def _columns_stats(
+    columns: uproctrace.columns.Columns,
+    histograms: bool = False,
+    mask: bytes | None = None,
+) -> dict:
+    """
+    Calculate partial statistics (see _trace_stats) of columnar table of
+    process metrics (only of rows where mask is 1, if mask is specified).
+    """
+    # Ignore processes for which we do not have full information
+    complete = columns.complete
+    if mask is not None:
+        complete = uproctrace.columns.mask_and(complete, mask)
+
+    partial = _new_stats(histograms)
+    for attr, acc in partial.items():
+        values = columns.values(attr, complete)
+        if values:
+            acc[:4] = [min(values), max(values), sum(values), len(values)]
+            if acc[4] is not None:
+                acc[4].addValues(values)
+    return partial
+
+
+def _merge_stats(acc: dict, partial: dict) -> None:
+    """
+    Merge partial statistics into accumulated statistics
+    (both as returned by _trace_stats).
+    """
+    for attr, (vmin, vmax, vcum, count, hist) in partial.items():
+        if not count:
+            continue
+        attr_acc = acc[attr]
+        attr_acc[0] = vmin if attr_acc[0] is None else min(attr_acc[0], vmin)
+        attr_acc[1] = vmax if attr_acc[1] is None else max(attr_acc[1], vmax)
+        attr_acc[2] += vcum
+        attr_acc[3] += count
+        if attr_acc[4] is not None:
+            attr_acc[4].merge(hist)
 
-            # Update the values
-            for attr in _PROCESS_ATTRS:
-                attr_values[attr].append(getattr(process, attr))
 
-    # Calulate the statistics
+def _final_stats(acc: dict) -> dict:
+    """
+    Calculate final statistics from accumulated statistics: mapping of
+    process attribute to tuple of (min value, mean value, max value,
+    cummulative value).
+    """
     stats = {}
-    for attr, values in attr_values.items():
-        if not values:
+    for attr, (vmin, vmax, vcum, count, _hist) in acc.items():
+        if not count:
             stats[attr] = (0, 0, 0, 0)
             continue
 
-        vmin = min(values)
-        vmax = max(values)
-        vcum = sum(values)
-        vmean = vcum / len(values)
+        vmean = vcum / count
         stats[attr] = (vmin, vmean, vmax, vcum)
 
     return stats
 
 
-def dump_stats(upt_traces: list):
+def _partial_stats(
+    upt_traces: list,
+    use_index: bool,
+    jobs: int,
+    histograms: bool = False,
+    *,
+    window: tuple | None = None,
+    where: "uproctrace.query.Query | None" = None,
+) -> typing.Iterator:
+    """
+    Calculate partial statistics of traces, using up to jobs worker processes.
+    Return iterator over partial statistics (in the order of the traces).
+    """
+    # pylint: disable=too-many-arguments
+    return uproctrace.parallel.map_jobs(
+        functools.partial(
+            _trace_stats,
+            use_index=use_index,
+            histograms=histograms,
+            window=window,
+            where=where,
+        ),
+        upt_traces,
+        jobs,
+    )
+
+
+def calculate_stats(
+    upt_traces: list,
+    use_index: bool = True,
+    jobs: int = 1,
+    *,
+    window: tuple | None = None,
+    where: "uproctrace.query.Query | None" = None,
+) -> dict:
     """
     Calculates trace statistics, such like the CPU time of processes, for
-    the given list of traces and dumps the statistics to standard output as
-    a table.
+    the given list of traces and returns mapping of process attribute to
+    tuple of (min value, mean value, max value, cummulative value).
+    Valid index files of the traces are used if use_index is True, other
+    traces are streamed (processes are not kept in memory).
+    The traces are processed by up to jobs worker processes in parallel.
+    If window is (since, until) (see timeindex.TimeIndex.window), only
+    processes alive in this time window are taken into account.
+    If where is specified, only processes matching this filter expression
+    (see module query) are taken into account.
+    """
+
+    # The overall statistics: attribute -> [min, max, cumulative, count, None]
+    acc = _new_stats()
+    for partial in _partial_stats(
+        upt_traces, use_index, jobs, window=window, where=where
+    ):
+        _merge_stats(acc, partial)
+
+    return _final_stats(acc)
+
+
+def calculate_histograms(
+    upt_traces: list, use_index: bool = True, jobs: int = 1
+) -> dict:
+    """
+    Calculates histograms of process attributes (see module histogram) for
+    the given list of traces and returns mapping of process attribute to
+    histogram (e.g. to estimate quantiles).
+    """
+    acc = _new_stats(True)
+    for partial in _partial_stats(upt_traces, use_index, jobs, True):
+        _merge_stats(acc, partial)
+
+    return {attr: attr_acc[4] for attr, attr_acc in acc.items()}
+
+
+def _print_stats(acc: dict, quantiles: bool = False, histograms: bool = False):
+    """
+    Print accumulated statistics to standard output as a table.
+    If quantiles is True, include the quantiles.
+    If histograms is True, print the histograms below the table.
+    (Histograms must be present in the statistics for both.)
     """
-    # Calulate the statistics
-    stats = calculate_stats(upt_traces)
+    headers = ["Attribute", "Min", "Mean", "Max", "Cumulative"]
+    if quantiles:
+        headers += list(_QUANTILES)
 
     rows = []
-    for attr, values in stats.items():
-        title, unit = _PROCESS_ATTRS[attr]
+    for attr, values in _final_stats(acc).items():
+        title, unit = PROCESS_ATTRS[attr]
+        if quantiles:
+            hist = acc[attr][4]
+            values += tuple(hist.quantile(q) or 0 for q in _QUANTILES.values())
         rows += [[title] + [f"{v:.2f}{unit:s}" for v in values]]
 
-    headers = ["Attribute", "Min", "Mean", "Max", "Cumulative"]
     print(tabulate.tabulate(rows, headers=headers))
+
+    if histograms:
+        for attr, (_vmin, _vmax, _vcum, _count, hist) in acc.items():
+            title, unit = PROCESS_ATTRS[attr]
+            print("")
+            print(f"{title:s}:")
+            for line in hist.render(lambda v, unit=unit: f"{v:.3g}{unit:s}"):
+                print("  " + line)
+
+
+def dump_stats(
+    upt_traces: list,
+    use_index: bool = True,
+    jobs: int = 1,
+    per_trace: bool = False,
+    *,
+    quantiles: bool = False,
+    histograms: bool = False,
+    window: tuple | None = None,
+    where: "uproctrace.query.Query | None" = None,
+):
+    """
+    Calculates trace statistics, such like the CPU time of processes, for
+    the given list of traces and dumps the statistics to standard output as
+    a table.
+    If per_trace is True, dump the statistics of each trace separately.
+    If quantiles is True, include the quantiles (P50, P90, P99).
+    If histograms is True, also dump histograms of the process attributes.
+    If window is (since, until) (see timeindex.TimeIndex.window), only
+    processes alive in this time window are taken into account.
+    If where is specified, only processes matching this filter expression
+    (see module query) are taken into account.
+    """
+    # pylint: disable=too-many-arguments
+    hists = quantiles or histograms
+    partials = _partial_stats(
+        upt_traces, use_index, jobs, hists, window=window, where=where
+    )
+    if not per_trace:
+        acc = _new_stats(hists)
+        for partial in partials:
+            _merge_stats(acc, partial)
+        _print_stats(acc, quantiles, histograms)
+        return
+
+    for upt_trace, partial in zip(upt_traces, partials):
+        print(f"[{upt_trace:s}]:")
+        _print_stats(partial, quantiles, histograms)
+        print("")
+
+
+def follow_stats(
+    upt_trace: str,
+    use_index: bool = True,
+    interval: float = 1.0,
+    *,
+    quantiles: bool = False,
+    histograms: bool = False,
+    window: tuple | None = None,
+    where: "uproctrace.query.Query | None" = None,
+):
+    """
+    Dump statistics of a single trace to standard output and dump them again
+    whenever events are appended to the trace (polled every interval seconds).
+    If window is (since, until) (see timeindex.TimeIndex.window), only
+    processes alive in this time window are taken into account.
+    If where is specified, only processes matching this filter expression
+    (see module query) are taken into account.
+    """
+    # pylint: disable=too-many-arguments
+    hists = quantiles or histograms
+    processes_iter = uproctrace.follow.follow_processes(upt_trace, use_index, interval)
+    for count, processes in enumerate(processes_iter):
+        mask = uproctrace.query.select_mask(processes, where, window)
+        partial = _columns_stats(processes.columns, hists, mask)
+        uproctrace.follow.separate(count)
+        _print_stats(partial, quantiles, histograms)
+        sys.stdout.flush()
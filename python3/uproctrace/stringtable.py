@@ -0,0 +1,121 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Interned traces: "upt-tool intern".
+
+An interned trace stores each distinct executable, working directory and
+command line argument once, in string table events. Process begin events
+reference the strings by id (exe_id, cwd_id, cmdline_ids). Each string table
+event precedes the first event referencing its strings, so an interned trace
+can be read (and followed) in a single pass like any other trace.
+
+Traces are interned after recording: each traced process writes only its
+own begin event, so strings can only be shared across the whole trace.
+"""
+
+import os
+
+import uproctrace.files
+import uproctrace.parse
+import uproctrace.uproctrace_pb2 as pb2
+
+
+def interned_filename(upt_trace: str) -> str:
+    """
+    Return default file name of interned trace for trace file.
+    """
+    root, ext = os.path.splitext(upt_trace)
+    return f"{root:s}.interned{ext or '.upt':s}"
+
+
+class Interner:
+    """
+    Assignment of ids to strings while writing an interned trace.
+    """
+
+    def __init__(self):
+        """
+        Initialize without any strings.
+        """
+        self._ids: dict[str, int] = {}
+        self._new: list[str] = []
+
+    def __len__(self) -> int:
+        """
+        Number of strings with id.
+        """
+        return len(self._ids)
+
+    def stringId(self, string: str) -> int:
+        """
+        Return id of string, assign new id if string is new.
+        """
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = len(self._ids)
+            self._ids[string] = string_id
+            self._new.append(string)
+        return string_id
+
+    def internBegin(self, proc_begin: uproctrace.parse.ProcBegin) -> pb2.event:
+        """
+        Return PB2 event of process begin event with executable, working
+        directory and command line replaced by ids.
+        """
+        pb2_ev = pb2.event.FromString(proc_begin.toBytes())
+        p_b = pb2_ev.proc_begin
+        for field in ("exe", "cwd", "cmdline", "exe_id", "cwd_id", "cmdline_ids"):
+            p_b.ClearField(field)
+        if proc_begin.exe is not None:
+            p_b.exe_id = self.stringId(proc_begin.exe)
+        if proc_begin.cwd is not None:
+            p_b.cwd_id = self.stringId(proc_begin.cwd)
+        if proc_begin.cmdline is not None:
+            p_b.cmdline_ids.SetInParent()
+            p_b.cmdline_ids.id.extend(self.stringId(arg) for arg in proc_begin.cmdline)
+        return pb2_ev
+
+    def takeStringTable(self, timestamp: pb2.timespec) -> pb2.event | None:
+        """
+        Return PB2 string table event with the strings that got an id since
+        the last call (None if there are none).
+        """
+        if not self._new:
+            return None
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.CopyFrom(timestamp)
+        pb2_ev.string_table.first_id = len(self._ids) - len(self._new)
+        pb2_ev.string_table.s.extend(self._new)
+        self._new = []
+        return pb2_ev
+
+
+def intern_trace(proto_file, filename: str) -> tuple[int, int]:
+    """
+    Write interned trace of trace file (proto_file, interned or not) to file.
+    The file is replaced atomically.
+    Return number of events and number of distinct strings written.
+    """
+    interner = Interner()
+    strings = uproctrace.parse.Strings()  # strings of already interned trace
+    events = 0
+    with uproctrace.files.replace_file(filename) as tmp_filename:
+        with open(tmp_filename, "wb") as interned_file:
+            for payload in uproctrace.parse.Reader(proto_file).payloads():
+                pb2_ev = pb2.event.FromString(payload)
+                if pb2_ev.HasField("string_table"):
+                    strings.add(uproctrace.parse.StringTable(pb2_ev))
+                    continue  # strings are written to new string tables
+                if pb2_ev.HasField("proc_begin"):
+                    proc_begin = uproctrace.parse.ProcBegin(pb2_ev, strings=strings)
+                    pb2_ev = interner.internBegin(proc_begin)
+                    string_table = interner.takeStringTable(pb2_ev.timestamp)
+                    if string_table is not None:
+                        data = string_table.SerializeToString()
+                        interned_file.write(uproctrace.parse.frame(data))
+                        events += 1
+                    payload = pb2_ev.SerializeToString()
+                interned_file.write(uproctrace.parse.frame(payload))
+                events += 1
+    return events, len(interner)
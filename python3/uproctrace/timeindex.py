@@ -0,0 +1,219 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Time index of process lifetimes for time window queries.
+"""
+
+import array
+import bisect
+import itertools
+import math
+import time
+
+import uproctrace.columns
+
+
+def parse_time(text: str) -> tuple[float, bool]:
+    """
+    Parse a point in time given on the command line: seconds since the epoch
+    ("1600000000.5"), local time ("2020-09-13 14:26:40" with optional
+    fraction of seconds, as printed by upt-tool) or seconds relative to the
+    begin of the trace ("+12.5").
+    Return (timestamp or relative seconds, True if relative).
+    Raise ValueError if the text cannot be parsed.
+    """
+    text = text.strip()
+    if text.startswith("+"):
+        return float(text[1:]), True
+    try:
+        return float(text), False
+    except ValueError:
+        pass
+    text, _dot, fraction = text.partition(".")
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            sec = time.mktime(time.strptime(text, fmt))
+        except ValueError:
+            continue
+        return sec + (float("0." + fraction) if fraction else 0.0), False
+    raise ValueError(f"invalid time: {text:s}")
+
+
+class TimeIndex:
+    """
+    Sorted, array-backed interval index over the lifetimes of processes.
+
+    The lifetime of a process is [begin timestamp, end timestamp), a missing
+    begin timestamp counts as -infinity (process began before the trace), a
+    missing end timestamp as +infinity (process has not ended yet).
+    Processes without any timestamp have an unknown lifetime and are never
+    returned (their begin timestamp is stored as +infinity).
+    Processes are sorted by begin timestamp and form an implicit balanced
+    binary tree (node i at level k has its children at i -/+ 2 ** (k - 1)),
+    each node storing the maximum end timestamp of its subtree. This answers
+    "which processes were alive at t" in O(log n + k) for k results.
+    A second array sorted by end timestamp answers "which processes ended in
+    [t0, t1)", a binary search on the begin timestamps "which processes began
+    in [t0, t1)".
+    """
+
+    def __init__(self, begins: list[float], ends: list[float]) -> None:
+        """
+        Initialize time index from begin and end timestamps of processes
+        (index is proc_id, +/- infinity for missing timestamps, see above).
+        """
+        size = len(begins)
+        order = sorted(range(size), key=begins.__getitem__)
+        self._proc_ids = array.array("q", order)
+        self._begins = array.array("d", (begins[i] for i in order))
+        self._ends = array.array("d", (ends[i] for i in order))
+        self._max_ends = array.array("d", self._ends)
+        self._max_level = self._buildTree()
+        order = sorted(range(size), key=ends.__getitem__)
+        self._end_proc_ids = array.array("q", order)
+        self._sorted_ends = array.array("d", (ends[i] for i in order))
+
+    @classmethod
+    def fromColumns(cls, columns: uproctrace.columns.Columns) -> "TimeIndex":
+        """
+        Create time index from columnar table of process metrics.
+        """
+        begin_mask = columns.mask("begin_timestamp")
+        end_mask = columns.mask("end_timestamp")
+        begins = [
+            value if valid else -math.inf if has_end else math.inf
+            for value, valid, has_end in zip(
+                columns.column("begin_timestamp"), begin_mask, end_mask
+            )
+        ]
+        ends = [
+            value if valid else math.inf
+            for value, valid in zip(columns.column("end_timestamp"), end_mask)
+        ]
+        return cls(begins, ends)
+
+    def __len__(self) -> int:
+        """
+        Number of processes.
+        """
+        return len(self._proc_ids)
+
+    def _buildTree(self) -> int:
+        """
+        Compute maximum end timestamps of subtrees of implicit tree.
+        Return level of root node.
+        """
+        size = len(self._ends)
+        if not size:
+            return 0
+        ends = self._ends
+        max_ends = self._max_ends
+        # leaves are at even indices, last_idx/last_max track the last
+        # (possibly incomplete) subtree at each level
+        last_idx = (size - 1) & ~1
+        last_max = ends[last_idx]
+        level = 1
+        while 1 << level <= size:
+            half = 1 << (level - 1)
+            for idx in range((half << 1) - 1, size, half << 2):
+                left = max_ends[idx - half]
+                right = max_ends[idx + half] if idx + half < size else last_max
+                max_ends[idx] = max(ends[idx], left, right)
+            last_idx = last_idx - half if last_idx >> level & 1 else last_idx + half
+            if last_idx < size and max_ends[last_idx] > last_max:
+                last_max = max_ends[last_idx]
+            level += 1
+        return level - 1
+
+    @property
+    def first(self) -> float | None:
+        """
+        Earliest begin timestamp (None if there is none).
+        """
+        idx = bisect.bisect_right(self._begins, -math.inf)
+        if idx >= len(self._begins) or self._begins[idx] == math.inf:
+            return None
+        return self._begins[idx]
+
+    def began(self, t_begin: float, t_end: float) -> list[int]:
+        """
+        Return proc_ids of processes that began in [t_begin, t_end)
+        (ordered by begin timestamp).
+        """
+        lo = bisect.bisect_left(self._begins, t_begin)
+        hi = bisect.bisect_left(self._begins, t_end)
+        return list(itertools.islice(self._proc_ids, lo, hi))
+
+    def ended(self, t_begin: float, t_end: float) -> list[int]:
+        """
+        Return proc_ids of processes that ended in [t_begin, t_end)
+        (ordered by end timestamp).
+        """
+        lo = bisect.bisect_left(self._sorted_ends, t_begin)
+        hi = bisect.bisect_left(self._sorted_ends, t_end)
+        return list(itertools.islice(self._end_proc_ids, lo, hi))
+
+    def alive(self, timestamp: float) -> list[int]:
+        """
+        Return proc_ids of processes alive at timestamp
+        (ordered by begin timestamp).
+        """
+        return self.overlapping(timestamp, math.nextafter(timestamp, math.inf))
+
+    def overlapping(self, t_begin: float, t_end: float) -> list[int]:
+        """
+        Return proc_ids of processes alive at some time in [t_begin, t_end)
+        (ordered by begin timestamp).
+        """
+        # pylint: disable=too-many-locals
+        begins = self._begins
+        ends = self._ends
+        max_ends = self._max_ends
+        proc_ids = self._proc_ids
+        size = len(begins)
+        result = []
+        if not size:
+            return result
+        # stack of (node index, level, left subtree done)
+        stack = [((1 << self._max_level) - 1, self._max_level, False)]
+        while stack:
+            idx, level, left_done = stack.pop()
+            if level <= 3:
+                # small subtree: linear scan
+                lo = idx >> level << level
+                hi = min(lo + (1 << (level + 1)) - 1, size)
+                for pos in range(lo, hi):
+                    if begins[pos] >= t_end:
+                        break
+                    if ends[pos] > t_begin:
+                        result.append(proc_ids[pos])
+            elif not left_done:
+                stack.append((idx, level, True))
+                left = idx - (1 << (level - 1))
+                # left child may be out of range (incomplete tree)
+                if left >= size or max_ends[left] > t_begin:
+                    stack.append((left, level - 1, False))
+            elif idx < size and begins[idx] < t_end:
+                if ends[idx] > t_begin:
+                    result.append(proc_ids[idx])
+                stack.append((idx + (1 << (level - 1)), level - 1, False))
+        return result
+
+    def window(
+        self, since: tuple[float, bool] | None, until: tuple[float, bool] | None
+    ) -> tuple[float, float]:
+        """
+        Resolve time window given as since and until (see parse_time, None
+        for unbounded), relative times are relative to the first begin.
+        Return (begin, end) timestamps.
+        """
+        bounds = []
+        for value, default in ((since, -math.inf), (until, math.inf)):
+            if value is None:
+                bounds.append(default)
+            elif value[1]:
+                bounds.append((self.first or 0.0) + value[0])
+            else:
+                bounds.append(value[0])
+        return bounds[0], bounds[1]
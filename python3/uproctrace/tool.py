@@ -6,25 +6,98 @@ Command line interface of UProcTrace: "upt-tool".
 """
 
 import argparse
+import os
 import sys
 
 # pylint: disable=import-outside-toplevel
 
 
+def compress(args):
+    """
+    Write compressed trace files with seek table.
+    """
+    if args.output is not None and len(args.trace) != 1:
+        print(
+            "error: upt-tool compress --output: only one trace file allowed",
+            file=sys.stderr,
+        )
+        return 1
+    import uproctrace.compress
+
+    for upt_trace in args.trace:
+        proto_file = open_events("compress", upt_trace)
+        if proto_file is None:
+            return 1
+        filename = args.output or uproctrace.compress.compressed_filename(
+            trace_name(upt_trace), args.codec
+        )
+        try:
+            with proto_file:
+                size, comp_size = uproctrace.compress.compress_trace(
+                    proto_file, filename, args.codec, args.frame_size << 10
+                )
+        except (ImportError, ValueError) as exc:
+            print(f"error: upt-tool compress: {exc}", file=sys.stderr)
+            return 1
+        print(f"{filename:s}: {size:d} bytes compressed to {comp_size:d} bytes")
+    return 0
+
+
+def critpath(args):
+    """
+    Print critical path and parallelism analysis of a trace file.
+    """
+    if len(args.trace) != 1:
+        print("error: upt-tool critpath: only one trace file allowed", file=sys.stderr)
+        return 1
+    import uproctrace.critpath
+
+    uproctrace.critpath.critpath(args)
+    return 0
+
+
+def diff(args):
+    """
+    Print differences between two trace files.
+    """
+    if len(args.trace) != 2:
+        print("error: upt-tool diff: exactly two trace files needed", file=sys.stderr)
+        return 1
+    import uproctrace.diff
+
+    return uproctrace.diff.diff(args)
+
+
 def dump(args):
     """
     Dump all events in trace file to standard output.
     """
     import uproctrace.dump
+    import uproctrace.index
 
+    window = None
+    if args.since is not None or args.until is not None:
+        window = (args.since, args.until)
     for upt_trace in args.trace:
+        proto_file = open_events("dump", upt_trace)
+        if proto_file is None:
+            return 1
         if len(args.trace) != 1:
             print(f"[{upt_trace:s}]:")
-        with open(upt_trace, "rb") as proto_file:
-            while uproctrace.dump.dump_event(proto_file, sys.stdout):
-                pass
+        with proto_file:
+            if window is None and args.where is None:
+                uproctrace.dump.dump_events(proto_file, sys.stdout)
+            else:
+                uproctrace.dump.dump_selected_events(
+                    proto_file,
+                    uproctrace.index.load_processes(upt_trace, not args.no_index),
+                    sys.stdout,
+                    window,
+                    args.where,
+                )
         if len(args.trace) != 1:
             print("")
+    return 0
 
 
 def stats(args):
@@ -34,13 +107,65 @@ def stats(args):
     """
     import uproctrace.stats
 
-    if not args.per_trace:
-        uproctrace.stats.dump_stats(args.trace)
-        return
+    window = None
+    if args.since is not None or args.until is not None:
+        window = (args.since, args.until)
+    if args.follow:
+        if not check_follow("stats", args.trace):
+            return 1
+        uproctrace.stats.follow_stats(
+            args.trace[0],
+            not args.no_index,
+            args.interval,
+            quantiles=args.quantiles,
+            histograms=args.histograms,
+            window=window,
+            where=args.where,
+        )
+        return 0
+    uproctrace.stats.dump_stats(
+        args.trace,
+        not args.no_index,
+        args.jobs,
+        args.per_trace,
+        quantiles=args.quantiles,
+        histograms=args.histograms,
+        window=window,
+        where=args.where,
+    )
+    return 0
+
+
+def export(args):
+    """
+    Export processes of trace file(s) to columnar binary files.
+    """
+    if args.output is not None and len(args.trace) != 1:
+        print(
+            "error: upt-tool export --output: only one trace file allowed",
+            file=sys.stderr,
+        )
+        return 1
+    import itertools
+    import uproctrace.export
+    import uproctrace.index
+    import uproctrace.query
+
+    window = None
+    if args.since is not None or args.until is not None:
+        window = (args.since, args.until)
     for upt_trace in args.trace:
-        print(f"[{upt_trace:s}]:")
-        uproctrace.stats.dump_stats([upt_trace])
-        print("")
+        processes = uproctrace.index.load_processes(
+            upt_trace, not args.no_index, args.jobs
+        )
+        mask = uproctrace.query.select_mask(processes, args.where, window)
+        proc_ids = None
+        if mask is not None:
+            proc_ids = list(itertools.compress(range(len(mask)), mask))
+        filename = args.output or uproctrace.export.export_filename(upt_trace)
+        rows = uproctrace.export.write_export(filename, processes, proc_ids)
+        print(f"{filename:s}: {rows:d} processes")
+    return 0
 
 
 def gui(args):
@@ -50,9 +175,86 @@ def gui(args):
     if len(args.trace) != 1:
         print("error: upt-tool gui: only one trace file allowed", file=sys.stderr)
         return 1
+    if args.follow and not check_follow("gui", args.trace):
+        return 1
     import uproctrace.gui
 
-    uproctrace.gui.run(args.trace[0])
+    uproctrace.gui.run(
+        args.trace[0], not args.no_index, args.interval if args.follow else None
+    )
+    return 0
+
+
+def index(args):
+    """
+    Create index files for trace files.
+    """
+    import uproctrace.index
+    import uproctrace.shards
+
+    for upt_trace in args.trace:
+        if uproctrace.shards.is_shard_dir(upt_trace):
+            print(
+                f"error: upt-tool index: {upt_trace:s}: no index for trace"
+                " directories (see upt-tool merge)",
+                file=sys.stderr,
+            )
+            return 1
+        proto_file = open_events("index", upt_trace)
+        if proto_file is None:
+            return 1
+        with proto_file:
+            uproctrace.index.write_index(proto_file, upt_trace, False, args.jobs)
+    return 0
+
+
+def intern(args):
+    """
+    Write interned trace files (strings stored once in string tables).
+    """
+    if args.output is not None and len(args.trace) != 1:
+        print(
+            "error: upt-tool intern --output: only one trace file allowed",
+            file=sys.stderr,
+        )
+        return 1
+    import uproctrace.stringtable
+
+    for upt_trace in args.trace:
+        proto_file = open_events("intern", upt_trace)
+        if proto_file is None:
+            return 1
+        filename = args.output or uproctrace.stringtable.interned_filename(
+            trace_name(upt_trace)
+        )
+        with proto_file:
+            events, strings = uproctrace.stringtable.intern_trace(proto_file, filename)
+        print(f"{filename:s}: {events:d} events, {strings:d} strings")
+    return 0
+
+
+def merge(args):
+    """
+    Merge directories of shards (sharded traces) into trace files.
+    """
+    if args.output is not None and len(args.trace) != 1:
+        print(
+            "error: upt-tool merge --output: only one trace directory allowed",
+            file=sys.stderr,
+        )
+        return 1
+    import uproctrace.shards
+
+    for shard_dir in args.trace:
+        if not uproctrace.shards.is_shard_dir(shard_dir):
+            print(
+                f"error: {shard_dir:s}: not a directory of shards (<pid>.upt)",
+                file=sys.stderr,
+            )
+            return 1
+        filename = args.output or uproctrace.shards.merged_filename(shard_dir)
+        count = uproctrace.shards.merge(shard_dir, filename)
+        print(f"{filename:s}: {count:d} events")
     return 0
 
 
@@ -71,13 +273,204 @@ def pstree(args):
     """
     import uproctrace.pstree
 
+    if args.raw and args.format not in ("csv", "json", "jsonl"):
+        print(
+            "error: upt-tool pstree --raw: only for formats csv, json and jsonl",
+            file=sys.stderr,
+        )
+        return 1
+    if args.follow:
+        if not check_follow("pstree", args.trace):
+            return 1
+        uproctrace.pstree.follow(args)
+        return 0
     uproctrace.pstree.pstree(args)
+    return 0
+
+
+def sqlite(args):
+    """
+    Write processes of trace file(s) to SQLite databases.
+    """
+    if args.output is not None and len(args.trace) != 1:
+        print(
+            "error: upt-tool sqlite --output: only one trace file allowed",
+            file=sys.stderr,
+        )
+        return 1
+    import uproctrace.index
+    import uproctrace.sqlite
+
+    for upt_trace in args.trace:
+        processes = uproctrace.index.load_processes(
+            upt_trace, not args.no_index, args.jobs
+        )
+        filename = args.output or uproctrace.sqlite.database_filename(upt_trace)
+        rows = uproctrace.sqlite.write_database(filename, processes, upt_trace)
+        print(f"{filename:s}: {rows:d} processes")
+    return 0
+
+
+def top(args):
+    """
+    Print top groups of processes (e.g. per executable).
+    """
+    import uproctrace.top
+
+    uproctrace.top.top(args)
+    return 0
+
+
+def add_follow_arguments(sub_parser: argparse.ArgumentParser):
+    """
+    Add arguments for following a trace while it is being written.
+    """
+    sub_parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="""
+        Keep the trace file open and update the output whenever events are
+        appended (e.g. while the traced build is still running).
+        Stop with Ctrl-C.
+        """,
+    )
+    sub_parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="interval for polling the trace file in follow mode (in s)",
+    )
+
+
+def check_follow(command: str, traces: list[str]) -> bool:
+    """
+    Check that traces can be followed in upt-tool command: only a single
+    plain trace file (not compressed, not a database, not a directory of
+    shards) is appended to while it is being written.
+    Print error and return False if not.
+    """
+    import uproctrace.compress
+    import uproctrace.sqlite
+
+    if len(traces) != 1:
+        error = "only one trace file allowed"
+    elif (
+        os.path.isdir(traces[0])
+        or uproctrace.sqlite.is_database(traces[0])
+        or uproctrace.compress.is_compressed(traces[0])
+    ):
+        error = f"{traces[0]:s}: not a plain (uncompressed) trace file"
+    else:
+        return True
+    print(f"error: upt-tool {command:s} --follow: {error:s}", file=sys.stderr)
+    return False
+
+
+def time_arg(text: str) -> tuple[float, bool]:
+    """
+    Parse point in time argument (see timeindex.parse_time).
+    """
+    import uproctrace.timeindex
+
+    try:
+        return uproctrace.timeindex.parse_time(text)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
+def add_window_arguments(sub_parser: argparse.ArgumentParser):
+    """
+    Add arguments for restricting to a time window.
+    """
+    for name, what in (("since", "begin"), ("until", "end")):
+        sub_parser.add_argument(
+            "--" + name,
+            type=time_arg,
+            help=f"""
+            {what:s} of time window: only processes alive in the time window
+            are taken into account (dump: only events in the time window);
+            seconds since the epoch, local time "YYYY-MM-DD HH:MM:SS[.frac]"
+            or "+seconds" relative to the begin of the trace
+            """,
+        )
+
+
+def query_arg(text: str):
+    """
+    Parse filter expression argument (see query.Query).
+    """
+    import uproctrace.query
+
+    try:
+        return uproctrace.query.Query(text)
+    except uproctrace.query.QueryError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
+def add_where_argument(sub_parser):
+    """
+    Add argument for selecting processes with a filter expression.
+    """
+    sub_parser.add_argument(
+        "--where",
+        "-w",
+        type=query_arg,
+        help="""
+        only take processes matching the filter expression into account
+        (dump: only their events), e.g. "exe ~ 'clang' and cpu_time > 2",
+        "cwd startswith '/src/lib'" or "descendant_of proc_id 17"
+        """,
+    )
+
+
+def open_events(command: str, upt_trace: str):
+    """
+    Open trace file for reading its events in upt-tool command: compressed
+    trace files are decompressed (see module compress), directories of shards
+    are merged (see module shards).
+    Print error and return None if upt_trace has no events (e.g. a database,
+    see module sqlite).
+    """
+    import uproctrace.compress
+    import uproctrace.shards
+    import uproctrace.sqlite
+
+    if uproctrace.sqlite.is_database(upt_trace):
+        print(
+            f"error: upt-tool {command:s}: {upt_trace:s}: database has no"
+            " events, only processes",
+            file=sys.stderr,
+        )
+        return None
+    if uproctrace.shards.is_shard_dir(upt_trace):
+        return uproctrace.shards.open_merged(upt_trace)
+    if os.path.isdir(upt_trace):
+        print(
+            f"error: upt-tool {command:s}: {upt_trace:s}: directory without"
+            " shards (<pid>.upt)",
+            file=sys.stderr,
+        )
+        return None
+    return uproctrace.compress.open_trace(upt_trace)
+
+
+def trace_name(upt_trace: str) -> str:
+    """
+    Return name of trace file to derive output file names from: trace file
+    itself or merged trace file of directory of shards (see module shards).
+    """
+    import uproctrace.shards
+
+    if uproctrace.shards.is_shard_dir(upt_trace):
+        return uproctrace.shards.merged_filename(upt_trace)
+    return upt_trace
 
 
 def parse_args():
     """
     Parse command line arguments.
     """
+    # pylint: disable=R0914,R0915
     # set up main parser
     parser = argparse.ArgumentParser(description="UProcTrace tool.")
     parser.add_argument(
@@ -88,10 +481,148 @@ def parse_args():
         The UPT trace file(s).
         """,
     )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="""
+        Do not use index files (<trace.upt>.idx, written by the index
+        command).
+        """,
+    )
 
     # Create sub parsers
     subparsers = parser.add_subparsers()
 
+    # compress
+    compress_parser = subparsers.add_parser(
+        "compress",
+        help="""
+        Write compressed trace file (<trace.upt>.gz) in independently
+        compressed frames with seek table, so index files and parallel parsing
+        can seek in it. Compressed traces are read by upt-tool like normal
+        traces.
+        """,
+    )
+    compress_parser.add_argument(
+        "--codec",
+        choices=["gzip", "lz4", "zstd"],
+        default="gzip",
+        help="""
+        compression format (zstd and lz4 need the Python modules zstandard and
+        lz4)
+        """,
+    )
+    compress_parser.add_argument(
+        "--frame-size",
+        type=int,
+        default=4096,
+        help="uncompressed size of frames (in KiB)",
+    )
+    compress_parser.add_argument(
+        "--output",
+        "-o",
+        help="name of compressed trace file (only for a single trace file)",
+    )
+    compress_parser.set_defaults(func=compress)
+
+    # critpath
+    critpath_parser = subparsers.add_parser(
+        "critpath",
+        help="""
+        Analyze critical path and parallelism (e.g. of a build).
+        Only supports a single trace file.
+        """,
+    )
+    critpath_parser.add_argument(
+        "--path-limit",
+        type=int,
+        default=50,
+        help="""
+        maximum number of processes of critical path shown (the ones with the
+        largest self time, 0 for all)
+        """,
+    )
+    critpath_parser.add_argument(
+        "--intervals",
+        type=int,
+        default=20,
+        help="number of intervals of concurrency profile",
+    )
+    critpath_parser.add_argument(
+        "--gap-threshold",
+        type=float,
+        default=1.0,
+        help="report gaps with fewer busy CPUs than this",
+    )
+    critpath_parser.add_argument(
+        "--min-gap",
+        type=float,
+        default=1.0,
+        help="minimum duration of reported gaps (in s)",
+    )
+    critpath_parser.add_argument(
+        "--gaps",
+        type=int,
+        default=10,
+        help="maximum number of reported gaps (longest first)",
+    )
+    critpath_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of worker processes for parsing the trace",
+    )
+    critpath_parser.set_defaults(func=critpath)
+
+    # diff
+    diff_parser = subparsers.add_parser(
+        "diff",
+        help="""
+        Compare two traces (e.g. of two builds): added and removed processes
+        and changes of CPU time, wall time and memory per process and per
+        executable. Needs exactly two trace files.
+        """,
+    )
+    diff_parser.add_argument(
+        "--sort",
+        "-s",
+        choices=["cpu_time", "wall_time", "max_rss_kb"],
+        default="cpu_time",
+        help="metric to rank the changes by (largest absolute change first)",
+    )
+    diff_parser.add_argument(
+        "--limit",
+        "-n",
+        type=int,
+        default=20,
+        help="number of executables and processes to print (0 for all)",
+    )
+    diff_parser.add_argument(
+        "--format",
+        "-f",
+        choices=["table", "csv", "json"],
+        default="table",
+        help="output format",
+    )
+    diff_parser.add_argument(
+        "--fail-above",
+        type=float,
+        metavar="PERCENT",
+        help="""
+        exit with status 1 if the total of the sort metric increased by more
+        than PERCENT percent (e.g. to detect build time regressions in CI)
+        """,
+    )
+    diff_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of worker processes for loading traces",
+    )
+    diff_parser.set_defaults(func=diff)
+
     # dump
     dump_parser = subparsers.add_parser(
         "dump",
@@ -99,8 +630,34 @@ def parse_args():
         Dump events to stdout.
         """,
     )
+    add_window_arguments(dump_parser)
+    add_where_argument(dump_parser)
     dump_parser.set_defaults(func=dump)
 
+    # export
+    export_parser = subparsers.add_parser(
+        "export",
+        help="""
+        Export processes (ids, timestamps, metrics, exe, cwd, cmdline) to a
+        columnar binary file (<trace.upt>.uptc) for analytics tools.
+        """,
+    )
+    export_parser.add_argument(
+        "--output",
+        "-o",
+        help="name of export file (only for a single trace file)",
+    )
+    export_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of worker processes for parsing each trace",
+    )
+    add_window_arguments(export_parser)
+    add_where_argument(export_parser)
+    export_parser.set_defaults(func=export)
+
     # gui
     gui_parser = subparsers.add_parser(
         "gui",
@@ -108,8 +665,57 @@ def parse_args():
         Run graphical user interface. Only supports a single trace file.
         """,
     )
+    add_follow_arguments(gui_parser)
     gui_parser.set_defaults(func=gui)
 
+    # index
+    index_parser = subparsers.add_parser(
+        "index",
+        help="""
+        (Re-)create index files (<trace.upt>.idx) for faster loading.
+        """,
+    )
+    index_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of worker processes for parsing each trace",
+    )
+    index_parser.set_defaults(func=index)
+
+    # intern
+    intern_parser = subparsers.add_parser(
+        "intern",
+        help="""
+        Write interned trace file (<trace>.interned.upt) that stores each
+        distinct executable, working directory and command line argument
+        only once. Interned traces are smaller and need less memory.
+        """,
+    )
+    intern_parser.add_argument(
+        "--output",
+        "-o",
+        help="name of interned trace file (only for a single trace file)",
+    )
+    intern_parser.set_defaults(func=intern)
+
+    # merge
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="""
+        Merge a sharded trace (directory with one file per process, see
+        upt-trace) into a single trace file (<directory>.upt) ordered by event
+        timestamps. Trace directories can also be passed to upt-tool directly.
+        """,
+    )
+    merge_parser.add_argument(
+        "--output",
+        "-o",
+        help="name of trace file (only for a single trace directory)",
+    )
+    merge_parser.set_defaults(func=merge)
+
     # psinfo
     psinfo_parser = subparsers.add_parser(
         "psinfo",
@@ -117,13 +723,14 @@ def parse_args():
         Print information about a process.
         """,
     )
-    psinfo_parser.add_argument(
+    psinfo_group = psinfo_parser.add_mutually_exclusive_group(required=True)
+    psinfo_group.add_argument(
         "--proc_id",
         "-i",
         type=int,
-        required=True,
         help="proc_id of process (this is not the pid)",
     )
+    add_where_argument(psinfo_group)
     psinfo_parser.set_defaults(func=psinfo)
 
     # pstree
@@ -145,15 +752,66 @@ def parse_args():
         action="store_true",
         help="show proc_id, pid, parent pid (in front of cmdline)",
     )
+    pstree_parser.add_argument(
+        "--inclusive",
+        "-I",
+        action="store_true",
+        help="""
+        show inclusive metrics of each process and all its descendants
+        (number of processes, total CPU time, peak memory, ...)
+        """,
+    )
     pstree_parser.add_argument(
         "--format",
         "-f",
-        choices=["plain", "table", "csv", "json"],
+        choices=["plain", "table", "csv", "json", "jsonl"],
         default="plain",
-        help="output format",
+        help="output format (jsonl: JSON Lines with raw values, streamed)",
+    )
+    pstree_parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="""
+        output raw values (seconds, KiB, counts) with field names as headers
+        instead of formatted text (formats csv, json and jsonl), csv and jsonl
+        are streamed while the process tree is traversed
+        """,
     )
+    pstree_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of worker processes for loading traces",
+    )
+    add_follow_arguments(pstree_parser)
+    add_window_arguments(pstree_parser)
+    add_where_argument(pstree_parser)
     pstree_parser.set_defaults(func=pstree)
 
+    # sqlite
+    sqlite_parser = subparsers.add_parser(
+        "sqlite",
+        help="""
+        Write processes (tree, metrics, cmdline, environ) to an SQLite database
+        (<trace.upt>.db) for SQL queries. Databases can be passed to upt-tool
+        instead of trace files.
+        """,
+    )
+    sqlite_parser.add_argument(
+        "--output",
+        "-o",
+        help="name of database (only for a single trace file)",
+    )
+    sqlite_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of worker processes for parsing each trace",
+    )
+    sqlite_parser.set_defaults(func=sqlite)
+
     # stats
     stats_parser = subparsers.add_parser(
         "stats",
@@ -171,8 +829,85 @@ def parse_args():
         calculating statistics over all traces.
         """,
     )
+    stats_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of worker processes for loading traces",
+    )
+    stats_parser.add_argument(
+        "--quantiles",
+        "-q",
+        action="store_true",
+        help="also show estimated quantiles (P50, P90, P99)",
+    )
+    stats_parser.add_argument(
+        "--histograms",
+        action="store_true",
+        help="also show histograms (logarithmic buckets) of process attributes",
+    )
+    add_follow_arguments(stats_parser)
+    add_window_arguments(stats_parser)
+    add_where_argument(stats_parser)
     stats_parser.set_defaults(func=stats)
 
+    # top
+    top_parser = subparsers.add_parser(
+        "top",
+        help="""
+        Aggregate processes per executable (or command or working directory)
+        and print the top groups.
+        """,
+    )
+    top_parser.add_argument(
+        "--group-by",
+        "-g",
+        choices=["exe", "argv0", "cwd"],
+        default="exe",
+        help="attribute to group processes by",
+    )
+    top_parser.add_argument(
+        "--sort",
+        "-s",
+        choices=[
+            "count",
+            "wall_time",
+            "cpu_time",
+            "sys_time",
+            "user_time",
+            "in_block",
+            "ou_block",
+            "maj_flt",
+            "min_flt",
+            "max_rss_kb",
+        ],
+        default="cpu_time",
+        help="aggregated value to rank the groups by",
+    )
+    top_parser.add_argument(
+        "--limit",
+        "-n",
+        type=int,
+        default=20,
+        help="number of groups to print (0 for all)",
+    )
+    top_parser.add_argument(
+        "--format",
+        "-f",
+        choices=["table", "csv", "json"],
+        default="table",
+        help="output format",
+    )
+    top_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of worker processes for loading traces",
+    )
+    top_parser.set_defaults(func=top)
+
     # parse
     args = parser.parse_args()
     if not hasattr(args, "func"):
@@ -186,5 +921,16 @@ def main():
     upt-tool main function.
     Parse command line arguments and execute selected action.
     """
+    import uproctrace.sqlite
+
     args = parse_args()
-    sys.exit(args.func(args))
+    try:
+        sys.exit(args.func(args))
+    except KeyboardInterrupt:
+        sys.exit(130)
+    except ImportError as exc:  # optional module, e.g. for compressed traces
+        print(f"error: {exc}", file=sys.stderr)
+        sys.exit(1)
+    except uproctrace.sqlite.DatabaseError as exc:  # e.g. foreign database
+        print(f"error: {exc}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,154 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Top command line interface of UProcTrace: "upt-tool top".
+
+Aggregates the metrics of processes grouped by executable, first command line
+argument or working directory and ranks the groups.
+"""
+
+import argparse
+import functools
+import tabulate
+import uproctrace.formatting
+import uproctrace.index
+import uproctrace.parallel
+import uproctrace.stats
+
+# attributes to group processes by
+GROUP_BY = ["exe", "argv0", "cwd"]
+
+# process attributes aggregated by maximum instead of sum
+MAX_ATTRS = {"max_rss_kb"}
+
+# aggregated values of a group: "count", "wall_time" and the process
+# attributes of stats.PROCESS_ATTRS (in this order)
+VALUES = ["count", "wall_time"] + list(uproctrace.stats.PROCESS_ATTRS)
+
+
+def group_key(proc, group_by: str) -> str:
+    """
+    Return key of group of process (see GROUP_BY).
+    """
+    if group_by == "argv0":
+        cmdline = proc.cmdline
+        key = cmdline[0] if cmdline else None
+    else:
+        key = getattr(proc, group_by)
+    return "???" if key is None else key
+
+
+def aggregate(upt_trace: str, group_by: str, use_index: bool = True) -> dict:
+    """
+    Aggregate metrics of processes of trace file grouped by group_by.
+    Only processes with begin and end event are taken into account.
+    Return mapping of group key to list of aggregated values (see VALUES).
+    """
+    processes = uproctrace.index.load_processes(upt_trace, use_index)
+    groups = {}
+    for proc in processes.getAllProcesses().values():
+        if proc.begin_timestamp is None or proc.end_timestamp is None:
+            continue
+        key = group_key(proc, group_by)
+        values = groups.get(key)
+        if values is None:
+            values = groups[key] = [0] * len(VALUES)
+        values[0] += 1
+        values[1] += proc.end_timestamp - proc.begin_timestamp
+        for idx, attr in enumerate(uproctrace.stats.PROCESS_ATTRS, 2):
+            value = getattr(proc, attr)
+            if value is None:
+                continue
+            if attr in MAX_ATTRS:
+                values[idx] = max(values[idx], value)
+            else:
+                values[idx] += value
+    return groups
+
+
+def merge(groups: dict, partial: dict) -> None:
+    """
+    Merge partial aggregated groups into aggregated groups
+    (both as returned by aggregate).
+    """
+    for key, partial_values in partial.items():
+        values = groups.get(key)
+        if values is None:
+            groups[key] = partial_values
+            continue
+        for idx, name in enumerate(VALUES):
+            if name in MAX_ATTRS:
+                values[idx] = max(values[idx], partial_values[idx])
+            else:
+                values[idx] += partial_values[idx]
+
+
+def format_value(value: float, unit: str) -> str:
+    """
+    Format aggregated value with unit.
+    """
+    if unit == "s":
+        return f"{value:.3f} s"
+    if unit:
+        return f"{value:d} {unit:s}"
+    return f"{value:d}"
+
+
+def top(args: argparse.Namespace) -> None:
+    """
+    Print top groups of processes.
+    """
+    partials = uproctrace.parallel.map_jobs(
+        functools.partial(
+            aggregate, group_by=args.group_by, use_index=not args.no_index
+        ),
+        args.trace,
+        args.jobs,
+    )
+    groups = {}
+    for partial in partials:
+        merge(groups, partial)
+
+    # rank groups
+    sort_idx = VALUES.index(args.sort)
+    ranked = sorted(groups.items(), key=lambda item: (-item[1][sort_idx], item[0]))
+    if args.limit > 0:
+        ranked = ranked[: args.limit]
+
+    # share of CPU time of all processes
+    cpu_idx = VALUES.index("cpu_time")
+    cpu_total = sum(values[cpu_idx] for values in groups.values())
+
+    headers = [args.group_by, "count", "CPU share", "wall time"]
+    headers += [title for title, _unit in uproctrace.stats.PROCESS_ATTRS.values()]
+    units = ["s"] + [unit for _title, unit in uproctrace.stats.PROCESS_ATTRS.values()]
+    rows = []
+    for key, values in ranked:
+        share = values[cpu_idx] / cpu_total * 100 if cpu_total else 0
+        row = [key, f"{values[0]:d}", f"{share:.1f} %"]
+        row += [format_value(value, unit) for value, unit in zip(values[1:], units)]
+        rows.append(row)
+
+    output(args, headers, rows)
+
+
+def output(args: argparse.Namespace, headers: list[str], rows: list[list[str]]):
+    """
+    Output rows of top command.
+    """
+    if args.format == "json":
+        uproctrace.formatting.print_json(headers, rows)
+        return
+
+    if args.format == "csv":
+        uproctrace.formatting.print_csv(headers, rows)
+        return
+
+    # default: table
+    if args.group_by == "exe":
+        # short executable names (if unique), full names are available as CSV
+        # and JSON
+        names = uproctrace.formatting.short_paths([row[0] for row in rows])
+        rows = [[name] + row[1:] for name, row in zip(names, rows)]
+    print(tabulate.tabulate(rows, headers))
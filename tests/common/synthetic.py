@@ -0,0 +1,137 @@
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Synthetic traces for tests: generate events of random processes and compare
+processes loaded in different ways.
+
+Tests import this module from tests/common (added to PYTHONPATH).
+"""
+
+import os
+import random
+
+import uproctrace.parse
+import uproctrace.uproctrace_pb2 as pb2
+
+# compared attributes of processes
+ATTRS = ["pid", "ppid", "exe", "cwd", "cmdline", "environ", "cpu_time"]
+
+# default executables and working directories of processes
+EXES = ["/usr/bin/cc", "/bin/sh", "/ü"]
+CWDS = [f"/src/lib{i:d}" for i in range(9)]
+
+
+def events(
+    count: int,
+    *,
+    begin: float = 1.0,
+    end: float = 1.0,
+    fields: float = 1.0,
+    exes: list[str] | None = None,
+    cwds: list[str] | None = None,
+) -> list[pb2.event]:
+    """
+    Return events of a synthetic trace with count random processes.
+    Process i has pid 1000 + i and a random earlier process as parent. It
+    begins in second i and ends later in the same second. It has a begin
+    event with probability begin, an end event with probability end and
+    each of exe, cwd, cmdline and environ with probability fields.
+    Tests adjust the returned events to their needs.
+    """
+    rnd = random.Random(42)
+    exes = exes or EXES
+    cwds = cwds or CWDS
+    result = []
+    for i in range(count):
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i
+        pb2_ev.timestamp.nsec = rnd.randrange(500000000)
+        pb2_ev.proc_begin.pid = 1000 + i
+        if i:
+            pb2_ev.proc_begin.ppid = 1000 + rnd.randrange(i)
+        exe = rnd.choice(exes)
+        if rnd.random() < fields:
+            pb2_ev.proc_begin.exe = exe
+        if rnd.random() < fields:
+            pb2_ev.proc_begin.cwd = rnd.choice(cwds)
+        if rnd.random() < fields:
+            pb2_ev.proc_begin.cmdline.SetInParent()
+            pb2_ev.proc_begin.cmdline.s.extend([os.path.basename(exe), f"file{i:d}.c"])
+        if rnd.random() < fields:
+            pb2_ev.proc_begin.environ.SetInParent()
+            pb2_ev.proc_begin.environ.s.extend(["PATH=/bin", f"JOB={i % 7:d}"])
+        if rnd.random() < begin:
+            result.append(pb2_ev)
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i
+        pb2_ev.timestamp.nsec = rnd.randrange(500000000, 1000000000)
+        pb2_ev.proc_end.pid = 1000 + i
+        pb2_ev.proc_end.cpu_time.sec = rnd.randrange(5)
+        pb2_ev.proc_end.max_rss_kb = rnd.randrange(1000)
+        pb2_ev.proc_end.n_v_csw = rnd.randrange(100)
+        pb2_ev.proc_end.n_iv_csw = rnd.randrange(100)
+        if rnd.random() < end:
+            result.append(pb2_ev)
+    return result
+
+
+def adjust_cmdlines(trace: list[pb2.event], adjust):
+    """
+    Replace the arguments of the command line of each begin event with
+    adjust(i, args) (process i, list of arguments).
+    """
+    for pb2_ev in trace:
+        if pb2_ev.HasField("proc_begin") and pb2_ev.proc_begin.HasField("cmdline"):
+            cmdline = pb2_ev.proc_begin.cmdline
+            args = adjust(pb2_ev.proc_begin.pid - 1000, list(cmdline.s))
+            del cmdline.s[:]
+            cmdline.s.extend(args)
+
+
+def serialize(trace: list[pb2.event]) -> bytes:
+    """
+    Return framed serialized events.
+    """
+    return b"".join(uproctrace.parse.frame(ev.SerializeToString()) for ev in trace)
+
+
+def write_trace(filename: str, trace: list[pb2.event]):
+    """
+    Write events to trace file.
+    """
+    with open(filename, "wb") as proto_file:
+        proto_file.write(serialize(trace))
+
+
+def compare(processes, other, attrs: list[str] | None = None) -> str | None:
+    """
+    Compare processes (attributes, tree, toplevel processes).
+    Return error message or None.
+    """
+    all_procs = processes.getAllProcesses()
+    other_procs = other.getAllProcesses()
+    if len(all_procs) != len(other_procs):
+        return f"{len(other_procs):d} processes != {len(all_procs):d}"
+    for proc_id, proc in all_procs.items():
+        error = compare_process(proc, other_procs[proc_id], attrs)
+        if error is not None:
+            return error
+    if [p.proc_id for p in processes.toplevel] != [p.proc_id for p in other.toplevel]:
+        return "toplevel processes differ"
+    return None
+
+
+def compare_process(proc, other, attrs: list[str] | None = None) -> str | None:
+    """
+    Compare two processes (attributes, children).
+    Return error message or None.
+    """
+    for attr in attrs or ATTRS:
+        if getattr(proc, attr) != getattr(other, attr):
+            return f"proc_id {proc.proc_id:d}: {attr:s} differs"
+    if [child.proc_id for child in proc.children] != [
+        child.proc_id for child in other.children
+    ]:
+        return f"proc_id {proc.proc_id:d}: children differ"
+    return None
@@ -0,0 +1,168 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Compressed trace test: Build a synthetic trace with random processes, compress
+it in small frames with seek table and as a plain stream (gzip and, if the
+Python modules are available, zstd and lz4) and compare the processes loaded
+from the compressed traces in all ways (serial, parallel, index, single
+process) to the ones of the original trace.
+
+usage: compress.py [<number of processes>]
+"""
+
+import gzip
+import importlib
+import os
+import sys
+import tempfile
+
+import uproctrace.compress
+import uproctrace.index
+import uproctrace.parse
+import uproctrace.processes
+
+import synthetic
+
+# uncompressed size of frames (small to get many frames)
+FRAME_SIZE = 4096
+
+
+def check_loaded(compressed: str, processes) -> str | None:
+    """
+    Check processes loaded from compressed trace, return error message or None.
+    """
+    all_procs = processes.getAllProcesses()
+    error = synthetic.compare(
+        processes, uproctrace.index.load_processes(compressed, False)
+    )
+    error = error or synthetic.compare(
+        processes, uproctrace.index.load_processes(compressed)
+    )
+    error = error or synthetic.compare(
+        processes, uproctrace.index.load_processes(compressed)
+    )
+    error = error or synthetic.compare(
+        processes, uproctrace.index.load_processes(compressed, False, 3)
+    )
+    # processes in descending order: seek backwards
+    for proc_id in range(len(all_procs) - 1, -1, -7):
+        proc = uproctrace.index.load_process(compressed, proc_id)
+        error = error or synthetic.compare_process(all_procs[proc_id], proc)
+        for child in proc.children:
+            error = error or synthetic.compare_process(all_procs[child.proc_id], child)
+    return error
+
+
+def check_payloads(compressed: str, data: bytes) -> str | None:
+    """
+    Check reading events at their offsets (in descending order) from
+    compressed trace, return error message or None.
+    """
+    with open_trace_file(data) as proto_file:
+        reader = uproctrace.parse.Reader(proto_file)
+        offsets = [(reader.event_offset, payload) for payload in reader.payloads()]
+    with uproctrace.compress.open_trace(compressed) as proto_file:
+        for offset, payload in reversed(offsets):
+            if uproctrace.parse.read_payload(proto_file, offset) != payload:
+                return f"event at offset {offset:d} differs"
+        if uproctrace.parse.read_payload(proto_file, len(data)) is not None:
+            return "event behind end of trace"
+    return None
+
+
+def compress_stream(codec: str, data: bytes) -> bytes:
+    """
+    Return data compressed with codec as plain stream (without seek table).
+    """
+    if codec == "gzip":
+        return gzip.compress(data)
+    if codec == "lz4":
+        return importlib.import_module("lz4.frame").compress(data)
+    return importlib.import_module("zstandard").ZstdCompressor().compress(data)
+
+
+def open_trace_file(data: bytes):
+    """
+    Return temporary trace file with data.
+    """
+    proto_file = tempfile.TemporaryFile()
+    proto_file.write(data)
+    proto_file.seek(0)
+    return proto_file
+
+
+def check_codec(filename: str, data: bytes, codec: str, processes) -> str | None:
+    """
+    Compress trace with codec and check it, return error message or None.
+    """
+    compressed = uproctrace.compress.compressed_filename(filename, codec)
+    with uproctrace.compress.open_trace(filename) as proto_file:
+        size, comp_size = uproctrace.compress.compress_trace(
+            proto_file, compressed, codec, FRAME_SIZE
+        )
+    print(f"{codec:s}: {size:d} bytes compressed to {comp_size:d} bytes")
+    if size != len(data) or comp_size != os.path.getsize(compressed):
+        return f"{codec:s}: wrong sizes"
+    if comp_size * 2 > size:
+        return f"{codec:s}: compressed trace not smaller"
+    with uproctrace.compress.open_trace(compressed) as proto_file:
+        if proto_file.read() != data:
+            return f"{codec:s}: data differs"
+    # recompressing compressed trace yields the same file
+    again = compressed + ".again"
+    with uproctrace.compress.open_trace(compressed) as proto_file:
+        uproctrace.compress.compress_trace(proto_file, again, codec, FRAME_SIZE)
+    with open(compressed, "rb") as file1, open(again, "rb") as file2:
+        if file1.read() != file2.read():
+            return f"{codec:s}: recompressing changed trace"
+    error = check_loaded(compressed, processes)
+    error = error or check_payloads(compressed, data)
+    # stream without seek table
+    stream = os.path.join(
+        os.path.dirname(filename),
+        "stream.upt" + uproctrace.compress.CODECS[codec].suffix,
+    )
+    with open(stream, "wb") as stream_file:
+        stream_file.write(compress_stream(codec, data))
+    error = error or check_loaded(stream, processes)
+    return error or check_payloads(stream, data)
+
+
+def main():
+    """
+    Run compressed trace test, return 0 if compressed traces are read
+    correctly.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    uproctrace.processes.Processes.MIN_SPAN_SIZE = 4096
+    data = synthetic.serialize(synthetic.events(count))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "trace.upt")
+        with open(filename, "wb") as proto_file:
+            proto_file.write(data)
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+        error = None
+        for codec in uproctrace.compress.CODECS:
+            try:
+                uproctrace.compress.CODECS[codec].require()
+            except ImportError as exc:
+                print(f"{codec:s}: {exc}")
+                continue
+            error = error or check_codec(filename, data, codec, processes)
+        # seekable gzip trace can be decompressed by gzip
+        with gzip.open(filename + ".gz", "rb") as gzip_file:
+            if error is None and gzip_file.read() != data:
+                error = "gzip: decompressed data differs"
+    if error is not None:
+        print(f"error: {error:s}", file=sys.stderr)
+        return 1
+    print(f"{len(processes.getAllProcesses()):d} processes: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Critical path test: Analyze a small synthetic build trace with known critical
+path, concurrency profile and gaps in parallelism.
+
+usage: critpath.py
+"""
+
+import os
+import struct
+import sys
+import tempfile
+
+import uproctrace.critpath
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+# synthetic build: name -> (pid, ppid, begin, end, CPU time)
+#
+#   make  0 ---------------------------------------- 10   (CPU 0)
+#   cc_a  0 ---------------- 4                            (CPU 4)
+#   cc_c     1 ---- 2                                     (CPU 1)
+#   ld_b                     4 -------------------- 9     (CPU 2)
+#   as_d                         5 ---------- 8           (CPU 0)
+PROCESSES = {
+    "make": (1000, 999, 0, 10, 0),
+    "cc_a": (1001, 1000, 0, 4, 4),
+    "cc_c": (1002, 1000, 1, 2, 1),
+    "ld_b": (1003, 1000, 4, 9, 2),
+    "as_d": (1004, 1003, 5, 8, 0),
+}
+
+
+def write_trace(proto_file):
+    """
+    Write synthetic build trace to proto_file.
+    """
+    events = []
+    for name, (pid, ppid, begin, end, cpu_time) in PROCESSES.items():
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + begin
+        pb2_ev.proc_begin.pid = pid
+        pb2_ev.proc_begin.ppid = ppid
+        pb2_ev.proc_begin.cmdline.s.append(name)
+        events.append((begin, 0, pb2_ev))
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + end
+        pb2_ev.proc_end.pid = pid
+        pb2_ev.proc_end.cpu_time.sec = cpu_time
+        events.append((end, -pid, pb2_ev))
+    for _timestamp, _order, pb2_ev in sorted(events, key=lambda ev: ev[:2]):
+        data = pb2_ev.SerializeToString()
+        proto_file.write(b"upt0" + struct.pack("!L", len(data)) + data)
+
+
+def check(what: str, actual, expected) -> bool:
+    """
+    Compare actual to expected result, return True if equal.
+    """
+    if actual != expected:
+        print(f"error: {what:s}: {actual} != {expected}", file=sys.stderr)
+        return False
+    return True
+
+
+def main():
+    """
+    Run critical path test, return 0 if results are correct.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "critpath.upt")
+        with open(filename, "wb") as proto_file:
+            write_trace(proto_file)
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+    proc_spans = uproctrace.critpath.spans(processes)
+    path = [
+        (depth, proc.cmdline[0], self_time)
+        for depth, proc, self_time in uproctrace.critpath.critical_path(
+            processes, proc_spans
+        )
+    ]
+    segments = uproctrace.critpath.timeline(proc_spans, processes)
+    base = 1600000000
+    intervals = [
+        (begin - base, end - base, round(running, 6), round(busy, 6))
+        for begin, end, running, busy in uproctrace.critpath.profile(segments, 5)
+    ]
+    gap_list = uproctrace.critpath.gaps(segments, 1.0, 1.0)
+    gap_procs = uproctrace.critpath.gap_processes(proc_spans, processes, gap_list)
+    ok = all(
+        [
+            check(
+                "critical path",
+                path,
+                [(0, "make", 1), (1, "cc_a", 4), (1, "ld_b", 2), (2, "as_d", 3)],
+            ),
+            check(
+                "profile",
+                intervals,
+                [
+                    (0, 2, 2.5, 1.5),
+                    (2, 4, 2, 1),
+                    (4, 6, 2.5, 0.4),
+                    (6, 8, 3, 0.4),
+                    (8, 10, 1.5, 0.2),
+                ],
+            ),
+            check(
+                "gaps",
+                [
+                    (begin - base, end - base, round(busy, 6))
+                    for begin, end, busy in gap_list
+                ],
+                [(4, 10, 0.333333)],
+            ),
+            check(
+                "gap processes",
+                [[proc.cmdline[0] for proc in procs] for procs in gap_procs],
+                [["as_d"]],
+            ),
+        ]
+    )
+    if not ok:
+        return 1
+    print("critical path, profile and gaps: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
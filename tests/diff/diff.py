@@ -0,0 +1,169 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Trace diff test: Build two synthetic traces of the same random build, the
+second one with different pids, temporary file names and timestamps, some
+processes removed, some added and some with more CPU time, and check that
+the diff finds exactly these changes. Executables with the same base name
+(ld) must be shown with their full paths.
+
+usage: diff.py [<number of processes>]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import struct
+import sys
+import tempfile
+
+import uproctrace.diff
+import uproctrace.uproctrace_pb2 as pb2
+
+EXES = ["/usr/bin/clang", "/usr/bin/ld", "/opt/x/bin/ld", "/bin/sh", "/usr/bin/make"]
+
+
+def build(count: int) -> list[tuple[int, int | None, str, list[str]]]:
+    """
+    Return random process tree of a build: list of (index, parent index,
+    exe, command line) in order of process creation.
+    """
+    rnd = random.Random(42)
+    procs = []
+    for i in range(count):
+        parent = rnd.randrange(i) if i else None
+        exe = rnd.choice(EXES)
+        # some commands appear multiple times under the same parent
+        cmdline = [os.path.basename(exe), f"file{rnd.randrange(count // 2):d}.c"]
+        procs.append((i, parent, exe, cmdline))
+    return procs
+
+
+def frames(procs: list, pid_base: int, tmp_name: str, cpu_times: dict) -> list[bytes]:
+    """
+    Return framed serialized events of trace of processes procs (see build)
+    with CPU times (index -> CPU time in s).
+    """
+    events = []
+    for i, parent, exe, cmdline in procs:
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = pid_base + i
+        pb2_ev.proc_begin.pid = pid_base + i
+        if parent is not None:
+            pb2_ev.proc_begin.ppid = pid_base + parent
+        pb2_ev.proc_begin.exe = exe
+        pb2_ev.proc_begin.cmdline.s.extend(cmdline + ["-o", f"/tmp/{tmp_name:s}{i:d}"])
+        events.append(pb2_ev)
+    for i, parent, _exe, _cmdline in reversed(procs):
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = pid_base + 2 * len(procs)
+        pb2_ev.proc_end.pid = pid_base + i
+        if parent is not None:
+            pb2_ev.proc_end.ppid = pid_base + parent
+        pb2_ev.proc_end.cpu_time.sec = cpu_times.get(i, 1)
+        pb2_ev.proc_end.max_rss_kb = 1000
+        events.append(pb2_ev)
+    return [
+        b"upt0" + struct.pack("!L", len(data)) + data
+        for data in (pb2_ev.SerializeToString() for pb2_ev in events)
+    ]
+
+
+def write(filename: str, data: list[bytes]) -> None:
+    """
+    Write frames to trace file.
+    """
+    with open(filename, "wb") as proto_file:
+        proto_file.write(b"".join(data))
+
+
+def diff_table(file_a: str, file_b: str) -> str:
+    """
+    Run diff command on two traces, return table output.
+    """
+    args = argparse.Namespace(
+        trace=[file_a, file_b],
+        no_index=True,
+        jobs=1,
+        sort="cpu_time",
+        limit=100,
+        format="table",
+        fail_above=None,
+    )
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        uproctrace.diff.diff(args)
+    return out.getvalue()
+
+
+def main():
+    """
+    Run trace diff test, return 0 if the diff is correct.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rnd = random.Random(7)
+    procs_a = build(count)
+    # remove some leaf processes, add some processes
+    parents = {parent for _i, parent, _exe, _cmdline in procs_a}
+    leaves = [i for i in range(count) if i not in parents]
+    removed = set(rnd.sample(leaves, 20))
+    procs_b = [proc for proc in procs_a if proc[0] not in removed]
+    for i in range(count, count + 30):
+        procs_b.append((i, rnd.randrange(count // 2), "/bin/sh", ["sh", f"new{i:d}"]))
+    slower = set(rnd.sample(sorted(set(range(count)) - removed), 50))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_a = os.path.join(tmp_dir, "a.upt")
+        file_b = os.path.join(tmp_dir, "b.upt")
+        write(file_a, frames(procs_a, 1000, "ccA1B2C3", {}))
+        write(file_b, frames(procs_b, 50000, "ccX9Y8Z7", {i: 3 for i in slower}))
+        summary_a = uproctrace.diff.summarize(file_a, False)
+        summary_b = uproctrace.diff.summarize(file_b, False)
+        table = diff_table(file_a, file_b)
+    total, per_exe, per_proc = uproctrace.diff.compare(summary_a, summary_b)
+    statuses = {"added": 0, "removed": 0, "changed": 0}
+    slower_count = 0
+    for _cmdline, acc in per_proc:
+        statuses[uproctrace.diff.status(acc)] += 1
+        cpu_a, cpu_b, _delta = uproctrace.diff.delta(acc, "cpu_time")
+        if cpu_a and cpu_b and cpu_b != cpu_a:
+            slower_count += 1
+    expected = {"added": 30, "removed": 20, "changed": count - 20}
+    if statuses != expected:
+        print(f"error: {statuses} != {expected}", file=sys.stderr)
+        return 1
+    if slower_count != len(slower):
+        print(f"error: {slower_count:d} slower != {len(slower):d}", file=sys.stderr)
+        return 1
+    expected_delta = 30 - 20 + 2 * len(slower)
+    cpu_delta = uproctrace.diff.delta(total, "cpu_time")[2]
+    if abs(cpu_delta - expected_delta) > 1e-6:
+        print(f"error: CPU time delta {cpu_delta} != {expected_delta}", file=sys.stderr)
+        return 1
+    sh_delta = uproctrace.diff.delta(per_exe["/bin/sh"], "cpu_time")[2]
+    sh_expected = 30 + sum(
+        2 if i in slower else -1 if i in removed else 0
+        for i, _parent, exe, _cmdline in procs_a
+        if exe == "/bin/sh"
+    )
+    if abs(sh_delta - sh_expected) > 1e-6:
+        print(
+            f"error: /bin/sh CPU time delta {sh_delta} != {sh_expected}",
+            file=sys.stderr,
+        )
+        return 1
+    exe_names = table.split("per process:")[0].split()
+    for name in ["/usr/bin/ld", "/opt/x/bin/ld", "clang", "sh", "make"]:
+        if name not in exe_names:
+            print(f"error: executable {name:s} not in table", file=sys.stderr)
+            return 1
+    print(f"{statuses}, CPU time delta {cpu_delta:.1f} s: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
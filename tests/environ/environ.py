@@ -0,0 +1,192 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Environment capture policy test: Build a synthetic trace with random
+processes whose environments are stored once per trace and otherwise only
+referenced by hash (like libuptpl with UPTPL_ENVIRON=hash), with some full
+environments and some processes without environment, and check that the
+environments are resolved when loading the processes in all ways.
+
+usage: environ.py [<number of processes>]
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+import uproctrace.index
+import uproctrace.parse
+import uproctrace.processes
+import uproctrace.sqlite
+import uproctrace.uproctrace_pb2 as pb2
+
+# distinct environments in trace
+ENVIRONS = [[f"PATH=/bin{i:d}", "HOME=/root", f"V{i:d}=ü"] for i in range(5)]
+
+# environment without any stored definition in trace
+UNDEFINED = ["LOST=1"]
+
+
+def fnv1a(environ: list[str]) -> int:
+    """
+    Return 64 bit FNV-1a hash of environment (like libuptev).
+    """
+    value = 0xCBF29CE484222325
+    for byte in b"".join(var.encode() + b"\0" for var in environ):
+        value = ((value ^ byte) * 0x100000001B3) & 0xFFFFFFFFFFFFFFFF
+    return value
+
+
+def events(count: int) -> tuple[list[bytes], list[list[str] | None]]:
+    """
+    Return framed serialized events of a synthetic trace with count random
+    processes and the expected environment of each process (index proc_id).
+    The environment of ENVIRONS[0] is stored after its first references.
+    """
+    rnd = random.Random(42)
+    result = []
+    expected = []
+    stored = set()
+    for i in range(count):
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i
+        pb2_ev.proc_begin.pid = 1000 + i
+        if i:
+            pb2_ev.proc_begin.ppid = 1000 + rnd.randrange(i)
+        choice = rnd.random()
+        if choice < 0.1:
+            environ = None  # policy "none"
+        elif choice < 0.2:
+            environ = rnd.choice(ENVIRONS)  # policy "full"
+            pb2_ev.proc_begin.environ.s.extend(environ)
+        else:
+            environ = rnd.choice(ENVIRONS + [UNDEFINED])
+            pb2_ev.proc_begin.environ_hash = fnv1a(environ)
+            key = tuple(environ)
+            if key not in stored and environ is not UNDEFINED:
+                if environ is not ENVIRONS[0] or i > count // 2:
+                    pb2_ev.proc_begin.environ.s.extend(environ)
+                    stored.add(key)
+            if environ is UNDEFINED:
+                environ = None
+        result.append(uproctrace.parse.frame(pb2_ev.SerializeToString()))
+        expected.append(environ)
+    return result, expected
+
+
+def check(processes, expected: list) -> str | None:
+    """
+    Check environments of processes, return error message or None.
+    """
+    all_procs = processes.getAllProcesses()
+    if len(all_procs) != len(expected):
+        return f"{len(all_procs):d} processes != {len(expected):d}"
+    for proc_id, proc in all_procs.items():
+        if proc.environ != expected[proc_id]:
+            return f"proc_id {proc_id:d}: environ {proc.environ} != {expected[proc_id]}"
+    return None
+
+
+def check_single(filename: str, expected: list) -> str | None:
+    """
+    Check environments of single processes (and their parents and children)
+    loaded via index, return error message or None.
+    """
+    for proc_id in range(0, len(expected), 7):
+        proc = uproctrace.index.load_process(filename, proc_id)
+        loaded = [proc] + proc.children
+        if proc.parent is not None:
+            loaded.append(proc.parent)
+        for other in loaded:
+            if other.environ != expected[other.proc_id]:
+                return f"proc_id {other.proc_id:d}: environ differs (single)"
+    return None
+
+
+def write_index(filename: str) -> None:
+    """
+    Write index file of trace file.
+    """
+    with open(filename, "rb") as proto_file:
+        uproctrace.index.write_index(proto_file, filename, False)
+
+
+def check_update(frames: list[bytes], expected: list) -> str | None:
+    """
+    Check that an environment stored later in a growing trace is resolved
+    after the update, return error message or None.
+    """
+    with tempfile.TemporaryFile() as proto_file:
+        proto_file.write(b"".join(frames[: len(frames) // 2]))
+        proto_file.flush()
+        proto_file.seek(0)
+        processes = uproctrace.processes.Processes(proto_file)
+        first = expected.index(ENVIRONS[0])
+        if processes.getProcess(first).environ is not None:
+            return "environment found before it was stored"
+        proto_file.seek(0, os.SEEK_END)
+        proto_file.write(b"".join(frames[len(frames) // 2 :]))
+        proto_file.flush()
+        processes.update(proto_file)
+    return check(processes, expected)
+
+
+def main():
+    """
+    Run environment capture policy test, return 0 if environments are
+    resolved correctly.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    frames, expected = events(count)
+    uproctrace.processes.Processes.MIN_SPAN_SIZE = 4096
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "environ.upt")
+        with open(filename, "wb") as proto_file:
+            proto_file.write(b"".join(frames))
+        checks = [
+            (
+                "trace",
+                lambda: check(uproctrace.index.load_processes(filename), expected),
+            ),
+            (
+                "parallel",
+                lambda: check(
+                    uproctrace.index.load_processes(filename, False, 3), expected
+                ),
+            ),
+            (
+                "index",
+                lambda: write_index(filename)
+                or check(uproctrace.index.load_processes(filename), expected),
+            ),
+            ("single", lambda: check_single(filename, expected)),
+            ("update", lambda: check_update(frames, expected)),
+        ]
+        for name, func in checks:
+            error = func()
+            if error is not None:
+                break
+            print(f"{name:s}: OK")
+        if error is None:
+            db_filename = uproctrace.sqlite.database_filename(filename)
+            processes = uproctrace.index.load_processes(filename)
+            uproctrace.sqlite.write_database(db_filename, processes, filename)
+            error = check(uproctrace.index.load_processes(db_filename), expected)
+            processes = uproctrace.index.load_processes(filename, False)
+            if error is None and processes.select("environ == 'V0=ü'") != [
+                proc_id for proc_id, env in enumerate(expected) if env == ENVIRONS[0]
+            ]:
+                error = "query of environ differs"
+    if error is not None:
+        print(f"error: {error:s}", file=sys.stderr)
+        return 1
+    print(f"{count:d} processes: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+#! /bin/bash
+
+# Benchmark of the tracing overhead per exec: run a short program many times
+# (in parallel workers) without and with tracing and print the time per exec.
+#
+# usage: exec_bench.bash <UPT_HOME> [<count> [<jobs>]]
+
+set -eu -o pipefail
+
+if (( $# < 1 ))
+then
+  echo "usage: $0 <UPT_HOME> [<count> [<jobs>]]" >&2
+  exit 2
+fi
+UPT_HOME="$1"
+COUNT="${2:-1000}"
+JOBS="${3:-4}"
+
+source "$UPT_HOME/exports"
+
+BENCH="$UPT_HOME/tests/exec_bench/exec_bench"
+
+rm -f exec_bench.upt
+
+echo -n "untraced: "
+"$BENCH" "$COUNT" "$JOBS" /bin/true
+echo -n "traced:   "
+upt-trace exec_bench.upt "$BENCH" "$COUNT" "$JOBS" /bin/true
+
+# every exec of /bin/true must have been traced
+TRACED="$(upt-tool exec_bench.upt pstree | grep -c -x " */bin/true")"
+echo "traced execs: $TRACED"
+(( TRACED == COUNT * JOBS ))
@@ -0,0 +1,89 @@
+/**
+ * UProcTrace: User-space Process Tracing
+ * Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+ * Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+ */
+
+/*
+ * Benchmark of process creation: run a program count times in each of jobs
+ * parallel workers (fork, exec, wait) and print the wall time per execution.
+ * Run it with and without tracing to get the tracing overhead per exec.
+ *
+ * usage: exec_bench <count> <jobs> <program> [<arg> [...]]
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <time.h>
+#include <unistd.h>
+
+static int run(char **argv) {
+  pid_t child = fork();
+  if (child == 0) {
+    execv(argv[0], argv);
+    _exit(EXIT_FAILURE);
+  }
+  if (child < 0) {
+    return -1;
+  }
+  int status;
+  if (waitpid(child, &status, 0) != child || !WIFEXITED(status) ||
+      WEXITSTATUS(status) != EXIT_SUCCESS) {
+    return -1;
+  }
+  return 0;
+}
+
+static int worker(long count, char **argv) {
+  for (long i = 0; i < count; ++i) {
+    if (run(argv) != 0) {
+      return -1;
+    }
+  }
+  return 0;
+}
+
+int main(int argc, char **argv) {
+  if (argc < 4) {
+    fprintf(stderr, "usage: %s <count> <jobs> <program> [<arg> [...]]\n",
+            argv[0]);
+    return 2;
+  }
+  long count = atol(argv[1]);
+  long jobs = atol(argv[2]);
+  if (count < 1 || jobs < 1) {
+    fprintf(stderr, "error: count and jobs must be positive\n");
+    return 2;
+  }
+  struct timespec begin, end;
+  clock_gettime(CLOCK_MONOTONIC, &begin);
+  for (long j = 0; j < jobs; ++j) {
+    pid_t child = fork();
+    if (child == 0) {
+      _exit(worker(count, argv + 3) == 0 ? EXIT_SUCCESS : EXIT_FAILURE);
+    }
+    if (child < 0) {
+      perror("fork");
+      return EXIT_FAILURE;
+    }
+  }
+  int failed = 0;
+  int status;
+  while (wait(&status) > 0) {
+    if (!WIFEXITED(status) || WEXITSTATUS(status) != EXIT_SUCCESS) {
+      failed = 1;
+    }
+  }
+  clock_gettime(CLOCK_MONOTONIC, &end);
+  if (failed) {
+    fprintf(stderr, "error: running %s failed\n", argv[3]);
+    return EXIT_FAILURE;
+  }
+  double sec =
+      (end.tv_sec - begin.tv_sec) + (end.tv_nsec - begin.tv_nsec) * 1e-9;
+  printf("%ld execs in %.3f s: %.1f us per exec\n", count * jobs, sec,
+         sec / (count * jobs) * 1e6);
+  return EXIT_SUCCESS;
+}
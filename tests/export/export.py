@@ -0,0 +1,113 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Export test: Build a synthetic trace with random processes (some without
+begin or end event), export all and a selection of them in small batches
+and compare the rows read back to the processes.
+
+usage: export.py [<number of processes>]
+"""
+
+import os
+import sys
+import tempfile
+
+import uproctrace.columns
+import uproctrace.export
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+import synthetic
+
+
+def events(count: int) -> list[pb2.event]:
+    """
+    Return events of a synthetic trace with count random processes (some
+    without begin or end event, some with empty command line or arguments).
+    """
+    trace = synthetic.events(count, begin=0.9, end=0.8, fields=0.8)
+    synthetic.adjust_cmdlines(trace, lambda i, args: [args[0], "", args[1]][: i % 4])
+    return trace
+
+
+def expected_row(proc) -> dict:
+    """
+    Return expected values of row of process.
+    """
+    row = {
+        "proc_id": proc.proc_id,
+        "pid": proc.pid,
+        "ppid": -1 if proc.ppid is None else proc.ppid,
+        "parent": -1 if proc.parent is None else proc.parent.proc_id,
+        "exe": proc.exe,
+        "cwd": proc.cwd,
+        "cmdline": None if proc.cmdline is None else "\0".join(proc.cmdline),
+    }
+    for attr in uproctrace.columns.ATTRS:
+        value = getattr(proc, attr)
+        row[attr] = 0 if value is None else value
+        row["mask " + attr] = int(value is not None)
+    return row
+
+
+def read_rows(filename: str) -> list[dict]:
+    """
+    Read all rows of export file.
+    """
+    rows = []
+    for batch in uproctrace.export.read_export(filename):
+        names = [name for name in batch if " " not in name]
+        names += ["mask " + attr for attr in uproctrace.columns.ATTRS]
+        values = {name: list(batch[name]) for name in names}
+        for name in uproctrace.export.STRING_COLUMNS:
+            values[name] = uproctrace.export.strings(batch, name)
+        rows += [dict(zip(values, row)) for row in zip(*values.values())]
+    return rows
+
+
+def main():
+    """
+    Run export test, return 0 if exported rows are correct.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    uproctrace.export.BATCH_SIZE = 37
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "export.upt")
+        with open(filename, "wb") as proto_file:
+            proto_file.write(synthetic.serialize(events(count)))
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+        all_procs = processes.getAllProcesses()
+        selected = processes.select("exe == '/ü' or cpu_time < 0.1")
+        for proc_ids in (None, selected, []):
+            export_file = uproctrace.export.export_filename(filename)
+            rows = uproctrace.export.write_export(export_file, processes, proc_ids)
+            if proc_ids is None:
+                proc_ids = sorted(all_procs)
+            actual = read_rows(export_file)
+            expected = [expected_row(all_procs[proc_id]) for proc_id in proc_ids]
+            if rows != len(proc_ids) or actual != expected:
+                for act, exp in zip(actual, expected):
+                    if act != exp:
+                        print(f"error: {act} != {exp}", file=sys.stderr)
+                        break
+                print(
+                    f"error: {len(actual):d} != {len(expected):d} rows", file=sys.stderr
+                )
+                return 1
+            print(f"{rows:d} rows: OK")
+        try:
+            list(uproctrace.export.read_export(filename))
+        except ValueError:
+            pass
+        else:
+            print("error: trace file accepted as export file", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
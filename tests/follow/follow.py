@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Follow test: Write a synthetic trace in pieces that end in the middle of
+events, follow it and check that the processes are identical to parsing the
+complete trace. Check that only plain trace files can be followed.
+
+usage: follow.py [<process count>]
+"""
+
+import contextlib
+import io
+import os
+import struct
+import sys
+import tempfile
+
+import uproctrace.compress
+import uproctrace.follow
+import uproctrace.processes
+import uproctrace.tool
+import uproctrace.uproctrace_pb2 as pb2
+
+
+def frames(proc_cnt: int) -> list[bytes]:
+    """
+    Return framed serialized events of a synthetic trace with proc_cnt
+    processes.
+    """
+    result = []
+    for i in range(proc_cnt):
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i
+        pb2_ev.proc_begin.pid = 1000 + i
+        pb2_ev.proc_begin.ppid = 1000 + i // 2
+        pb2_ev.proc_begin.cmdline.s.extend(["cc", "-c", f"file{i:d}.c"])
+        result.append(pb2_ev)
+        if i % 3 == 2:
+            pb2_ev = pb2.event()
+            pb2_ev.timestamp.sec = 1600000000 + i
+            pb2_ev.proc_end.pid = 1000 + i - 1
+            pb2_ev.proc_end.cpu_time.sec = i
+            result.append(pb2_ev)
+    return [
+        b"upt0" + struct.pack("!L", len(data)) + data
+        for data in (pb2_ev.SerializeToString() for pb2_ev in result)
+    ]
+
+
+def describe(processes) -> list:
+    """
+    Return comparable description of processes.
+    """
+    desc = [
+        (
+            proc.pid,
+            proc.ppid,
+            proc.cmdline,
+            proc.cpu_time,
+            [child.proc_id for child in proc.children],
+        )
+        for proc in processes.getAllProcesses().values()
+    ]
+    desc.append([proc.proc_id for proc in processes.toplevel])
+    desc.append([proc.proc_id for proc in processes.current])
+    desc.append(processes.trace_offset)
+    return desc
+
+
+def check_followable(filename: str, tmp_dir: str) -> bool:
+    """
+    Check that the plain trace file can be followed, but not a compressed
+    copy or a directory.
+    """
+    compressed = filename + ".gz"
+    with open(filename, "rb") as proto_file:
+        uproctrace.compress.compress_trace(proto_file, compressed, "gzip")
+    for upt_trace, expected in [
+        (filename, True),
+        (compressed, False),
+        (tmp_dir, False),
+    ]:
+        with contextlib.redirect_stderr(io.StringIO()):
+            allowed = uproctrace.tool.check_follow("pstree", [upt_trace])
+        if allowed != expected:
+            print(
+                f"error: {upt_trace:s}: follow allowed != {expected}", file=sys.stderr
+            )
+            return False
+    return True
+
+
+def main():
+    """
+    Run follow test, return 0 if following the trace works.
+    """
+    proc_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    data = b"".join(frames(proc_cnt))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "follow.upt")
+        with open(filename, "wb") as proto_file:
+            # start with half an event
+            pos = len(data) // 1000
+            proto_file.write(data[:pos])
+            proto_file.flush()
+            processes_iter = uproctrace.follow.follow_processes(filename, False, 0.01)
+            processes = next(processes_iter)
+            updates = 0
+            while pos < len(data):
+                # append pieces ending in the middle of events
+                size = len(data) // 10 + 1
+                proto_file.write(data[pos : pos + size])
+                proto_file.flush()
+                pos += size
+                if next(processes_iter) is not processes:
+                    print("error: processes replaced", file=sys.stderr)
+                    return 1
+                updates += 1
+                with open(filename, "rb") as check_file:
+                    expected = uproctrace.processes.Processes(check_file)
+                if describe(processes) != describe(expected):
+                    print(f"error: update {updates:d}: mismatch", file=sys.stderr)
+                    return 1
+            # truncate and start a new trace
+            proto_file.seek(0)
+            proto_file.truncate()
+            proto_file.write(data[: len(data) // 2])
+            proto_file.flush()
+            processes = next(processes_iter)
+            with open(filename, "rb") as check_file:
+                expected = uproctrace.processes.Processes(check_file)
+            if describe(processes) != describe(expected):
+                print("error: truncated trace: mismatch", file=sys.stderr)
+                return 1
+            processes_iter.close()
+        if not check_followable(filename, tmp_dir):
+            return 1
+    print(f"{updates:d} updates: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Histogram test: Check quantiles estimated by uproctrace.histogram.Histogram
+against exact quantiles and check merging histograms.
+
+usage: histogram.py [<value count>]
+"""
+
+import math
+import random
+import sys
+
+import uproctrace.histogram
+
+
+def exact_quantile(values: list, quant: float) -> float:
+    """
+    Return exact quantile of sorted values (nearest rank method).
+    """
+    return values[max(1, math.ceil(quant * len(values))) - 1]
+
+
+def main():
+    """
+    Run histogram test, return 0 if estimated quantiles are within bounds.
+    """
+    cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rnd = random.Random(42)
+    values = [rnd.lognormvariate(0, 3) for _ in range(cnt)]
+    values += [0] * (cnt // 10)  # e.g. page faults
+    rnd.shuffle(values)
+    res = uproctrace.histogram.Histogram.RESOLUTION
+    max_error = 2 ** (1 / (2 * res)) - 1
+
+    # histogram of all values and merged histogram of parts
+    hist = uproctrace.histogram.Histogram()
+    hist.addValues(values)
+    merged = uproctrace.histogram.Histogram()
+    for start in range(0, len(values), 7777):
+        part = uproctrace.histogram.Histogram()
+        for value in values[start : start + 7777]:
+            part.add(value)
+        merged.merge(part)
+
+    values.sort()
+    for quant in (0, 0.01, 0.1, 0.5, 0.9, 0.99, 0.999, 1):
+        exact = exact_quantile(values, quant)
+        estimate = hist.quantile(quant)
+        if abs(estimate - exact) > exact * max_error:
+            print(
+                f"error: quantile {quant:f}: estimate {estimate:g}, exact {exact:g}",
+                file=sys.stderr,
+            )
+            return 1
+        if merged.quantile(quant) != estimate:
+            print(
+                f"error: quantile {quant:f}: merged histogram differs",
+                file=sys.stderr,
+            )
+            return 1
+    if hist.buckets() != merged.buckets() or len(merged) != len(values):
+        print("error: merged histogram differs", file=sys.stderr)
+        return 1
+    if uproctrace.histogram.Histogram().quantile(0.5) is not None:
+        print("error: quantile of empty histogram", file=sys.stderr)
+        return 1
+    print("\n".join(hist.render(lambda v: f"{v:.3g}")))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
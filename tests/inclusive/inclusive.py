@@ -0,0 +1,153 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Inclusive metrics test: Build a synthetic trace with a process chain deeper
+than the recursion limit and a random process tree below it, ingest it in
+pieces with Processes.update() and check the inclusive metrics of all
+processes against a reference after each piece.
+
+usage: inclusive.py [<chain depth>]
+"""
+
+import os
+import random
+import struct
+import sys
+import tempfile
+
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+
+def frames(depth: int) -> list[bytes]:
+    """
+    Return framed serialized events of a synthetic trace with a chain of depth
+    processes and a random process tree of depth processes below it.
+    """
+    rnd = random.Random(42)
+    result = []
+
+    def end(pid: int, ppid: int | None = None):
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + len(result)
+        pb2_ev.proc_end.pid = pid
+        if ppid is not None:
+            pb2_ev.proc_end.ppid = ppid
+        pb2_ev.proc_end.cpu_time.sec = rnd.randrange(10)
+        pb2_ev.proc_end.user_time.sec = rnd.randrange(10)
+        pb2_ev.proc_end.max_rss_kb = rnd.randrange(1000000)
+        pb2_ev.proc_end.min_flt = rnd.randrange(1000)
+        pb2_ev.proc_end.in_block = rnd.randrange(1000)
+        pb2_ev.proc_end.n_iv_csw = rnd.randrange(1000)
+        result.append(pb2_ev)
+
+    for i in range(2 * depth):
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + len(result)
+        pb2_ev.proc_begin.pid = 1001 + i
+        pb2_ev.proc_begin.ppid = 1000 + min(i, depth)
+        result.append(pb2_ev)
+        # processes of random tree end early, some are re-parented
+        if i > depth and rnd.random() < 0.5:
+            pid = rnd.randrange(depth + 1001, 1001 + i)
+            ppid = rnd.randrange(1001, 1001 + depth) if rnd.random() < 0.3 else None
+            end(pid, ppid)
+    for i in reversed(range(depth)):
+        end(1001 + i)
+    return [
+        b"upt0" + struct.pack("!L", len(data)) + data
+        for data in (pb2_ev.SerializeToString() for pb2_ev in result)
+    ]
+
+
+def reference(processes) -> dict:
+    """
+    Compute inclusive metrics of all processes without Process.inclusive:
+    proc_id -> tuple of values (see processes.Inclusive).
+    """
+    fields = uproctrace.processes.Inclusive._fields
+    all_procs = processes.getAllProcesses()
+    totals = {
+        proc_id: [1] + [getattr(proc, attr) or 0 for attr in fields[1:]]
+        for proc_id, proc in all_procs.items()
+    }
+    # depth of each process, accumulate from deepest processes upwards
+    depths = {}
+    for proc_id, proc in all_procs.items():
+        path = []
+        while proc is not None and proc.proc_id not in depths:
+            path.append(proc.proc_id)
+            proc = proc.parent
+        depth = 0 if proc is None else depths[proc.proc_id] + 1
+        for path_id in reversed(path):
+            depths[path_id] = depth
+            depth += 1
+    rss_idx = fields.index("max_rss_kb")
+    for proc_id in sorted(depths, key=depths.get, reverse=True):
+        parent = all_procs[proc_id].parent
+        if parent is None:
+            continue
+        parent_totals = totals[parent.proc_id]
+        for idx, value in enumerate(totals[proc_id]):
+            if idx == rss_idx:
+                parent_totals[idx] = max(parent_totals[idx], value)
+            else:
+                parent_totals[idx] += value
+    return {proc_id: tuple(values) for proc_id, values in totals.items()}
+
+
+def check(processes, pos: int) -> bool:
+    """
+    Check inclusive metrics of all processes, return True if correct.
+    """
+    expected = reference(processes)
+    for proc_id, proc in processes.getAllProcesses().items():
+        if tuple(proc.inclusive) != expected[proc_id]:
+            print(
+                f"error: offset {pos:d}: proc_id {proc_id:d}:"
+                f" {tuple(proc.inclusive)} != {expected[proc_id]}",
+                file=sys.stderr,
+            )
+            return False
+    return True
+
+
+def main():
+    """
+    Run inclusive metrics test, return 0 if metrics are correct.
+    """
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    data = b"".join(frames(depth))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "inclusive.upt")
+        with open(filename, "wb") as proto_file, open(filename, "rb") as read_file:
+            processes = uproctrace.processes.Processes(read_file)
+            pos = 0
+            while pos < len(data):
+                # append a piece ending in the middle of an event
+                size = len(data) // 10 + 1
+                proto_file.write(data[pos : pos + size])
+                proto_file.flush()
+                pos += size
+                processes.update(read_file)
+                # access toplevel processes first (computes whole tree)
+                for proc in processes.toplevel:
+                    _ = proc.inclusive
+                if not check(processes, pos):
+                    return 1
+        with open(filename, "rb") as read_file:
+            processes = uproctrace.processes.Processes(read_file)
+            # access deepest process first (computes part of tree)
+            _ = processes.getProcess(depth).inclusive
+            if not check(processes, len(data)):
+                return 1
+            count = sum(proc.inclusive.count for proc in processes.toplevel)
+    print(f"{count:d} processes: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Index test: Write a synthetic trace, check that loading it does not create an
+index file, load its processes via an explicitly written index file and check
+that they are identical to freshly parsed processes (pstree and psinfo fields
+as well as columns).
+
+usage: index.py [<process count>]
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+import uproctrace.columns
+import uproctrace.index
+import uproctrace.parse
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+EXES = ["/bin/sh", "/usr/bin/cc", "/usr/bin/ld", "/usr/bin/make"]
+
+
+def write_trace(filename: str, proc_cnt: int):
+    """
+    Write a synthetic trace with a random process tree of proc_cnt processes
+    (some of them without end event) to a file.
+    """
+    rnd = random.Random(42)
+    alive = [1000]
+    with open(filename, "wb") as proto_file:
+        for i in range(proc_cnt):
+            pid = 1001 + i
+            exe = rnd.choice(EXES)
+            pb2_ev = pb2.event()
+            pb2_ev.timestamp.sec = 1600000000 + i
+            pb2_ev.proc_begin.pid = pid
+            pb2_ev.proc_begin.ppid = rnd.choice(alive)
+            pb2_ev.proc_begin.exe = exe
+            pb2_ev.proc_begin.cwd = f"/home/user/dir{rnd.randrange(5):d}"
+            pb2_ev.proc_begin.cmdline.s.extend([os.path.basename(exe), f"f{i:d}"])
+            pb2_ev.proc_begin.environ.s.extend(["PATH=/bin", f"N={i % 3:d}"])
+            proto_file.write(uproctrace.parse.frame(pb2_ev.SerializeToString()))
+            alive.append(pid)
+            if len(alive) > 10 or rnd.random() < 0.3:
+                pid = alive.pop(rnd.randrange(1, len(alive)))
+                pb2_ev = pb2.event()
+                pb2_ev.timestamp.sec = 1600000000 + i
+                pb2_ev.timestamp.nsec = 500000000
+                pb2_ev.proc_end.pid = pid
+                if rnd.random() < 0.5:
+                    pb2_ev.proc_end.ppid = 1000
+                pb2_ev.proc_end.cpu_time.sec = rnd.randrange(100)
+                pb2_ev.proc_end.user_time.sec = rnd.randrange(100)
+                pb2_ev.proc_end.user_time.nsec = rnd.randrange(1000000000)
+                pb2_ev.proc_end.max_rss_kb = rnd.randrange(1000, 100000)
+                pb2_ev.proc_end.min_flt = rnd.randrange(1000)
+                pb2_ev.proc_end.ou_block = rnd.randrange(1000)
+                pb2_ev.proc_end.n_iv_csw = rnd.randrange(1000)
+                proto_file.write(uproctrace.parse.frame(pb2_ev.SerializeToString()))
+
+
+def describe(processes) -> list:
+    """
+    Return comparable description of processes (fields shown by pstree and
+    psinfo).
+    """
+    desc = []
+    for proc_id, proc in processes.getAllProcesses().items():
+        desc.append(
+            (
+                proc_id,
+                proc.pid,
+                proc.ppid,
+                proc.exe,
+                proc.cwd,
+                proc.cmdline,
+                proc.environ,
+                [getattr(proc, attr) for attr in uproctrace.columns.ATTRS],
+                proc.inclusive,
+                None if proc.parent is None else proc.parent.proc_id,
+                [child.proc_id for child in proc.children],
+                processes.getEventOffsets(proc_id),
+            )
+        )
+    desc.append([proc.proc_id for proc in processes.toplevel])
+    desc.append(processes.trace_offset)
+    return desc
+
+
+def describe_columns(columns) -> list:
+    """
+    Return comparable description of columns.
+    """
+    return [
+        (list(columns.column(attr)), bytes(columns.mask(attr)))
+        for attr in uproctrace.columns.ATTRS
+    ]
+
+
+def main():
+    """
+    Run index test, return 0 if processes loaded via the index are identical
+    to parsed ones.
+    """
+    proc_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "index.upt")
+        write_trace(filename, proc_cnt)
+        with open(filename, "rb") as proto_file:
+            parsed = uproctrace.processes.Processes(proto_file)
+            expected = describe(parsed)
+            expected_columns = describe_columns(parsed.columns)
+        # loading does not create index, only writing it explicitly does
+        uproctrace.index.load_processes(filename)
+        if os.path.exists(uproctrace.index.index_filename(filename)):
+            print("error: index file written when loading", file=sys.stderr)
+            return 1
+        with open(filename, "rb") as proto_file:
+            uproctrace.index.write_index(proto_file, filename, False)
+            index = uproctrace.index.read_index(proto_file, filename)
+        if index is None:
+            print("error: no valid index file written", file=sys.stderr)
+            return 1
+        restored = uproctrace.index.load_processes(filename)
+        if describe(restored) != expected:
+            print("error: processes restored from index differ", file=sys.stderr)
+            return 1
+        columns = uproctrace.index.load_columns(filename)
+        if describe_columns(columns) != expected_columns:
+            print("error: columns restored from index differ", file=sys.stderr)
+            return 1
+    print(f"{len(expected) - 2:d} processes: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Memory regression test: Load a synthetic trace and check that the memory
+needed per process stays below uproctrace.processes.Process.MEMORY_PER_PROCESS
+(plus the size of the serialized process begin events).
+
+usage: memory.py [<process count>]
+"""
+
+import gc
+import os
+import struct
+import sys
+import tempfile
+
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+
+def rss() -> int:
+    """
+    Return resident set size of this process in bytes.
+    """
+    with open("/proc/self/statm", "r", encoding="ascii") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def write_event(proto_file, pb2_ev: pb2.event) -> int:
+    """
+    Write event to proto_file, return size of serialized event.
+    """
+    data = pb2_ev.SerializeToString()
+    proto_file.write(b"upt0" + struct.pack("!L", len(data)) + data)
+    return len(data)
+
+
+def write_trace(proto_file, proc_cnt: int) -> int:
+    """
+    Write a synthetic trace with proc_cnt processes (children of one make
+    process) to proto_file.
+    Return total size of serialized process begin events.
+    """
+    environ = [f"VARIABLE_{i:d}=value_{i:d}" for i in range(50)]
+    begin_size = 0
+    for i in range(proc_cnt):
+        pid = 1000 + i
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i
+        pb2_ev.proc_begin.pid = pid
+        pb2_ev.proc_begin.ppid = 999 if i > 0 else 1
+        pb2_ev.proc_begin.exe = "/usr/bin/cc"
+        pb2_ev.proc_begin.cwd = "/src"
+        pb2_ev.proc_begin.cmdline.s.extend(["cc", "-c", f"file{i:d}.c"])
+        pb2_ev.proc_begin.environ.s.extend(environ)
+        begin_size += write_event(proto_file, pb2_ev)
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i
+        pb2_ev.timestamp.nsec = 500000000
+        p_e = pb2_ev.proc_end
+        p_e.pid = pid
+        p_e.ppid = 999
+        for field in ("cpu_time", "user_time", "sys_time"):
+            getattr(p_e, field).sec = 1
+            getattr(p_e, field).nsec = 1000 + i
+        p_e.max_rss_kb = 100000 + i
+        p_e.min_flt = 10000 + i
+        p_e.maj_flt = 1000 + i
+        p_e.in_block = 2000 + i
+        p_e.ou_block = 3000 + i
+        p_e.n_v_csw = 4000 + i
+        p_e.n_iv_csw = 5000 + i
+        write_event(proto_file, pb2_ev)
+    return begin_size
+
+
+def main():
+    """
+    Run memory test, return 0 if memory per process is within limit.
+    """
+    proc_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "memory.upt")
+        with open(filename, "wb") as proto_file:
+            begin_size = write_trace(proto_file, proc_cnt)
+        gc.collect()
+        rss_before = rss()
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+        gc.collect()
+        rss_after = rss()
+    proc_cnt = len(processes.getAllProcesses())
+    per_proc = (rss_after - rss_before - begin_size) / proc_cnt
+    limit = uproctrace.processes.Process.MEMORY_PER_PROCESS
+    print(
+        f"{proc_cnt:d} processes: {per_proc:.0f} bytes per process"
+        f" (limit {limit:d} bytes)"
+    )
+    if per_proc > limit:
+        print("error: memory limit exceeded", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
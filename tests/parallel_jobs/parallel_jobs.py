@@ -0,0 +1,114 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Parallel jobs test: Run upt-tool commands on multiple synthetic traces
+serially and with multiple worker processes (--jobs) and check that the
+outputs are identical.
+
+usage: parallel_jobs.py [<process count per trace>]
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+
+import uproctrace.parse
+import uproctrace.tool
+import uproctrace.uproctrace_pb2 as pb2
+
+TRACE_CNT = 3
+JOBS = 3
+
+COMMANDS = [
+    ["stats"],
+    ["stats", "--per-trace"],
+    ["stats", "--quantiles", "--histograms"],
+    ["pstree", "--details"],
+    ["pstree", "--format", "json"],
+]
+
+EXES = ["/bin/sh", "/usr/bin/cc", "/usr/bin/ld", "/usr/bin/make"]
+
+
+def write_trace(filename: str, seed: int, proc_cnt: int):
+    """
+    Write a synthetic trace with a random process tree of proc_cnt processes
+    (some of them without end event) to a file.
+    """
+    rnd = random.Random(seed)
+    alive = [1000]
+    events = []
+    for i in range(proc_cnt):
+        pid = 1001 + i
+        exe = rnd.choice(EXES)
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + seed * 1000 + i
+        pb2_ev.proc_begin.pid = pid
+        pb2_ev.proc_begin.ppid = rnd.choice(alive)
+        pb2_ev.proc_begin.exe = exe
+        pb2_ev.proc_begin.cwd = f"/home/user/build{seed:d}"
+        pb2_ev.proc_begin.cmdline.s.extend([os.path.basename(exe), f"file{i:d}"])
+        events.append(pb2_ev)
+        alive.append(pid)
+        if len(alive) > 10 or rnd.random() < 0.3:
+            pid = alive.pop(rnd.randrange(1, len(alive)))
+            pb2_ev = pb2.event()
+            pb2_ev.timestamp.sec = 1600000000 + seed * 1000 + i
+            pb2_ev.timestamp.nsec = 500000000
+            pb2_ev.proc_end.pid = pid
+            pb2_ev.proc_end.cpu_time.sec = rnd.randrange(100)
+            pb2_ev.proc_end.cpu_time.nsec = rnd.randrange(1000000000)
+            pb2_ev.proc_end.max_rss_kb = rnd.randrange(1000, 100000)
+            pb2_ev.proc_end.in_block = rnd.randrange(1000)
+            pb2_ev.proc_end.n_v_csw = rnd.randrange(1000)
+            events.append(pb2_ev)
+    with open(filename, "wb") as proto_file:
+        for pb2_ev in events:
+            proto_file.write(uproctrace.parse.frame(pb2_ev.SerializeToString()))
+
+
+def run_tool(argv: list[str]) -> str:
+    """
+    Run upt-tool with command line arguments, return output (empty on error).
+    """
+    sys.argv = ["upt-tool"] + argv
+    args = uproctrace.tool.parse_args()
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        ret = args.func(args)
+    if ret:
+        print(f"error: {' '.join(argv):s}: exit code {ret}", file=sys.stderr)
+        return ""
+    return out.getvalue()
+
+
+def main():
+    """
+    Run parallel jobs test, return 0 if outputs are identical.
+    """
+    proc_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        traces = []
+        for seed in range(TRACE_CNT):
+            filename = os.path.join(tmp_dir, f"trace{seed:d}.upt")
+            write_trace(filename, seed, proc_cnt)
+            traces.append(filename)
+        for command in COMMANDS:
+            serial = run_tool(traces + command)
+            parallel = run_tool(traces + command + ["--jobs", str(JOBS)])
+            if not serial or parallel != serial:
+                cmd = " ".join(command)
+                print(f"error: {cmd:s}: output differs with --jobs", file=sys.stderr)
+                return 1
+    print(f"{len(COMMANDS):d} commands on {TRACE_CNT:d} traces: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
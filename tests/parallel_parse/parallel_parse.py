@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Parallel parsing test: Parse a synthetic trace (containing garbage, magic
+bytes inside events and a truncated event at the end) sequentially and in
+parallel and check that the processes are identical.
+
+usage: parallel_parse.py [<process count>]
+"""
+
+import os
+import random
+import struct
+import sys
+import tempfile
+
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+
+def frame(pb2_ev: pb2.event) -> bytes:
+    """
+    Return framed serialized event.
+    """
+    data = pb2_ev.SerializeToString()
+    return b"upt0" + struct.pack("!L", len(data)) + data
+
+
+def write_trace(proto_file, proc_cnt: int):
+    """
+    Write a synthetic trace with a random process tree of proc_cnt processes
+    to proto_file.
+    """
+    rnd = random.Random(42)
+    # complete process begin event (valid UTF-8) to embed in events
+    fake_ev = pb2.event()
+    fake_ev.timestamp.sec = 1
+    fake_ev.proc_begin.pid = 5
+    fake = frame(fake_ev).decode("ascii")
+    alive = [1000]
+    for i in range(proc_cnt):
+        pid = 1001 + i
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i
+        pb2_ev.proc_begin.pid = pid
+        pb2_ev.proc_begin.ppid = rnd.choice(alive)
+        pb2_ev.proc_begin.exe = "/bin/sh"
+        # magic bytes (and small events) inside events
+        pb2_ev.proc_begin.cmdline.s.extend(
+            ["sh", "-c", f"echo {fake:s} upt0\0\0\0\3{i:03d} upt0"]
+        )
+        proto_file.write(frame(pb2_ev))
+        alive.append(pid)
+        if rnd.random() < 0.05:
+            proto_file.write(b"garbage upt\0upt0\0\0\0\0" * rnd.randrange(10))
+        if len(alive) > 10 or rnd.random() < 0.3:
+            pid = alive.pop(rnd.randrange(1, len(alive)))
+            pb2_ev = pb2.event()
+            pb2_ev.timestamp.sec = 1600000000 + i
+            pb2_ev.timestamp.nsec = 500000000
+            pb2_ev.proc_end.pid = pid
+            if rnd.random() < 0.5:
+                pb2_ev.proc_end.ppid = 1000
+            pb2_ev.proc_end.cpu_time.sec = i
+            pb2_ev.proc_end.max_rss_kb = 1000 + i
+            pb2_ev.proc_end.n_iv_csw = i
+            proto_file.write(frame(pb2_ev))
+    # truncated event
+    proto_file.write(frame(pb2_ev)[:-3])
+
+
+def describe(processes) -> list:
+    """
+    Return comparable description of processes.
+    """
+    desc = []
+    for proc_id, proc in processes.getAllProcesses().items():
+        desc.append(
+            (
+                proc_id,
+                proc.pid,
+                proc.ppid,
+                proc.cmdline,
+                proc.begin_timestamp,
+                proc.end_timestamp,
+                proc.cpu_time,
+                proc.max_rss_kb,
+                proc.n_iv_csw,
+                None if proc.parent is None else proc.parent.proc_id,
+                [child.proc_id for child in proc.children],
+                processes.getEventOffsets(proc_id),
+            )
+        )
+    desc.append([proc.proc_id for proc in processes.toplevel])
+    desc.append([proc.proc_id for proc in processes.current])
+    desc.append(processes.trace_offset)
+    return desc
+
+
+def main():
+    """
+    Run parallel parsing test, return 0 if parallel parsing is identical.
+    """
+    proc_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    # small byte ranges, so range boundaries fall into events and garbage
+    uproctrace.processes.Processes.MIN_SPAN_SIZE = 1000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "parallel.upt")
+        with open(filename, "wb") as proto_file:
+            write_trace(proto_file, proc_cnt)
+        with open(filename, "rb") as proto_file:
+            expected = describe(uproctrace.processes.Processes(proto_file))
+        for jobs in (2, 3, 8, 50):
+            with open(filename, "rb") as proto_file:
+                processes = uproctrace.processes.Processes(proto_file, jobs=jobs)
+                if proto_file.tell() != processes.trace_offset:
+                    print(f"error: {jobs:d} jobs: wrong file position")
+                    return 1
+            if describe(processes) != expected:
+                print(f"error: {jobs:d} jobs: processes differ", file=sys.stderr)
+                return 1
+            print(f"{jobs:d} jobs: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
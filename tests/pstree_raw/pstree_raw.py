@@ -0,0 +1,154 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Raw pstree output test: Build a synthetic trace with a random process tree,
+output it as JSON Lines and as raw CSV and compare the rows to the processes
+(values, tree levels, order). Check that rows are written while they are
+produced.
+
+usage: pstree_raw.py [<number of processes>]
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+
+import uproctrace.columns
+import uproctrace.formatting
+import uproctrace.processes
+import uproctrace.pstree
+import uproctrace.uproctrace_pb2 as pb2
+
+import synthetic
+
+
+def events(count: int) -> list[pb2.event]:
+    """
+    Return events of a synthetic trace with count random processes (some
+    without begin or end event) with command lines that need quoting.
+    """
+    trace = synthetic.events(count, begin=0.9, end=0.8, exes=["/bin/sh"])
+    synthetic.adjust_cmdlines(trace, lambda i, args: [args[0], "-c", f"echo '{i:d}'"])
+    return trace
+
+
+def run(args: argparse.Namespace) -> str:
+    """
+    Run pstree command, return its output.
+    """
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        uproctrace.pstree.pstree(args)
+    return out.getvalue()
+
+
+def check(processes, rows: list[dict], csv_strings: bool) -> str | None:
+    """
+    Check raw rows against processes, return error message or None.
+    """
+    all_procs = processes.getAllProcesses()
+    if len(rows) != len(all_procs):
+        return f"{len(rows):d} rows != {len(all_procs):d} processes"
+    levels: dict[int, int] = {}
+    for row in rows:
+        proc = all_procs[int(row["proc_id"])]
+        parent = proc.parent
+        level = 0 if parent is None else levels.get(parent.proc_id)
+        if level is None:
+            return f"process {proc.proc_id:d} before its parent"
+        levels[proc.proc_id] = int(row["tree_level"])
+        cmdline = proc.cmdline
+        if csv_strings:
+            cmdline = uproctrace.formatting.cmdline2str(cmdline)
+        expected = {
+            "tree_level": 0 if parent is None else level + 1,
+            "proc_id": proc.proc_id,
+            "pid": proc.pid,
+            "ppid": proc.ppid,
+            "cmdline": cmdline,
+        }
+        for attr in uproctrace.columns.ATTRS:
+            expected[attr] = getattr(proc, attr)
+        for field, value in zip(uproctrace.processes.Inclusive._fields, proc.inclusive):
+            expected["inclusive_" + field] = value
+        if csv_strings:
+            expected = {
+                key: "" if value is None else str(value)
+                for key, value in expected.items()
+            }
+        if row != expected:
+            return f"{row} != {expected}"
+    return None
+
+
+def check_streaming() -> str | None:
+    """
+    Check that JSON Lines rows are written before the next row is produced.
+    """
+    out = io.StringIO()
+
+    def rows():
+        for i in range(3):
+            if out.getvalue().count("\n") != i:
+                raise RuntimeError("rows not streamed")
+            yield [i]
+
+    try:
+        with contextlib.redirect_stdout(out):
+            uproctrace.formatting.print_jsonl(["i"], rows())
+    except RuntimeError as exc:
+        return str(exc)
+    return None
+
+
+def main():
+    """
+    Run raw pstree output test, return 0 if the output is correct.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "pstree_raw.upt")
+        synthetic.write_trace(filename, events(count))
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+        args = argparse.Namespace(
+            trace=[filename],
+            no_index=True,
+            jobs=1,
+            pids=True,
+            details=True,
+            inclusive=True,
+            since=None,
+            until=None,
+            where=None,
+            raw=False,
+            format="jsonl",
+        )
+        rows = [json.loads(line) for line in run(args).splitlines()]
+        error = check(processes, rows, False)
+        if error is None:
+            print(f"jsonl: {len(rows):d} rows: OK")
+            args.format = "csv"
+            args.raw = True
+            rows = list(csv.DictReader(io.StringIO(run(args)), delimiter=";"))
+            error = check(processes, rows, True)
+    if error is None:
+        print(f"csv: {len(rows):d} rows: OK")
+        error = check_streaming()
+    if error is not None:
+        print(f"error: {error:s}", file=sys.stderr)
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Filter expression test: Build a synthetic trace with random processes,
+select processes with filter expressions and compare the result to
+reference predicates evaluated on each process.
+
+usage: query.py [<number of processes>]
+"""
+
+import os
+import pickle
+import re
+import sys
+import tempfile
+
+import uproctrace.processes
+import uproctrace.query
+
+import synthetic
+
+EXES = ["/usr/bin/clang", "/usr/bin/ld", "/bin/sh", "/usr/bin/make"]
+CWDS = ["/src/lib", "/src/lib/sub", "/src/app", "/tmp"]
+
+
+def is_descendant(proc, proc_id: int) -> bool:
+    """
+    Check if proc is a descendant of the process with proc_id.
+    """
+    proc = proc.parent
+    while proc is not None:
+        if proc.proc_id == proc_id:
+            return True
+        proc = proc.parent
+    return False
+
+
+def duration(proc) -> float | None:
+    """
+    Return duration of process (None if unknown).
+    """
+    if proc.begin_timestamp is None or proc.end_timestamp is None:
+        return None
+    return proc.end_timestamp - proc.begin_timestamp
+
+
+def defined(value, func) -> bool:
+    """
+    Return func(value) if value is not None, False otherwise.
+    """
+    return value is not None and func(value)
+
+
+# filter expressions and reference predicates
+QUERIES = [
+    ("exe ~ 'clang'", lambda p: defined(p.exe, lambda v: "clang" in v)),
+    ("cpu_time > 2", lambda p: defined(p.cpu_time, lambda v: v > 2)),
+    ("cpu_time = 0", lambda p: defined(p.cpu_time, lambda v: v == 0)),
+    ("cwd startswith '/src/lib'", lambda p: defined(p.cwd, lambda v: v[:8] == "/src/lib")),
+    ("cwd endswith \"lib\"", lambda p: defined(p.cwd, lambda v: v[-3:] == "lib")),
+    ("cmdline contains 'file1'", lambda p: defined(p.cmdline, lambda v: "file1" in " ".join(v))),
+    ("argv0 == 'sh'", lambda p: defined(p.cmdline, lambda v: v[0] == "sh")),
+    ("environ == 'JOB=3'", lambda p: defined(p.environ, lambda v: "JOB=3" in v)),
+    ("descendant_of proc_id 12", lambda p: is_descendant(p, 12)),
+    ("descendant_of 2 and not exe ~ '^/usr'", lambda p: is_descendant(p, 2) and not defined(p.exe, lambda v: v.startswith("/usr"))),
+    ("pid >= 1100 and pid < 1200 or proc_id == 3", lambda p: 1100 <= p.pid < 1200 or p.proc_id == 3),
+    ("NOT (max_rss_kb <= 500 OR exe != '/bin/sh')", lambda p: not (defined(p.max_rss_kb, lambda v: v <= 500) or defined(p.exe, lambda v: v != "/bin/sh"))),
+    ("duration < 0.6 and ppid != 1000", lambda p: defined(duration(p), lambda v: v < 0.6) and defined(p.ppid, lambda v: v != 1000)),
+    (r"cmdline ~ 'file1\d\.c$'", lambda p: defined(p.cmdline, lambda v: re.search(r"file1\d\.c$", " ".join(v)))),
+    (r"cwd != 'it\'s' and cwd != '/src/lib\\' and cwd ~ '^/src/lib\b'", lambda p: defined(p.cwd, lambda v: re.search(r"^/src/lib\b", v))),
+    ("end_timestamp > 1600000100.2 and exe ~ 'l[ad]'", lambda p: defined(p.end_timestamp, lambda v: v > 1600000100.2) and defined(p.exe, lambda v: re.search("l[ad]", v))),
+]  # fmt: skip
+
+INVALID = [
+    "",
+    "foo > 1",
+    "cpu_time ~ 'x'",
+    "cpu_time > 'x'",
+    "exe > 'x'",
+    "exe == clang",
+    "exe ~ '('",
+    "(cpu_time > 1",
+    "cpu_time > 1 and",
+    "cpu_time > 1 cpu_time < 2",
+    "descendant_of x",
+    "exe == 'x' $",
+]
+
+
+def main():
+    """
+    Run filter expression test, return 0 if all selections are correct.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "query.upt")
+        synthetic.write_trace(
+            filename, synthetic.events(count, begin=0.9, end=0.6, exes=EXES, cwds=CWDS)
+        )
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+    all_procs = processes.getAllProcesses()
+    for text, predicate in QUERIES:
+        query = pickle.loads(pickle.dumps(uproctrace.query.Query(text)))
+        expected = [proc_id for proc_id, proc in all_procs.items() if predicate(proc)]
+        actual = processes.select(query)
+        if actual != expected:
+            print(f"error: {text:s}: {actual} != {expected}", file=sys.stderr)
+            return 1
+        if not expected or len(expected) == len(all_procs):
+            print(f"error: {text:s}: trivial test", file=sys.stderr)
+            return 1
+        print(f"{text:s}: {len(actual):d} processes")
+    for text in INVALID:
+        try:
+            uproctrace.query.Query(text)
+        except uproctrace.query.QueryError:
+            continue
+        print(f"error: invalid filter expression {text:s} accepted", file=sys.stderr)
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
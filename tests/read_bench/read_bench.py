@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Benchmark of reading events from a trace file: byte-by-byte reading
+(as done by uproctrace.parse.read_event in the past) compared to
+uproctrace.parse.Reader.
+
+usage: read_bench.py [<event count> [<garbage interval>]]
+"""
+
+import itertools
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import uproctrace.parse
+import uproctrace.uproctrace_pb2 as pb2
+
+
+def legacy_read_event(proto_file):
+    """
+    Read the first event from proto_file byte by byte and return it.
+    Return None if no event could be found.
+    """
+    magic = proto_file.read(4)
+    while magic != b"upt0":
+        if len(magic) < 4:
+            return None  # EOF
+        magic = magic[1:] + proto_file.read(1)
+    size = proto_file.read(4)
+    if len(size) < 4:
+        return None  # EOF
+    size = struct.unpack("!L", size)[0]
+    data = proto_file.read(size)
+    if len(data) < size:
+        return None  # EOF
+    return pb2.event.FromString(data)
+
+
+def write_trace(proto_file, event_cnt: int, garbage_interval: int):
+    """
+    Write a synthetic trace with event_cnt events to proto_file.
+    Insert some garbage every garbage_interval events (0 for never).
+    """
+    for i in range(event_cnt):
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i // 1000
+        pb2_ev.timestamp.nsec = i % 1000 * 1000000
+        if i % 2 == 0:
+            pb2_ev.proc_begin.pid = 1000 + i // 2
+            pb2_ev.proc_begin.ppid = 999
+            pb2_ev.proc_begin.exe = "/usr/bin/cc"
+            pb2_ev.proc_begin.cmdline.s.extend(["cc", "-c", f"file{i:d}.c"])
+        else:
+            pb2_ev.proc_end.pid = 1000 + i // 2
+            pb2_ev.proc_end.ppid = 999
+            pb2_ev.proc_end.cpu_time.sec = 1
+            pb2_ev.proc_end.max_rss_kb = 4096
+        data = pb2_ev.SerializeToString()
+        proto_file.write(b"upt0" + struct.pack("!L", len(data)) + data)
+        if garbage_interval and i % garbage_interval == 0:
+            proto_file.write(b"garbage" * 100)
+
+
+def legacy_read_events(proto_file):
+    """
+    Read all events byte by byte.
+    """
+    pb2_ev = legacy_read_event(proto_file)
+    while pb2_ev is not None:
+        yield pb2_ev
+        pb2_ev = legacy_read_event(proto_file)
+
+
+def bench(name: str, filename: str, read_events) -> None:
+    """
+    Read all events from file using read_events and print events per second.
+    """
+    with open(filename, "rb") as proto_file:
+        start = time.perf_counter()
+        event_cnt = sum(1 for _ in read_events(proto_file))
+        duration = time.perf_counter() - start
+    rate = event_cnt / duration if duration > 0 else float("inf")
+    print(f"{name:s}: {event_cnt:d} events in {duration:.3f} s = {rate:.0f} events/s")
+
+
+def compare(filename: str) -> bool:
+    """
+    Check that both ways of reading yield the same events.
+    """
+    with open(filename, "rb") as legacy_file, open(filename, "rb") as proto_file:
+        legacy = legacy_read_events(legacy_file)
+        reader = uproctrace.parse.Reader(proto_file)
+        for legacy_ev, reader_ev in itertools.zip_longest(legacy, reader):
+            if legacy_ev != reader_ev:
+                return False
+    # single events: read_event leaves trace file behind event read
+    with open(filename, "rb") as legacy_file, open(filename, "rb") as proto_file:
+        for legacy_ev in itertools.islice(legacy_read_events(legacy_file), 1000):
+            if uproctrace.parse.read_event(proto_file) != legacy_ev:
+                return False
+    return True
+
+
+def main():
+    """
+    Run benchmark, return 0 if both ways of reading yield the same events.
+    """
+    event_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    garbage_interval = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "bench.upt")
+        with open(filename, "wb") as proto_file:
+            write_trace(proto_file, event_cnt, garbage_interval)
+        print(f"trace: {event_cnt:d} events, {os.path.getsize(filename):d} bytes")
+        bench("byte by byte", filename, legacy_read_events)
+        bench("Reader", filename, uproctrace.parse.read_events)
+        same = compare(filename)
+    if not same:
+        print("error: different events read", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
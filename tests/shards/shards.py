@@ -0,0 +1,129 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Sharded trace test: Build a synthetic trace with random processes (reusing
+pids), split it into one shard per pid like libuptpl does in sharded mode,
+merge the shards and compare the merged trace and the processes loaded from
+the directory of shards to the original trace.
+
+usage: shards.py [<number of processes>]
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+import uproctrace.columns
+import uproctrace.index
+import uproctrace.parse
+import uproctrace.processes
+import uproctrace.shards
+import uproctrace.uproctrace_pb2 as pb2
+
+import synthetic
+
+# compared attributes of processes
+ATTRS = ["pid", "ppid", "exe", "cmdline"] + list(uproctrace.columns.ATTRS)
+
+
+def events(count: int) -> list[pb2.event]:
+    """
+    Return events of a synthetic trace with count random processes,
+    timestamps are strictly increasing.
+    """
+    rnd = random.Random(42)
+    result = []
+    running: list[int] = []
+    free = list(range(100, 100 + max(count // 4, 2)))
+
+    def event() -> pb2.event:
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + len(result) // 3
+        pb2_ev.timestamp.nsec = len(result) % 3 * 100000000
+        result.append(pb2_ev)
+        return pb2_ev
+
+    for i in range(count):
+        if not free or (running and rnd.random() < 0.4):
+            pid = running.pop(rnd.randrange(len(running)))
+            pb2_ev = event()
+            pb2_ev.proc_end.pid = pid
+            pb2_ev.proc_end.cpu_time.sec = rnd.randrange(5)
+            pb2_ev.proc_end.max_rss_kb = rnd.randrange(1000000)
+            free.append(pid)
+        pid = free.pop(rnd.randrange(len(free)))
+        pb2_ev = event()
+        pb2_ev.proc_begin.pid = pid
+        if running:
+            pb2_ev.proc_begin.ppid = rnd.choice(running)
+        pb2_ev.proc_begin.exe = "/bin/sh"
+        pb2_ev.proc_begin.cmdline.s.extend(["sh", f"{i:d}.sh"])
+        running.append(pid)
+    return result
+
+
+def pid_of(pb2_ev: pb2.event) -> int:
+    """
+    Return pid of process that writes the event.
+    """
+    if pb2_ev.HasField("proc_begin"):
+        return pb2_ev.proc_begin.pid
+    return pb2_ev.proc_end.pid
+
+
+def write_shards(shard_dir: str, trace: list[pb2.event]):
+    """
+    Write events to one shard per pid (appending if the pid is reused).
+    """
+    for pb2_ev in trace:
+        filename = os.path.join(shard_dir, f"{pid_of(pb2_ev):d}.upt")
+        with open(filename, "ab") as proto_file:
+            proto_file.write(uproctrace.parse.frame(pb2_ev.SerializeToString()))
+    with open(os.path.join(shard_dir, "README"), "w", encoding="utf-8") as file:
+        file.write("not a shard\n")
+
+
+def main():
+    """
+    Run sharded trace test, return 0 if merging is correct.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    trace = events(count)
+    data = synthetic.serialize(trace)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "trace.upt")
+        with open(filename, "wb") as proto_file:
+            proto_file.write(data)
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+        shard_dir = os.path.join(tmp_dir, "trace")
+        os.mkdir(shard_dir)
+        write_shards(shard_dir, trace)
+        shards = len(uproctrace.shards.shard_files(shard_dir))
+        merged = uproctrace.shards.merged_filename(shard_dir + "/")
+        error = None
+        if uproctrace.shards.merge(shard_dir, merged) != len(trace):
+            error = "wrong number of merged events"
+        with open(merged, "rb") as proto_file:
+            if error is None and proto_file.read() != data:
+                error = "merged trace differs"
+        error = error or synthetic.compare(
+            processes, uproctrace.index.load_processes(shard_dir, False), ATTRS
+        )
+        if error is None and uproctrace.index.load_process(shard_dir, 0).pid != (
+            processes.getProcess(0).pid
+        ):
+            error = "process 0 differs"
+    if error is not None:
+        print(f"error: {error:s}", file=sys.stderr)
+        return 1
+    print(f"{len(processes.getAllProcesses()):d} processes, {shards:d} shards: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
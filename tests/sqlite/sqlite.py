@@ -0,0 +1,191 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+SQLite database test: Build a synthetic trace with random processes (some
+without begin or end event, some re-parented), write it to a database and
+compare the processes loaded from the database and the results of SQL
+queries to the processes of the trace. Check that upt-tool reports foreign
+databases as errors.
+
+usage: sqlite.py [<number of processes>]
+"""
+
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+
+import uproctrace.columns
+import uproctrace.index
+import uproctrace.processes
+import uproctrace.sqlite
+import uproctrace.tool
+import uproctrace.uproctrace_pb2 as pb2
+
+import synthetic
+
+# compared attributes of processes
+ATTRS = ["pid", "ppid", "exe", "cwd", "cmdline", "environ"] + list(
+    uproctrace.columns.ATTRS
+)
+
+
+def events(count: int) -> list[pb2.event]:
+    """
+    Return events of a synthetic trace with count random processes (some
+    without begin or end event or fields, some with empty command line or
+    environment, some re-parented at their end).
+    """
+    rnd = random.Random(42)
+    trace = synthetic.events(count, begin=0.9, end=0.6, fields=0.9)
+    synthetic.adjust_cmdlines(trace, lambda i, args: [args[0], "", args[1]][: i % 4])
+    for pb2_ev in trace:
+        if pb2_ev.HasField("proc_begin"):
+            i = pb2_ev.proc_begin.pid - 1000
+            if i % 10 == 0:
+                pb2_ev.timestamp.ClearField("nsec")
+            if pb2_ev.proc_begin.HasField("environ"):
+                del pb2_ev.proc_begin.environ.s[i % 3 :]
+        elif pb2_ev.proc_end.pid > 1000 and rnd.random() < 0.1:
+            pb2_ev.proc_end.ppid = rnd.randrange(1000, pb2_ev.proc_end.pid)
+    return trace
+
+
+def compare(proc, other) -> str | None:
+    """
+    Compare two processes and their parents and children (proc_ids).
+    Return error message or None.
+    """
+    error = synthetic.compare_process(proc, other, ATTRS)
+    if error is not None:
+        return error
+    begins = [p.getBegin() for p in (proc, other)]
+    timespecs = [None if begin is None else begin.timespec for begin in begins]
+    if timespecs[0] != timespecs[1]:
+        return f"proc_id {proc.proc_id:d}: begin time differs"
+    parents = [None if p.parent is None else p.parent.proc_id for p in (proc, other)]
+    if parents[0] != parents[1]:
+        return f"proc_id {proc.proc_id:d}: parent differs"
+    return None
+
+
+def check_sql(filename: str, processes) -> str | None:
+    """
+    Check results of ad-hoc SQL queries on database.
+    Return error message or None.
+    """
+    all_procs = processes.getAllProcesses().values()
+    with contextlib.closing(sqlite3.connect(filename)) as conn:
+        args = conn.execute("SELECT COUNT(*) FROM cmdline WHERE arg = ''").fetchone()
+        children = conn.execute(
+            "SELECT parent, COUNT(*) FROM processes WHERE parent IS NOT NULL"
+            " GROUP BY parent"
+        ).fetchall()
+        slow = conn.execute(
+            "SELECT COUNT(*) FROM processes WHERE exe = '/usr/bin/cc'"
+            " AND cpu_time > 2"
+        ).fetchone()
+    expected = sum((p.cmdline or []).count("") for p in all_procs)
+    if args[0] != expected:
+        return f"{args[0]:d} empty arguments != {expected:d}"
+    expected = {p.proc_id: len(p.children) for p in all_procs if p.children}
+    if dict(children) != expected:
+        return "numbers of children differ"
+    expected = sum(
+        1 for p in all_procs if p.exe == "/usr/bin/cc" and (p.cpu_time or 0) > 2
+    )
+    if slow[0] != expected or not expected:
+        return f"{slow[0]:d} slow processes != {expected:d}"
+    return None
+
+
+def check(filename: str, processes) -> str | None:
+    """
+    Write database of processes, load it and compare.
+    Return error message or None.
+    """
+    db_filename = uproctrace.sqlite.database_filename(filename)
+    rows = uproctrace.sqlite.write_database(db_filename, processes, filename)
+    all_procs = processes.getAllProcesses()
+    if rows != len(all_procs) or not uproctrace.sqlite.is_database(db_filename):
+        return "database not written"
+    loaded = uproctrace.index.load_processes(db_filename)
+    loaded_procs = loaded.getAllProcesses()
+    if len(loaded_procs) != len(all_procs):
+        return f"{len(loaded_procs):d} processes loaded != {len(all_procs):d}"
+    for proc_id, proc in all_procs.items():
+        error = compare(proc, loaded_procs[proc_id])
+        if proc.inclusive != loaded_procs[proc_id].inclusive:
+            error = f"proc_id {proc_id:d}: inclusive metrics differ"
+        error = error or compare(
+            proc, uproctrace.sqlite.load_process(db_filename, proc_id)
+        )
+        if error is not None:
+            return error
+    for attr in ("toplevel", "current"):
+        if [p.proc_id for p in getattr(processes, attr)] != [
+            p.proc_id for p in getattr(loaded, attr)
+        ]:
+            return f"{attr:s} processes differ"
+    columns = uproctrace.sqlite.load_columns(db_filename)
+    for attr in uproctrace.columns.ATTRS:
+        if list(columns.values(attr)) != list(processes.columns.values(attr)):
+            return f"column {attr:s} differs"
+    return check_sql(db_filename, processes)
+
+
+def check_foreign(tmp_dir: str) -> str | None:
+    """
+    Check that upt-tool reports an error for a foreign database.
+    Return error message or None.
+    """
+    filename = os.path.join(tmp_dir, "foreign.db")
+    with contextlib.closing(sqlite3.connect(filename)) as conn:
+        conn.execute("CREATE TABLE foo (bar INTEGER)")
+    sys.argv = ["upt-tool", filename, "stats"]
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            uproctrace.tool.main()
+    except SystemExit as exc:
+        if exc.code == 1 and stderr.getvalue().startswith("error: "):
+            return None
+    return "foreign database not reported as error"
+
+
+def main():
+    """
+    Run SQLite database test, return 0 if the database is correct.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    uproctrace.sqlite.BATCH_SIZE = 37
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "sqlite.upt")
+        synthetic.write_trace(filename, events(count))
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+        error = check(filename, processes)
+        if error is None and uproctrace.sqlite.load_process(filename + ".db", -1):
+            error = "process -1 found"
+        if error is None:
+            try:
+                uproctrace.sqlite.load_processes(filename)
+                error = "trace file accepted as database"
+            except uproctrace.sqlite.DatabaseError:
+                pass
+        error = error or check_foreign(tmp_dir)
+    if error is not None:
+        print(f"error: {error:s}", file=sys.stderr)
+        return 1
+    print(f"{len(processes.getAllProcesses()):d} processes: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
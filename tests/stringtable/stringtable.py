@@ -0,0 +1,169 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Interned trace test: Build a synthetic trace of compiler invocations with
+repeating executables, working directories and arguments, intern it and
+compare the processes loaded from the interned trace in all ways (serial,
+parallel, index, single process, follow) to the ones of the original trace.
+
+usage: stringtable.py [<number of processes>]
+"""
+
+import io
+import os
+import random
+import sys
+import tempfile
+
+import uproctrace.dump
+import uproctrace.index
+import uproctrace.parse
+import uproctrace.processes
+import uproctrace.query
+import uproctrace.stringtable
+import uproctrace.uproctrace_pb2 as pb2
+
+import synthetic
+
+
+def invocations(count: int) -> list[pb2.event]:
+    """
+    Return events of a synthetic trace with count random compiler
+    invocations (some without begin event, exe, cwd or cmdline) with
+    repeating arguments.
+    """
+    rnd = random.Random(42)
+    flags = ["-O2", "-g", "", "-Iü"] + [
+        f"-I/usr/src/project/lib{i:d}/include" for i in range(9)
+    ]
+    trace = synthetic.events(
+        count, begin=0.95, fields=0.9, exes=["/usr/bin/cc", "/bin/sh"]
+    )
+
+    def add_flags(_: int, args: list[str]) -> list[str]:
+        return args[:1] + rnd.sample(flags, rnd.randrange(4, len(flags))) + args[1:]
+
+    synthetic.adjust_cmdlines(trace, add_flags)
+    return trace
+
+
+def check_interned(filename: str, interned: str, processes) -> str | None:
+    """
+    Check processes of interned trace, return error message or None.
+    """
+    all_procs = processes.getAllProcesses()
+    error = synthetic.compare(
+        processes, uproctrace.index.load_processes(interned, False)
+    )
+    error = error or synthetic.compare(
+        processes, uproctrace.index.load_processes(interned)
+    )
+    error = error or synthetic.compare(
+        processes, uproctrace.index.load_processes(interned)
+    )
+    error = error or synthetic.compare(
+        processes, uproctrace.index.load_processes(interned, False, 3)
+    )
+    for proc_id in range(0, len(all_procs), 11):
+        proc = uproctrace.index.load_process(interned, proc_id)
+        error = error or synthetic.compare_process(all_procs[proc_id], proc)
+        for child in proc.children:
+            error = error or synthetic.compare_process(all_procs[child.proc_id], child)
+    if error is None and os.path.getsize(interned) * 2 > os.path.getsize(filename):
+        error = "interned trace not smaller"
+    return error
+
+
+def check_shared(interned: str) -> str | None:
+    """
+    Check that equal strings of different processes are the same object.
+    Return error message or None.
+    """
+    processes = uproctrace.index.load_processes(interned, False)
+    seen: dict[str, str] = {}
+    for proc in processes.getAllProcesses().values():
+        for string in [proc.exe, proc.cwd] + (proc.cmdline or []):
+            if string is not None and seen.setdefault(string, string) is not string:
+                return f"string {string!r} not shared"
+    return None
+
+
+def check_dump(interned: str) -> str | None:
+    """
+    Check that dumping selected events of an interned trace also dumps the
+    string tables they refer to, return error message or None.
+    """
+    processes = uproctrace.index.load_processes(interned)
+    pid = processes.getProcess(len(processes.getAllProcesses()) - 1).pid
+    out = io.StringIO()
+    with open(interned, "rb") as proto_file:
+        uproctrace.dump.dump_selected_events(
+            proto_file, processes, out, where=uproctrace.query.Query(f"pid == {pid}")
+        )
+    dumped = out.getvalue()
+    if f"pid: {pid:d}" not in dumped or "string_table {" not in dumped:
+        return "string tables of selected events not dumped"
+    if 's: "/usr/bin/cc"' not in dumped:
+        return "strings of selected events not dumped"
+    return None
+
+
+def check_update(interned: str, processes) -> str | None:
+    """
+    Check reading an interned trace while it grows (string tables and events
+    split between updates), return error message or None.
+    """
+    with open(interned, "rb") as proto_file:
+        data = proto_file.read()
+    with tempfile.TemporaryFile() as proto_file:
+        proto_file.write(data[: len(data) // 3])
+        proto_file.flush()
+        proto_file.seek(0)
+        followed = uproctrace.processes.Processes(proto_file)
+        proto_file.seek(0, os.SEEK_END)  # reading leaves file behind last event
+        proto_file.write(data[len(data) // 3 :])
+        proto_file.flush()
+        followed.update(proto_file)
+    return synthetic.compare(processes, followed)
+
+
+def main():
+    """
+    Run interned trace test, return 0 if interned traces are read correctly.
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    uproctrace.processes.Processes.MIN_SPAN_SIZE = 4096
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "trace.upt")
+        with open(filename, "wb") as proto_file:
+            proto_file.write(synthetic.serialize(invocations(count)))
+        with open(filename, "rb") as proto_file:
+            processes = uproctrace.processes.Processes(proto_file)
+        interned = uproctrace.stringtable.interned_filename(filename)
+        with open(filename, "rb") as proto_file:
+            events, strings = uproctrace.stringtable.intern_trace(proto_file, interned)
+        print(f"{events:d} events, {strings:d} strings")
+        error = check_interned(filename, interned, processes)
+        error = error or check_shared(interned)
+        error = error or check_dump(interned)
+        error = error or check_update(interned, processes)
+        if error is None:
+            # interning an interned trace yields the same trace
+            twice = os.path.join(tmp_dir, "twice.upt")
+            with open(interned, "rb") as proto_file:
+                uproctrace.stringtable.intern_trace(proto_file, twice)
+            with open(interned, "rb") as file1, open(twice, "rb") as file2:
+                if file1.read() != file2.read():
+                    error = "interning interned trace changed it"
+    if error is not None:
+        print(f"error: {error:s}", file=sys.stderr)
+        return 1
+    print(f"{len(processes.getAllProcesses()):d} processes: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Time index test: Query time indices of random process lifetimes (including
+missing timestamps) and compare the results to a full scan.
+
+usage: timeindex.py [<max. process count>]
+"""
+
+import math
+import random
+import sys
+
+import uproctrace.timeindex
+
+
+def random_lifetimes(rnd: random.Random, count: int) -> tuple[list, list]:
+    """
+    Return begin and end timestamps of count random processes
+    (see timeindex.TimeIndex).
+    """
+    begins = []
+    ends = []
+    for _ in range(count):
+        begin = rnd.uniform(0.0, 100.0) if rnd.random() > 0.05 else -math.inf
+        # mostly short processes, some long ones (e.g. make), some running
+        duration = rnd.expovariate(1.0) if rnd.random() > 0.1 else 200.0
+        end = begin + duration if rnd.random() > 0.05 else math.inf
+        if begin == -math.inf and end == math.inf:
+            begin = math.inf  # no timestamps at all
+        begins.append(begin)
+        ends.append(end)
+    return begins, ends
+
+
+def check_queries(rnd: random.Random, begins: list, ends: list) -> bool:
+    """
+    Check random queries of time index, return True if all are correct.
+    """
+    time_index = uproctrace.timeindex.TimeIndex(begins, ends)
+    procs = list(zip(range(len(begins)), begins, ends))
+    for _ in range(20):
+        t_begin = rnd.uniform(-10.0, 110.0)
+        t_end = t_begin + rnd.expovariate(2.0)
+        results = {
+            "overlapping": (
+                time_index.overlapping(t_begin, t_end),
+                [i for i, b, e in procs if b < t_end and e > t_begin],
+            ),
+            "alive": (
+                time_index.alive(t_begin),
+                [i for i, b, e in procs if b <= t_begin < e],
+            ),
+            "began": (
+                time_index.began(t_begin, t_end),
+                [i for i, b, _e in procs if t_begin <= b < t_end],
+            ),
+            "ended": (
+                time_index.ended(t_begin, t_end),
+                [i for i, _b, e in procs if t_begin <= e < t_end],
+            ),
+        }
+        for query, (actual, expected) in results.items():
+            if sorted(actual) != expected:
+                print(
+                    f"error: {len(procs):d} processes: {query:s}"
+                    f" [{t_begin:f}, {t_end:f}): {len(actual):d} results,"
+                    f" expected {len(expected):d}",
+                    file=sys.stderr,
+                )
+                return False
+    return True
+
+
+def check_parse_time() -> bool:
+    """
+    Check parsing of points in time, return True if correct.
+    """
+    parse_time = uproctrace.timeindex.parse_time
+    ok = parse_time("+12.5") == (12.5, True)
+    ok = ok and parse_time("1600000000.25") == (1600000000.25, False)
+    local = parse_time("2020-09-13 14:26:40.5")
+    ok = ok and not local[1] and local[0] % 1 == 0.5
+    if not ok:
+        print("error: parse_time", file=sys.stderr)
+    return ok
+
+
+def main():
+    """
+    Run time index test, return 0 if all queries are correct.
+    """
+    max_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rnd = random.Random(42)
+    counts = list(range(70)) + [max_count - 1, max_count, max_count + 1]
+    counts += [rnd.randrange(70, max_count) for _ in range(100)]
+    for count in counts:
+        begins, ends = random_lifetimes(rnd, count)
+        if not check_queries(rnd, begins, ends):
+            return 1
+    if not check_parse_time():
+        return 1
+    print(f"{len(counts):d} time indices: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
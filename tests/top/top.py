@@ -0,0 +1,143 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Top test: Aggregate a small synthetic trace with known groups (two
+executables with the same base name) and check the aggregated values, the
+ranking and the output of single and multiple traces.
+
+usage: top.py
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import uproctrace.parse
+import uproctrace.top
+import uproctrace.uproctrace_pb2 as pb2
+
+# synthetic processes: (pid, exe, argv0, begin, end (None: no end event),
+# CPU time, max RSS in KiB)
+PROCESSES = [
+    (1000, "/bin/sh", "sh", 0, 10, 1, 100),
+    (1001, "/usr/bin/cc", "cc", 1, 3, 2, 300),
+    (1002, "/usr/bin/cc", "cc", 2, 5, 3, 200),
+    (1003, "/opt/x/bin/cc", "cc", 3, 9, 5, 400),
+    (1004, "/usr/bin/ld", "ld", 6, None, 0, 0),
+]
+
+
+def write_trace(filename: str):
+    """
+    Write synthetic trace to file.
+    """
+    events = []
+    for pid, exe, argv0, begin, end, cpu_time, max_rss_kb in PROCESSES:
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + begin
+        pb2_ev.proc_begin.pid = pid
+        pb2_ev.proc_begin.ppid = 1000 if pid != 1000 else 999
+        pb2_ev.proc_begin.exe = exe
+        pb2_ev.proc_begin.cmdline.s.append(argv0)
+        events.append((begin, pb2_ev))
+        if end is not None:
+            pb2_ev = pb2.event()
+            pb2_ev.timestamp.sec = 1600000000 + end
+            pb2_ev.proc_end.pid = pid
+            pb2_ev.proc_end.cpu_time.sec = cpu_time
+            pb2_ev.proc_end.max_rss_kb = max_rss_kb
+            events.append((end, pb2_ev))
+    with open(filename, "wb") as proto_file:
+        for _timestamp, pb2_ev in sorted(events, key=lambda ev: ev[0]):
+            proto_file.write(uproctrace.parse.frame(pb2_ev.SerializeToString()))
+
+
+def run_top(traces: list[str], **kwargs) -> str:
+    """
+    Run top command on traces, return output.
+    """
+    options = {
+        "group_by": "exe",
+        "sort": "cpu_time",
+        "limit": 20,
+        "format": "table",
+        "jobs": 1,
+    }
+    options.update(kwargs)
+    args = argparse.Namespace(trace=traces, no_index=True, **options)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        uproctrace.top.top(args)
+    return out.getvalue()
+
+
+def check(what: str, actual, expected) -> bool:
+    """
+    Compare actual to expected result, return True if equal.
+    """
+    if actual != expected:
+        print(f"error: {what:s}: {actual} != {expected}", file=sys.stderr)
+        return False
+    return True
+
+
+def table_names(output: str) -> list[str]:
+    """
+    Return names of groups in first column of table output.
+    """
+    return [line.split()[0] for line in output.splitlines()[2:]]
+
+
+def main():
+    """
+    Run top test, return 0 if results are correct.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "top.upt")
+        write_trace(filename)
+        groups = uproctrace.top.aggregate(filename, "exe", False)
+        argv0 = uproctrace.top.aggregate(filename, "argv0", False)
+        table = run_top([filename])
+        rss = run_top([filename], sort="max_rss_kb", limit=2)
+        both = json.loads(run_top([filename, filename], format="json", jobs=2))
+    cpu_idx = uproctrace.top.VALUES.index("cpu_time")
+    rss_idx = uproctrace.top.VALUES.index("max_rss_kb")
+    ok = all(
+        [
+            check(
+                "groups by exe",
+                {key: (values[0], values[cpu_idx]) for key, values in groups.items()},
+                {"/bin/sh": (1, 1), "/usr/bin/cc": (2, 5), "/opt/x/bin/cc": (1, 5)},
+            ),
+            check("wall time", groups["/usr/bin/cc"][1], 5),
+            check("maximum RSS", groups["/usr/bin/cc"][rss_idx], 300),
+            check(
+                "groups by argv0",
+                {key: values[0] for key, values in argv0.items()},
+                {"sh": 1, "cc": 3},
+            ),
+            # same base name cc: full paths, unique base name sh: short
+            check("table", table_names(table), ["/opt/x/bin/cc", "/usr/bin/cc", "sh"]),
+            check("sort and limit", table_names(rss), ["/opt/x/bin/cc", "/usr/bin/cc"]),
+            check(
+                "two traces",
+                {row[0]: row[1] for row in both["rows"]},
+                {"/opt/x/bin/cc": "2", "/usr/bin/cc": "4", "/bin/sh": "2"},
+            ),
+        ]
+    )
+    if not ok:
+        return 1
+    print("top groups: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -27,3 +27,13 @@ grep '^ *s: "libuptpl.so"$' out.dump
 
 upt-tool trace.upt pstree
 upt-tool trace.upt stats
+upt-tool trace.upt top --group-by argv0 --format csv | tee out.top
+grep '^"mkdir";' out.top
+
+upt-tool --no-index trace.upt pstree --pids --details | tee out.pstree
+upt-tool --no-index trace.upt stats | tee out.stats
+upt-tool trace.upt index
+upt-tool trace.upt pstree --pids --details >out.pstree_index
+diff -u out.pstree out.pstree_index
+upt-tool trace.upt stats >out.stats_index
+diff -u out.stats out.stats_index
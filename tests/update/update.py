@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+
+# UProcTrace: User-space Process Tracing
+# Copyright 2020: Stefan Schuermans, Aachen, Germany <stefan@schuermans.info>
+# Copyleft: GNU LESSER GENERAL PUBLIC LICENSE version 3 (see LICENSE)
+"""
+Update test: Append events to a synthetic trace in pieces, ingest them with
+Processes.update() and check that the returned set contains all processes
+that have been created or changed (and only parents in addition).
+
+usage: update.py [<process count>]
+"""
+
+import os
+import random
+import struct
+import sys
+import tempfile
+
+import uproctrace.processes
+import uproctrace.uproctrace_pb2 as pb2
+
+
+def frames(proc_cnt: int) -> list[bytes]:
+    """
+    Return framed serialized events of a synthetic trace with a random process
+    tree of proc_cnt processes (some of them re-parented at their end).
+    """
+    rnd = random.Random(42)
+    alive = [1000]
+    result = []
+    for i in range(proc_cnt):
+        pb2_ev = pb2.event()
+        pb2_ev.timestamp.sec = 1600000000 + i
+        pb2_ev.proc_begin.pid = 1001 + i
+        pb2_ev.proc_begin.ppid = rnd.choice(alive)
+        pb2_ev.proc_begin.cmdline.s.extend(["sh", "-c", f"job {i:d}"])
+        result.append(pb2_ev)
+        alive.append(1001 + i)
+        if len(alive) > 20 or rnd.random() < 0.3:
+            pb2_ev = pb2.event()
+            pb2_ev.timestamp.sec = 1600000000 + i
+            pb2_ev.proc_end.pid = alive.pop(rnd.randrange(1, len(alive)))
+            if rnd.random() < 0.3:
+                pb2_ev.proc_end.ppid = rnd.choice(alive)
+            pb2_ev.proc_end.cpu_time.sec = i
+            result.append(pb2_ev)
+    return [
+        b"upt0" + struct.pack("!L", len(data)) + data
+        for data in (pb2_ev.SerializeToString() for pb2_ev in result)
+    ]
+
+
+def describe(processes) -> dict:
+    """
+    Return comparable description of processes: proc_id -> description.
+    """
+    return {
+        proc_id: (
+            proc.pid,
+            proc.ppid,
+            proc.cmdline,
+            proc.end_timestamp,
+            proc.cpu_time,
+            None if proc.parent is None else proc.parent.proc_id,
+            [child.proc_id for child in proc.children],
+        )
+        for proc_id, proc in processes.getAllProcesses().items()
+    }
+
+
+def main():
+    """
+    Run update test, return 0 if updates are correct.
+    """
+    proc_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    data = b"".join(frames(proc_cnt))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "update.upt")
+        with open(filename, "wb") as proto_file, open(filename, "rb") as read_file:
+            processes = uproctrace.processes.Processes(read_file)
+            before = describe(processes)
+            pos = 0
+            while pos < len(data):
+                # append a piece ending in the middle of an event
+                size = len(data) // 20 + 1
+                proto_file.write(data[pos : pos + size])
+                proto_file.flush()
+                pos += size
+                changed = {proc.proc_id for proc in processes.update(read_file)}
+                after = describe(processes)
+                expected = {
+                    proc_id
+                    for proc_id, desc in after.items()
+                    if before.get(proc_id) != desc
+                }
+                if not expected <= changed or any(
+                    not after[proc_id][-1] for proc_id in changed - expected
+                ):
+                    print(
+                        f"error: offset {pos:d}: changed {len(changed):d}"
+                        f" processes, expected {len(expected):d}",
+                        file=sys.stderr,
+                    )
+                    return 1
+                if processes.update(read_file):
+                    print("error: update without new events", file=sys.stderr)
+                    return 1
+                before = after
+        with open(filename, "rb") as read_file:
+            if describe(uproctrace.processes.Processes(read_file)) != before:
+                print("error: updated processes differ from trace", file=sys.stderr)
+                return 1
+    print(f"{len(before):d} processes: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
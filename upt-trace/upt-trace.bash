@@ -2,7 +2,12 @@
 
 if (( $# < 2 ))
 then
-  echo "usage: $0 <trace.upt> <command> [<arg> [...]]" >&2
+  echo "usage: $0 <trace.upt | trace directory/> <command> [<arg> [...]]" >&2
+  echo "  a trace directory (existing or with trailing /) selects sharded" >&2
+  echo "  mode: one file per process, combine with: upt-tool <dir> merge" >&2
+  echo "  environment capture policy: UPTPL_ENVIRON=full|none|allow|hash" >&2
+  echo "  (allow: only variables in UPTPL_ENVIRON_ALLOW=NAME:PREFIX*:...," >&2
+  echo "  hash: store each distinct environment only once per trace)" >&2
   exit 2
 fi
 TRACE_FILE="$1"
@@ -10,8 +15,27 @@ shift
 
 UPT_HOME="$(readlink -f "$(dirname "$(dirname "$0")")")"
 
-touch "$TRACE_FILE"
-export UPTPL_OUTPUT="$(readlink -f "$TRACE_FILE")"
+if [[ -d "$TRACE_FILE" || "$TRACE_FILE" == */ ]]
+then
+  mkdir -p "$TRACE_FILE"
+  unset UPTPL_OUTPUT
+  export UPTPL_OUTPUT_DIR="$(readlink -f "$TRACE_FILE")"
+else
+  touch "$TRACE_FILE"
+  unset UPTPL_OUTPUT_DIR
+  export UPTPL_OUTPUT="$(readlink -f "$TRACE_FILE")"
+fi
+
+# hash policy: marker files of stored environments, removed after tracing
+if [[ "$UPTPL_ENVIRON" == hash && -z "$UPTPL_ENVIRON_DIR" ]]
+then
+  export UPTPL_ENVIRON_DIR="$(mktemp -d -t upt-environ.XXXXXXXXXX)"
+  LD_PRELOAD="$UPT_HOME/lib/uproctrace/libuptpl.so" "$@"
+  RET=$?
+  rm -rf "$UPTPL_ENVIRON_DIR"
+  exit $RET
+fi
+
 export LD_PRELOAD="$UPT_HOME/lib/uproctrace/libuptpl.so"
 
 exec "$@"